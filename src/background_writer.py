@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 09:12:40 2026
+
+Aim of this script:
+===================
+Writing outputs in the background while the next results are prepared.
+
+In the MFD interpolation, writing the results of an hour (reprojection and Shapefile serialization)
+takes longer than preparing them. With BackgroundWriter the write tasks are handed to one worker
+(a thread, or a process for tasks that hold the GIL) behind a bounded queue: the main loop continues
+with the next hour while the previous one is written, and waits only if <max_pending> writes are
+already queued. The tasks are run one at a time in the order they were submitted, so tasks that
+update the same file (e.g. the cube store) do not conflict.
+
+A failed write (or a failed on_done callback of a write, e.g. recording a checkpoint) stops the main
+loop at the next submit. At the end, close() waits for all writes, checks that the expected output
+files exist and raises an error listing every failed write.
+
+Usage:
+    with BackgroundWriter(max_pending=2) as writer:
+        for hour in hours:
+            ...
+            writer.submit(saveToShape, df, grid, out, ..., outputs=[out])
+
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class WriteError(RuntimeError):
+    """ One or more background writes failed """
+
+
+class DoneTask(object):
+    """ Finished task that was run without a worker """
+
+    def done(self):
+        return True
+
+    def exception(self):
+        return None
+
+    def cancel(self):
+        return False
+
+
+class BackgroundWriter(object):
+    """
+    Run write tasks in one background worker ('thread' or 'process') with at most <max_pending> queued
+    tasks. With mode None the tasks are run immediately in submit().
+    """
+
+    def __init__(self, max_pending=2, mode='thread'):
+        if mode is None:
+            self.executor = None
+        elif mode == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        elif mode == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=1)
+        else:
+            raise ValueError("Unknown mode '%s', use 'thread' or 'process'." % mode)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.tasks = []
+        # Errors of on_done callbacks (done callbacks of futures would only log them)
+        self.callback_errors = []
+
+    def submit(self, func, *args, outputs=(), on_done=None, **kwargs):
+        """
+        Queue func(*args, **kwargs); <outputs> are the files that the task should create and
+        on_done(result) is called when the task has succeeded (e.g. to record a checkpoint).
+        Blocks while <max_pending> tasks are queued, raises WriteError if an earlier task failed.
+        """
+        self.raiseFailed(done_only=True)
+        if self.executor is None:
+            result = func(*args, **kwargs)
+            if on_done is not None:
+                on_done(result)
+            self.tasks.append((DoneTask(), getattr(func, '__name__', repr(func)), list(outputs)))
+            return None
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(func, *args, **kwargs)
+        except Exception:
+            self.slots.release()
+            raise
+        if on_done is not None:
+            future.add_done_callback(lambda f: self.runCallback(on_done, f, getattr(func, '__name__', repr(func))))
+        future.add_done_callback(lambda f: self.slots.release())
+        self.tasks.append((future, getattr(func, '__name__', repr(func)), list(outputs)))
+        return future
+
+    def runCallback(self, on_done, future, name):
+        """ Call on_done(result) of a succeeded task, an error is raised at the next submit or at close """
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            on_done(future.result())
+        except Exception as e:
+            self.callback_errors.append((name, e))
+
+    def failures(self, done_only=False):
+        """ (task name, error) of the failed tasks and callbacks """
+        failed = list(self.callback_errors)
+        for future, name, outputs in self.tasks:
+            if done_only and not future.done():
+                continue
+            error = future.exception()
+            if error is not None:
+                failed.append((name, error))
+            elif future.done():
+                missing = [fp for fp in outputs if not os.path.exists(fp)]
+                if missing:
+                    failed.append((name, FileNotFoundError("Output not written: %s" % ', '.join(missing))))
+        return failed
+
+    def raiseFailed(self, done_only=False):
+        failed = self.failures(done_only=done_only)
+        if failed:
+            raise WriteError("%s background write(s) failed:\n%s" % (
+                len(failed), '\n'.join("  %s: %r" % (name, error) for name, error in failed)))
+
+    def close(self):
+        """ Wait for all queued writes and check their outputs """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.raiseFailed()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not hide the original error, but do not leave writes running
+            for future, name, outputs in self.tasks:
+                future.cancel()
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+        return False
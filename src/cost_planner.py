@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 09:31:04 2026
+
+Aim of this script:
+===================
+Dry-run planning of the MFD pipeline: estimate the runtime and peak memory of each stage before a
+job is submitted, and recommend worker counts and chunk sizes that fit into the available memory.
+
+Only the metadata of the inputs is inspected: row counts from the file headers (.dbf, Parquet,
+GeoPackage) or estimated from the file size (.csv), the columns of the mobile phone data, the
+number of SITEIDs and YKR cells of the disaggregated physical surface layer (DPS, only these two
+columns are read) and the time steps, weights and scenarios requested in the stage parameters.
+
+From the metadata each stage gets a measure of its work, e.g. for the interpolation
+subunits x weights x time steps. The runtime and memory per unit of work are calibrated from the
+benchmarks that pipeline_dag.py records for every stage it runs (median of the recorded ratios).
+Stages without recorded benchmarks use rough default rates, which are marked in the plan.
+
+Structure:
+===================
+1) reading input metadata
+2) work measures of the stages
+3) recording and calibrating benchmarks
+4) planning the pipeline and recommending worker counts and chunk sizes
+
+State folder (see pipeline_dag.py):
+    benchmarks.jsonl    one recorded run per line (stage, work measures, seconds, peak memory)
+
+"""
+import os
+import json
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+# Memory of a stage process without data (Python, numpy, pandas, geopandas) in MB
+BASE_MB = 300.0
+
+# Default rates before benchmarks are recorded: seconds per unit of work and memory (MB) per MB of work
+DEFAULT_RATES = {'interpolation': (2e-8, 1.5),
+                 'default': (1e-7, 4.0)}
+
+# Share of the memory budget that a chunk of the streaming CDR aggregation may use
+CHUNK_MEMORY_SHARE = 0.25
+
+
+#------------------------------------------------------------
+'''1. INPUT METADATA '''
+#------------------------------------------------------------
+
+def fileBytes(fp):
+    """ Size of a file, a shapefile (all parts) or a folder (all files) in bytes, 0 if missing """
+    from pipeline_dag import matchFiles
+    return sum(os.path.getsize(path) for path in matchFiles(fp)) if fp else 0
+
+
+def tableRows(fp, sample_lines=1000):
+    """ Number of rows of a table from its metadata, estimated from the file size for .csv-files """
+    ext = os.path.splitext(fp)[1].lower()
+    if ext in ('.shp', '.dbf'):
+        from dps_loader import readDbfHeader
+        return readDbfHeader(os.path.splitext(fp)[0] + '.dbf')[0]
+    if ext == '.parquet' or os.path.isdir(fp):
+        import pyarrow.dataset as ds
+        return ds.dataset(fp, format='parquet').count_rows()
+    if ext == '.csv':
+        with open(fp, 'rb') as f:
+            header = len(f.readline())
+            sample = [len(line) for _, line in zip(range(sample_lines), f)]
+        return int(round((os.path.getsize(fp) - header) / float(np.mean(sample)))) if sample else 0
+    import pyogrio
+    return pyogrio.read_info(fp)['features']
+
+
+def dpsMetadata(dps_fp, sz_id_col='SITEID', tz_id_col='YKR_ID'):
+    """ Rows, SITEIDs and YKR cells of the DPS layer (only the two id columns are read) """
+    from dps_loader import readAttributes
+    keys = readAttributes(dps_fp, columns=[sz_id_col, tz_id_col])
+    return {'rows': len(keys), 'sites': keys[sz_id_col].nunique(), 'cells': keys[tz_id_col].nunique()}
+
+
+def cdrMetadata(cdr_fp):
+    """ Columns, time columns (e.g. H7m) and rows of the mobile phone data """
+    if cdr_fp.lower().endswith('.csv'):
+        columns = list(pd.read_csv(cdr_fp, nrows=0).columns)
+        rows = tableRows(cdr_fp)
+    else:
+        sheet = pd.read_excel(cdr_fp, sheet_name=0)
+        columns, rows = list(sheet.columns), len(sheet)
+    time_cols = [col for col in columns if str(col).startswith('H') and str(col).endswith('m')]
+    return {'columns': len(columns), 'time_cols': len(time_cols), 'rows': rows}
+
+
+#------------------------------------------------------------
+'''2. WORK MEASURES '''
+#------------------------------------------------------------
+
+def interpolationWork(params):
+    """
+    Work of the MFD interpolation: the engine handles (subunits x weights x time steps) arrays, and
+    each time step of each weight is written for all cells. Memory is dominated by about four
+    float64 arrays of the engine.
+    """
+    dps = dpsMetadata(params['dps_fp'])
+    steps = (params['end_h'] - params['start_h'] + 1) * 60 // params.get('minutes', 60)
+    weights = len(params.get('weight_cols', ['RFA']))
+    engine = dps['rows'] * weights * steps
+    # Writing a cell of a Shapefile (reprojection, serialization) costs about as much as 200 subunits in the engine
+    writes = dps['cells'] * weights * steps * (200 if params.get('write_shapes', True) else 1)
+    features = dict(dps, steps=steps, weights=weights)
+    if os.path.exists(params.get('cdr_fp', '')):
+        features['cdr'] = cdrMetadata(params['cdr_fp'])
+    return features, engine + writes, 8.0 * (4 * engine + 3 * dps['rows'] * steps) / 1e6
+
+
+def cdrWork(params):
+    """ Work of the CDR aggregation: rows of the raw data (read in chunks by the streaming stage) """
+    fp = params.get('fp')
+    rows = tableRows(fp) if fp and os.path.exists(fp) else 0
+    indicators = len(params.get('indicators', {'HSPA_CALLS': 'HSPA'}))
+    chunk_rows = rows if 'chunksize' not in params else min(rows, params['chunksize'])
+    return {'rows': rows, 'indicators': indicators}, rows * indicators, 8.0 * 8 * chunk_rows * (5 + indicators) / 1e6
+
+
+def inputBytesWork(inputs):
+    """ Default work of a stage: the size of its input files """
+    size = sum(fileBytes(pattern) for pattern in inputs if '*' not in pattern) / 1e6
+    return {'input_mb': round(size, 1)}, size * 1e6, size
+
+
+# Stage: work measure function (features, time work, memory work in MB) from the stage parameters
+WORK_MEASURES = {'interpolation': interpolationWork,
+                 'cdr': cdrWork,
+                 'cdr-stream': cdrWork}
+
+
+def stageWork(stage):
+    """ Features, time work and memory work (MB) of a resolved stage (see pipeline_dag.resolvePipeline) """
+    if stage['stage'] in WORK_MEASURES:
+        return WORK_MEASURES[stage['stage']](stage['params'])
+    return inputBytesWork(stage['inputs'])
+
+
+#------------------------------------------------------------
+'''3. BENCHMARKS '''
+#------------------------------------------------------------
+
+def peakMemoryMB():
+    """ Peak memory of the current process in MB (None if it cannot be read) """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / 1e6 if os.uname().sysname == 'Darwin' else peak / 1e3
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1e6
+    except (ImportError, AttributeError):
+        return None
+
+
+def runMeasured(func, **kwargs):
+    """ Run func(**kwargs) and return the runtime (s) and peak memory (MB) of the process """
+    start = time.perf_counter()
+    func(**kwargs)
+    return time.perf_counter() - start, peakMemoryMB()
+
+
+def recordBenchmark(state_dir, stage, seconds, peak_mb):
+    """ Append the measured run of a resolved <stage> with its work measures to the benchmarks """
+    try:
+        features, time_work, memory_work = stageWork(stage)
+    except Exception as error:
+        print("%s: benchmark not recorded (%s)" % (stage['name'], error))
+        return
+    record = {'stage': stage['stage'], 'name': stage['name'], 'features': features,
+              'time_work': time_work, 'memory_work': memory_work, 'seconds': seconds, 'peak_mb': peak_mb,
+              'recorded': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(os.path.join(state_dir, 'benchmarks.jsonl'), 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def readBenchmarks(state_dir):
+    fp = os.path.join(state_dir, 'benchmarks.jsonl')
+    if not os.path.exists(fp):
+        return []
+    with open(fp) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def calibrate(benchmarks, stage):
+    """ Seconds per unit of work, MB per MB of memory work and number of benchmarks of <stage> """
+    default = DEFAULT_RATES.get(stage, DEFAULT_RATES['default'])
+    runs = [b for b in benchmarks if b['stage'] == stage and b['time_work'] > 0]
+    if not runs:
+        return default[0], default[1], 0
+    time_rate = float(np.median([b['seconds'] / b['time_work'] for b in runs]))
+    memory_runs = [b for b in runs if b['peak_mb'] is not None and b['memory_work'] > 0]
+    memory_rate = (float(np.median([max(b['peak_mb'] - BASE_MB, 0) / b['memory_work'] for b in memory_runs]))
+                   if memory_runs else default[1])
+    return time_rate, memory_rate, len(runs)
+
+
+#------------------------------------------------------------
+'''4. PLANNING '''
+#------------------------------------------------------------
+
+def recommend(stage, features, peak_mb, memory_mb, memory_rate):
+    """ Recommendation for a stage that does not fit (or nearly fits) into <memory_mb> """
+    if stage == 'interpolation' and peak_mb > memory_mb:
+        parts = int(math.ceil((peak_mb - BASE_MB) / max(memory_mb - BASE_MB, 1.0)))
+        return "split into %s runs (subsets or time steps/weights per run)" % parts
+    if stage in ('cdr', 'cdr-stream') and features.get('rows'):
+        row_mb = memory_rate * 8.0 * 8 * (5 + features['indicators']) / 1e6
+        chunksize = int((memory_mb * CHUNK_MEMORY_SHARE) / max(row_mb, 1e-12))
+        if stage == 'cdr' and peak_mb > memory_mb:
+            return "use cdr-stream with chunksize=%s" % chunksize
+        if stage == 'cdr-stream':
+            return "chunksize=%s" % min(chunksize, features['rows'])
+    if peak_mb > memory_mb:
+        return "needs more memory than the budget"
+    return ''
+
+
+def planPipeline(pipeline=None, state_dir=None, memory_mb=16000, stages=None):
+    """
+    Estimate the runtime and peak memory of the stages of <pipeline> (or only <stages>) within a
+    memory budget of <memory_mb>. Returns a DataFrame (one row per stage) and the recommended number
+    of workers for pipeline_dag.runPipeline.
+    """
+    from pipeline_dag import PIPELINE, STATE_DIR, resolvePipeline, topologicalOrder
+
+    pipeline = pipeline if pipeline is not None else PIPELINE
+    state_dir = state_dir if state_dir is not None else STATE_DIR
+    resolved = resolvePipeline(pipeline)
+    benchmarks = readBenchmarks(state_dir)
+
+    rows = []
+    for name in topologicalOrder(resolved):
+        if stages is not None and name not in stages:
+            continue
+        stage = resolved[name]
+        try:
+            features, time_work, memory_work = stageWork(stage)
+        except Exception as error:
+            rows.append({'stage': name, 'note': 'metadata not available (%s)' % error})
+            continue
+        time_rate, memory_rate, n_runs = calibrate(benchmarks, stage['stage'])
+        peak_mb = BASE_MB + memory_rate * memory_work
+        rows.append({'stage': name, 'features': features,
+                     'seconds': round(time_rate * time_work, 1), 'peak_mb': round(peak_mb),
+                     'calibration': '%s runs' % n_runs if n_runs else 'default',
+                     'recommendation': recommend(stage['stage'], features, peak_mb, memory_mb, memory_rate)})
+
+    plan = pd.DataFrame(rows, columns=['stage', 'features', 'seconds', 'peak_mb', 'calibration', 'recommendation', 'note'])
+
+    # Workers: as many of the largest stages as fit into the budget
+    largest = plan['peak_mb'].max() if plan['peak_mb'].notnull().any() else BASE_MB
+    workers = int(max(1, min(os.cpu_count() or 1, memory_mb // max(largest, 1))))
+    return plan, workers
+
+
+def printPlan(plan, workers, memory_mb):
+    with pd.option_context('display.max_colwidth', 80, 'display.width', 200):
+        print(plan.dropna(axis=1, how='all').to_string(index=False))
+    print("Total (sequential): %.0f s, largest stage: %s MB, recommended max_workers=%s for %s MB"
+          % (plan['seconds'].sum(), plan['peak_mb'].max(), workers, memory_mb))
+
+
+def main(state_dir=None, memory_mb=16000, stages=None):
+    """ Print the estimated runtime and peak memory of the pipeline stages (dry run, nothing is run). """
+    plan, workers = planPipeline(state_dir=state_dir, memory_mb=memory_mb, stages=stages)
+    printPlan(plan, workers, memory_mb)
+    return plan
+
+
+if __name__ == "__main__":
+    main()
@@ -6,72 +6,70 @@ Applying vertical dimension to AFT-refined NLS buildings - Floor area estimation
 -Data with floor areas and floor amounts is extracted from municipalities
     
 """
-import geopandas as gpd
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 
-#read in building data
+from mfd_kernels import segmentSum
+
+#file paths
 #----------------------------------------------------------------------------
 fp_municipal = r'...\data\PhysicalSurfaceData\OriginalData\Buildings\municipal_buildings.shp'
 fp_nls =r'... \data\PhysicalSurfaceData\OriginalData\Buildings\nls_buildings_refined_with_osmx_buildings.shp'
 
-bjoin = gpd.read_file(fp_municipal)
-bnls = gpd.read_file(fp_nls)
+#mfd-cleaned version
+out=r'...\data\PhysicalSurfaceData\OriginalData\Buildings\mfd_buildings.shp'
 
 
-#calculate geometry area for buildings 
-#----------------------------------------------------------------------------
-bjoin['AREA'] = bjoin['geometry'].area
+def cleanMunicipalBuildings(bjoin):
+    """ Clean municipal building data and select the columns for joining """
 
-#clean buildings with geom area below 20 m2 
-#----------------------------------------------------------------------------
-bjoin = bjoin.loc[bjoin['AREA']>=20]
+    #calculate geometry area for buildings 
+    #----------------------------------------------------------------------------
+    bjoin['AREA'] = bjoin['geometry'].area
 
-#clean buildings with join distance of >= 20m
-#----------------------------------------------------------------------------
-bjoin=bjoin.loc[(bjoin['dist']<20)]
+    #clean buildings with geom area below 20 m2 
+    #----------------------------------------------------------------------------
+    bjoin = bjoin.loc[bjoin['AREA']>=20]
 
-#remove outlier row from data (has 930 floors and is a duplex house)
-outliers=bjoin.loc[bjoin['FLCOUNT']>=930]
-bjoin=bjoin.loc[bjoin['FLCOUNT']!=930]
+    #clean buildings with join distance of >= 20m
+    #----------------------------------------------------------------------------
+    bjoin=bjoin.loc[(bjoin['dist']<20)]
 
-#clean columns for joining
-#----------------------------------------------------------------------------
-bjoin_clean = bjoin[['FLAREA', 'FLCOUNT', 'AREA', 'dist', 'join_UID', 'join_AFT_1', 'geometry']].copy()
+    #remove outlier row from data (has 930 floors and is a duplex house)
+    bjoin=bjoin.loc[bjoin['FLCOUNT']!=930]
 
+    #clean columns for joining
+    #----------------------------------------------------------------------------
+    return bjoin[['FLAREA', 'FLCOUNT', 'AREA', 'dist', 'join_UID', 'join_AFT_1', 'geometry']].copy()
 
-#----------------------------------------------------------------------------
-# JOIN FA/FCOUNT data to refined nls buildings
-#----------------------------------------------------------------------------
 
-# join municipality data to nls data usind uid col
-nls_FA = pd.merge(bnls, bjoin_clean, how='left', left_on=['UID'], right_on=['join_UID'])
+def joinFloorAreas(bnls, bjoin_clean):
+    """
+    JOIN FA/FCOUNT data to refined nls buildings.
+    Returns the joined data and the list of UIDs that matched several municipal buildings.
+    """
+    # join municipality data to nls data usind uid col
+    nls_FA = pd.merge(bnls, bjoin_clean, how='left', left_on=['UID'], right_on=['join_UID'])
 
-#save duplicate cases to list
-multimatches = nls_FA.loc[nls_FA['UID'].duplicated(), 'UID'].tolist()
-multimatches = list(sorted(set(multimatches)))
+    #save duplicate cases to list
+    multimatches = nls_FA.loc[nls_FA['UID'].duplicated(), 'UID'].tolist()
+    multimatches = list(sorted(set(multimatches)))
 
-#drop unnecessary cols
-nls_FA = nls_FA.drop(['join_UID', 'status','amenity_os', 'name_osm'],axis=1)
-nls_FA['dist'].describe()
+    #drop unnecessary cols
+    nls_FA = nls_FA.drop(['join_UID', 'status','amenity_os', 'name_osm'],axis=1)
+    return nls_FA, multimatches
 
-#create copy of df for looping
-nls_FACpy = nls_FA.copy(deep=True) 
-
-#create a subset for testing loop
-nls_FA_1000=nls_FA[0:1000]
-#create a copy of subset
-nls_FA_1000Cpy = nls_FA_1000.copy(deep=True) 
 
 #Calculate FA to NLS data
 '''distance is in input data already <20m'''
-def areaMatcher(iterdf,origdf):
+#(row by row original of estimateFloorAreas, kept as the reference of its rules in the tests)
+def areaMatcher(iterdf,origdf,multimatches):
 
     checked=[] #create list for keeping track of checked multimatches
     origdf['FA'] = 0.0 #add new col for new area
     origdf['MM'] =0 #multimatch recognition
     arearule = 0
+    multimatches = set(multimatches)
 
     for index, row in iterdf.iterrows():
 
@@ -120,6 +118,47 @@ def areaMatcher(iterdf,origdf):
                 continue
 
 
+def estimateFloorAreas(nls_FA, multimatches):
+    """
+    Floor area (FA) of the NLS buildings with the same rules as areaMatcher, but for all buildings at
+    once. The floor areas of multimatches are summed by UID (see mfd_kernels.py) into the first row of
+    the UID and the other rows are dropped. Returns a new DataFrame.
+    """
+    df = nls_FA.copy()
+    flarea = df['FLAREA'].values.astype(np.float64)
+    flcount = df['FLCOUNT'].values.astype(np.float64)
+    area_x = df['AREA_x'].values.astype(np.float64)
+    area_y = df['AREA_y'].values.astype(np.float64)
+    coef = np.select([df['AFT_nls_os'] == 'residential', df['AFT_nls_os'] == 'service'], [0.95, 0.91], 0.98)
+    mean_fc = np.where(df['AFT_nls_os'].isin(['residential', 'service']), 2, 1)
+
+    #FA if row has FA, else use FC to calc estimated FA
+    fa = np.where(~np.isnan(flarea), flarea, flcount * area_x * coef)
+
+    #multimatches: sum FA and geom area of same UID cases to the first case
+    uid_codes, uids = pd.factorize(df['UID'])
+    multi = df['UID'].isin(set(multimatches)).values & (uid_codes >= 0)
+    first = multi & ~df['UID'].duplicated().values
+    fa_sum = segmentSum(fa[multi], uid_codes[multi], len(uids))
+    area_y_sum = segmentSum(np.nan_to_num(area_y[multi]), uid_codes[multi], len(uids))
+    fa[first] = fa_sum[uid_codes[first]]
+    area_y[first] = area_y_sum[uid_codes[first]]
+
+    #no FA nor FC (not multimatch), use mean FC
+    no_fc = ~multi & np.isnan(flarea) & np.isnan(flcount)
+    fa[no_fc] = area_x[no_fc] * coef[no_fc] * mean_fc[no_fc]
+
+    #if nls area is significantly larger than area sum of matching municpal buildings
+    with np.errstate(invalid='ignore'):
+        arearule = (area_y >= 0) & (area_y < area_x * 0.8)
+    fa[arearule] += (area_x[arearule] - area_y[arearule]) * coef[arearule] * mean_fc[arearule]
+
+    df['FA'] = fa
+    df['MM'] = first.astype(int)
+    df['AREA_y'] = area_y
+    return df.loc[~multi | first]
+
+
 def FACoefficient(row):
     if (row['AFT_nls_os'] == 'residential'):
         return 0.95
@@ -135,37 +174,55 @@ def meanFC(row):
         return 1
 
 
-#run function
-areaMatcher(nls_FACpy,nls_FA)
+def mfdBuildings(nls_FA):
+    """ Clean floor area data for MFD method """
 
-# CLEAN DATA
-#---------------------------------------------------------------------------
-#rename columns 
-nls_FA = nls_FA.rename(index=str, columns={"geometry_x": "geometry", 
-                                  "AREA_x": "AREA", 
-                                  "AFT_nls_os": "AFT"})
-#drop unncesessary cols    
-nls_FA = nls_FA.drop(['geometry_y', 'join_AFT_1'],axis=1)   
+    # CLEAN DATA
+    #---------------------------------------------------------------------------
+    #rename columns 
+    nls_FA = nls_FA.rename(index=str, columns={"geometry_x": "geometry", 
+                                      "AREA_x": "AREA", 
+                                      "AFT_nls_os": "AFT"})
+    #drop unncesessary cols    
+    nls_FA = nls_FA.drop(['geometry_y', 'join_AFT_1'],axis=1)   
 
+    #CLEAN DATA FOR MFD METHOD
+    #----------------------------------------------------------------------------
 
+    #mfd copy
+    mfd_buildings = nls_FA[['AFT', 'FA', 'AREA', 'geometry']].copy()
 
-#CLEAN DATA FOR MFD METHOD
-#----------------------------------------------------------------------------
+    #remove restricted type buildings
+    mfd_buildings = mfd_buildings.loc[(mfd_buildings['AFT']!='restricted')] 
+    #273 restricted rows were removed, left 153357 buildings for MFD                
+    return mfd_buildings
 
-#mfd copy
-mfd_buildings = nls_FA[['AFT', 'FA', 'AREA', 'geometry']].copy()
 
-#remove restricted type buildings
-mfd_buildings = mfd_buildings.loc[(mfd_buildings['AFT']!='restricted')] 
-#273 restricted rows were removed, left 153357 buildings for MFD                
-    
-#write out files
-#----------------------------------------------------------------------------
+def main(fp_municipal=fp_municipal, fp_nls=fp_nls, out=out):
+    """ Estimate floor areas of the NLS buildings and write out buildings for the MFD method. """
+    import geopandas as gpd
+
+    #read in building data
+    #----------------------------------------------------------------------------
+    bjoin = gpd.read_file(fp_municipal)
+    bnls = gpd.read_file(fp_nls)
+
+    bjoin_clean = cleanMunicipalBuildings(bjoin)
+    nls_FA, multimatches = joinFloorAreas(bnls, bjoin_clean)
+
+    #estimate floor areas (see areaMatcher for the rules)
+    nls_FA = estimateFloorAreas(nls_FA, multimatches)
+
+    mfd_buildings = gpd.GeoDataFrame(mfdBuildings(nls_FA), geometry='geometry')
+
+    #write out files
+    #----------------------------------------------------------------------------
+    mfd_buildings.to_file(out)
+    return mfd_buildings
 
-#mfd-cleaned version
-out=r'...\data\PhysicalSurfaceData\OriginalData\Buildings\mfd_buildings.shp'
-mfd_buildings.to_file(out)
 
+if __name__ == "__main__":
+    main()
 
 
 
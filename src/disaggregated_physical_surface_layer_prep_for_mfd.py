@@ -5,26 +5,45 @@ Created on Thu Aug 23 11:06:43 2018
 calculate areas and necessary cols for mfd
 """
 
-import geopandas as gpd
 import numpy as np
+import pandas as pd
+
+from mfd_kernels import segmentSum
 
 #----------------------------------------------------------------------------
-#READ IN DATA
+#FILE PATHS
 #----------------------------------------------------------------------------
 fp_disaggregated_physica_surface = r'...\data\PhysicalSurfaceData\unioned_physical_surface_calculations_needed.shp'
-dpsl = gpd.read_file(fp_disaggregated_physica_surface) #dpsl stands for disaggregated physical surface layer
 
-#project to 3067
-dpsl= dpsl.to_crs({'init': 'epsg:3067'})
+out_raw=r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_250m_raw.shp'
+#out_raw=r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_even_transport_250m_raw.shp'
+
+out=r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_250m.shp'
+#out=r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_even_transport_250m.shp'
+
+#(optional) YKR grid lattice (json, see ykr_grid.py). If given, the input layer is the union of buildings, land use
+#and coverage areas without the grid, and it is split to the grid cells arithmetically.
+fp_lattice = None
+
+
+#SPLIT TO YKR GRID CELLS
+#----------------------------------------------------------------------------
+def splitToGrid(dpsl, lattice, tz_id_col='YKR_ID'):
+    """ Split the subunits at the grid lines and assign the YKR_ID of each part (instead of a union with the grid) """
+    from ykr_grid import splitByGrid
+
+    src, ids, geoms = splitByGrid(dpsl.geometry.values, lattice)
+    parts = dpsl.iloc[src].drop(columns=[tz_id_col], errors='ignore').reset_index(drop=True)
+    parts[tz_id_col] = ids
+    return parts.set_geometry(geoms, crs=dpsl.crs)
 
-dpsl.dtypes
-dpsl.tail()
-dpsl.head()
 
 #ASSIGN SPATIAL UNIT TYPE (building/land)
 #----------------------------------------------------------------------------
-dpsl['SPUT'] = np.where((dpsl['AFT'].isnull()), 'land', 'building')
-#dpsl = dpsl.rename(index=str, columns={"S_UNIT": "SPUT"}) change to sput according to mfd.py
+def assignSpatialUnitType(dpsl):
+    dpsl['SPUT'] = np.where((dpsl['AFT'].isnull()), 'land', 'building')
+    #dpsl = dpsl.rename(index=str, columns={"S_UNIT": "SPUT"}) change to sput according to mfd.py
+    return dpsl
 
 #ASSIGN ACTIVITY FUNCTION TYPE
 #----------------------------------------------------------------------------
@@ -40,105 +59,163 @@ def landuse_reclassifier(df):
     df.loc[df['AFT_1'] == 4, 'AFT_1'] = "transport"
     df.loc[df['AFT_1'] == 5, 'AFT_1'] = "restricted"
     df.loc[df['AFT_1'] == 6, 'AFT_1'] = "other"
-    
+
     return df
 
-dpsl = landuse_reclassifier(dpsl)  #reclassify and rename col to aft
+def assignActivityFunctionType(dpsl):
+    dpsl = landuse_reclassifier(dpsl)  #reclassify and rename col to aft
 
-#collect aft of land parcels to common AFT column
-dpsl.loc[(dpsl['AFT'].isnull()), 'AFT'] = dpsl['AFT_1']
+    #collect aft of land parcels to common AFT column
+    dpsl.loc[(dpsl['AFT'].isnull()), 'AFT'] = dpsl['AFT_1']
 
-#drop landuse AFT column
-dpsl = dpsl.drop(columns=['AFT_1'])
+    #drop landuse AFT column
+    return dpsl.drop(columns=['AFT_1'])
 
 
 #ASSIGN SEASONAL FACTOR M (buildings 0.9, land 0.1)
 #----------------------------------------------------------------------------
-dpsl['SF'] = np.where((dpsl['SPUT']=='land'), 0.1, 0.9)
-dpsl.loc[dpsl['AFT'] == 'restricted', 'SF'] = 0.0
-dpsl.loc[dpsl['AFT'] == 'service', 'SF'] = 1.0
-dpsl.loc[dpsl['AFT'] == 'transport', 'SF'] = 1.0
-
+def assignSeasonalFactor(dpsl):
+    dpsl['SF'] = np.where((dpsl['SPUT']=='land'), 0.1, 0.9)
+    dpsl.loc[dpsl['AFT'] == 'restricted', 'SF'] = 0.0
+    dpsl.loc[dpsl['AFT'] == 'service', 'SF'] = 1.0
+    dpsl.loc[dpsl['AFT'] == 'transport', 'SF'] = 1.0
+    return dpsl
 
 
 #CALCULATE FLOOR AREA
 #----------------------------------------------------------------------------
-#calculate area of each parcel created by the union
-dpsl['AREA_union'] = dpsl['geometry'].area
+def calculateFloorArea(dpsl):
+    #calculate area of each parcel created by the union
+    dpsl['AREA_union'] = dpsl['geometry'].area
 
-dpsl['FA_union'] = np.where((dpsl['SPUT']=='building'), 
-                   dpsl['AREA_union']/dpsl['AREA']*dpsl['FA'], #if building
-                   dpsl['AREA_union']) # if land
+    dpsl['FA_union'] = np.where((dpsl['SPUT']=='building'),
+                       dpsl['AREA_union']/dpsl['AREA']*dpsl['FA'], #if building
+                       dpsl['AREA_union']) # if land
+    return dpsl
 
 
-#CALCULATE RELATIVE FLOOR AREA 
+#SUM BY SOURCE ZONES
 #----------------------------------------------------------------------------
+def siteSum(dpsl, col, sz_id_col='SITEID'):
+    """ Sum of <col> by source zone (base station) for each subunit, 0 for subunits without a source zone """
+    site_codes, site_ids = pd.factorize(dpsl[sz_id_col])
+    valid = site_codes >= 0
+    sums = segmentSum(np.nan_to_num(dpsl[col].values[valid].astype(np.float64)), site_codes[valid], len(site_ids))
 
-# SSFA ==> Sum Site Floor Area (i.e. Sum 'FA' ("Floor Area") by 'Site_ID' of mobile phone cells)
-# --------
-dpsl['SSFA'] = 0.0
-
-# Group data by source zones
-grouped = dpsl.groupby('SITEID')
+    site_sum = np.zeros(len(dpsl))
+    site_sum[valid] = sums[site_codes[valid]]
+    return site_sum
 
-# Iterate over groups and sum the values
-for key, values in grouped:
-  # Sum the 'Area Floor'
-  ssaf = values['FA_union'].sum()
 
-  # Get the indices of the values
-  siteid_indices = values.index
+#CALCULATE RELATIVE FLOOR AREA
+#----------------------------------------------------------------------------
+def calculateRelativeFloorArea(dpsl):
 
-  # Assign value to column 'SSFA'
-  dpsl.loc[siteid_indices, 'SSFA'] = ssaf
+    # SSFA ==> Sum Site Floor Area (i.e. Sum 'FA' ("Floor Area") by 'Site_ID' of mobile phone cells)
+    # --------
+    dpsl['SSFA'] = siteSum(dpsl, 'FA_union')
 
-# RFA ==> Relative Floor Area for each subunit within a base station (scale 0.0 - 1.0)
-dpsl['RFA'] = 0.0
-dpsl['RFA'] = dpsl['FA_union'] / dpsl['SSFA']
+    # RFA ==> Relative Floor Area for each subunit within a base station (scale 0.0 - 1.0)
+    dpsl['RFA'] = dpsl['FA_union'] / dpsl['SSFA']
+    return dpsl
 
 
 #CALCULATE SIMPLE AREAL WEIGHT
+#----------------------------------------------------------------------------
+def calculateArealWeight(dpsl):
 
-#create col for storing area (not fa) of BS voronoi
-dpsl['SSA'] = 0.0
-
-# Group data by source zones
-grouped = dpsl.groupby('SITEID')
+    #area (not fa) of BS voronoi
+    dpsl['SSA'] = siteSum(dpsl, 'AREA_union')
 
-# Iterate over groups and sum the values
-for key, values in grouped:
-  # Sum the 'Area Floor'
-  ssaw = values['AREA_union'].sum()
+    # AW ==> Relative area for each subunit within a base station (scale 0.0 - 1.0)
+    dpsl['AW'] = dpsl['AREA_union'] / dpsl['SSA']
+    return dpsl
 
-  # Get the indices of the values
-  siteid_indices = values.index
 
-  # Assign value to column 'SSFA'
-  dpsl.loc[siteid_indices, 'SSA'] = ssaw
+def prepareDisaggregatedPhysicalSurface(dpsl):
+    """ Calculate all columns of the disaggregated physical surface layer that are needed for MFD """
+    dpsl = assignSpatialUnitType(dpsl)
+    dpsl = assignActivityFunctionType(dpsl)
+    dpsl = assignSeasonalFactor(dpsl)
+    dpsl = calculateFloorArea(dpsl)
+    dpsl = calculateRelativeFloorArea(dpsl)
+    dpsl = calculateArealWeight(dpsl)
 
-# RFA ==> Relative Floor Area for each subunit within a base station (scale 0.0 - 1.0)
-dpsl['AW'] = 0.0
-dpsl['AW'] = dpsl['AREA_union'] / dpsl['SSA']
+    #SORT DF BY SITEID
+    #----------------------------------------------------------------------------
+    #sort df by siteid
+    dpsl=dpsl.sort_values(by=['SITEID'])
+    #reset index and drop previous index column
+    return dpsl.reset_index(drop=True)
 
 
-#SORT DF BY SITEID
+#PARTITIONED PREPARATION (see partitioned_execution.py)
 #----------------------------------------------------------------------------
-#sort df by siteid
-dpsl=dpsl.sort_values(by=['SITEID'])
-#reset index and drop previous index column
-dpsl = dpsl.reset_index(drop=True)
+def preparePartition(shared, sites):
+    """ Prepare the subunits of the <sites> (site codes), a task of preparePartitioned """
+    rows = np.isin(shared['site_codes'], sites)
+    return prepareDisaggregatedPhysicalSurface(shared['dpsl'].loc[rows].copy())
 
-#WRITE OUT FILE
-#----------------------------------------------------------------------------
-out=r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_250m_raw.shp'
-#out=r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_even_transport_250m_raw.shp'
-dpsl.to_file(out)
-
-#copy needed cols to new df
-dpsl_cleaned = dpsl.drop(columns=['FA', 'AREA'])
-dpsl_cleaned = dpsl_cleaned.rename(index=str, columns={"FA_union": "FA", 
-                                                       "AREA_union": "AREA"})
-    
-out=r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_250m.shp'
-#out=r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_even_transport_250m.shp'
-dpsl_cleaned.to_file(out)
+
+def preparePartitioned(dpsl, executor='process', partition_by='site', n_partitions=8, max_workers=None):
+    """ prepareDisaggregatedPhysicalSurface in tasks of groups of sites (all subunits of a site in the same task) """
+    from partitioned_execution import newExecutor, partitionSites
+
+    site_codes, site_ids = pd.factorize(dpsl['SITEID'], sort=True)
+    x = y = None
+    if partition_by == 'tile':
+        centroids = dpsl.geometry.centroid
+        x, y = centroids.x.values, centroids.y.values
+    partitions = partitionSites(site_codes, len(site_ids), n_partitions, by=partition_by, x=x, y=y)
+
+    with newExecutor(executor, max_workers=max_workers) as tasks:
+        tasks.start({'dpsl': dpsl.reset_index(drop=True), 'site_codes': site_codes})
+        parts = tasks.gather(tasks.map(preparePartition, partitions))
+
+    #sort the parts by siteid as in prepareDisaggregatedPhysicalSurface
+    dpsl = pd.concat(parts).sort_values(by=['SITEID'], kind='stable')
+    return dpsl.reset_index(drop=True)
+
+
+def main(fp_disaggregated_physica_surface=fp_disaggregated_physica_surface, out_raw=out_raw, out=out, fp_lattice=fp_lattice,
+         executor=None, partition_by='site', n_partitions=8, max_workers=None):
+    """
+    Prepare the disaggregated physical surface layer for MFD and write it out.
+    With <executor> ('inline', 'process', 'cluster' or a dask scheduler address) the layer is prepared in
+    <n_partitions> tasks of sites by SITEID range or spatial tile (<partition_by> 'site' or 'tile').
+    """
+    import geopandas as gpd
+
+    #----------------------------------------------------------------------------
+    #READ IN DATA
+    #----------------------------------------------------------------------------
+    dpsl = gpd.read_file(fp_disaggregated_physica_surface) #dpsl stands for disaggregated physical surface layer
+
+    #project to 3067
+    dpsl= dpsl.to_crs(epsg=3067)
+
+    if fp_lattice is not None:
+        from ykr_grid import readLattice
+        dpsl = splitToGrid(dpsl, readLattice(fp_lattice))
+
+    if executor is None:
+        dpsl = prepareDisaggregatedPhysicalSurface(dpsl)
+    else:
+        dpsl = preparePartitioned(dpsl, executor=executor, partition_by=partition_by, n_partitions=n_partitions,
+                                  max_workers=max_workers)
+
+    #WRITE OUT FILE
+    #----------------------------------------------------------------------------
+    dpsl.to_file(out_raw)
+
+    #copy needed cols to new df
+    dpsl_cleaned = dpsl.drop(columns=['FA', 'AREA'])
+    dpsl_cleaned = dpsl_cleaned.rename(index=str, columns={"FA_union": "FA",
+                                                           "AREA_union": "AREA"})
+
+    dpsl_cleaned.to_file(out)
+    return dpsl_cleaned
+
+
+if __name__ == "__main__":
+    main()
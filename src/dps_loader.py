@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 14:48:19 2026
+
+Aim of this script:
+===================
+Geometry-free loading of the attributes of the disaggregated physical surface layer (DPS).
+
+The MFD interpolation only needs the attributes of the subunits (SITEID, YKR_ID, SPUT, AFT, SF, RFA ...),
+not their geometries. Reading the layer with gpd.read_file parses every geometry, which takes most
+of the time and memory for a large layer. Here only the requested attribute columns are read:
+
+- Shapefile, GeoPackage (or any other format readable by pyogrio): pyogrio without reading geometries
+- Parquet / GeoParquet: pyarrow column projection
+
+For debugging, a lazy geometry handle can be attached to the attributes. The geometries are read
+only when the handle is used.
+
+Input: DPS layer (.shp, .dbf, .gpkg or .parquet)
+Output: attributes (DataFrame)
+
+"""
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+# Attribute columns of the DPS layer that are needed in the MFD interpolation
+DPS_COLUMNS = ['SITEID', 'YKR_ID', 'SPUT', 'AFT', 'SF', 'RFA']
+
+
+#------------------------------------------------------------
+'''DBASE (.dbf) '''
+#------------------------------------------------------------
+
+def readDbfHeader(fp):
+    """
+    Header of a .dbf-file (e.g. the number of records for cost estimates without opening the layer):
+    number of records, header length, record length and field descriptors (name, type, offset, length, decimals)
+    """
+    with open(fp, 'rb') as f:
+        header = f.read(32)
+        n_records, header_len, record_len = struct.unpack('<IHH', header[4:12])
+
+        fields = []
+        offset = 1  # deletion flag
+        while True:
+            descriptor = f.read(32)
+            if len(descriptor) < 32 or descriptor[0] == 0x0D:
+                break
+            name = descriptor[:11].split(b'\x00')[0].decode('ascii')
+            field_type = chr(descriptor[11])
+            length, decimals = descriptor[16], descriptor[17]
+            fields.append((name, field_type, offset, length, decimals))
+            offset += length
+
+    return n_records, header_len, record_len, fields
+
+
+#------------------------------------------------------------
+'''LAZY GEOMETRY '''
+#------------------------------------------------------------
+
+class LazyGeometry(object):
+    """ Geometries of a layer that are read only when they are first used (e.g. for debugging) """
+
+    def __init__(self, fp, layer=None):
+        self.fp = fp
+        self.layer = layer
+        self._geometry = None
+
+    def load(self):
+        if self._geometry is None:
+            import geopandas as gpd
+            if self.fp.lower().endswith('.parquet'):
+                self._geometry = gpd.read_parquet(self.fp, columns=['geometry']).geometry
+            else:
+                self._geometry = gpd.read_file(self.fp, layer=self.layer, columns=[]).geometry
+        return self._geometry
+
+    def __getitem__(self, index):
+        return self.load().iloc[index]
+
+    def attach(self, attributes):
+        """ Attributes joined with the geometries as GeoDataFrame """
+        import geopandas as gpd
+        geometry = self.load()
+        return gpd.GeoDataFrame(attributes, geometry=geometry.iloc[attributes.index].values, crs=geometry.crs)
+
+
+#------------------------------------------------------------
+'''READING ATTRIBUTES '''
+#------------------------------------------------------------
+
+def sqlWhere(where):
+    """ SQL WHERE clause (OGR SQL) of a <where> dictionary {column: allowed values} """
+    clauses = []
+    for col, values in where.items():
+        # (numpy scalars as Python values, their repr is not valid SQL)
+        values = [value.item() if isinstance(value, np.generic) else value for value in values]
+        literals = [sqlLiteral(value) for value in values if not (isinstance(value, float) and np.isnan(value))]
+        clauses.append('"%s" IN (%s)' % (col, ', '.join(literals) if literals else 'NULL'))
+    return ' AND '.join(clauses)
+
+
+def sqlLiteral(value):
+    """ SQL literal of a number or a string (in single quotes, a double quoted string is a column name) """
+    if isinstance(value, str):
+        return "'%s'" % value.replace("'", "''")
+    return repr(value)
+
+
+def readAttributes(fp, columns=DPS_COLUMNS, layer=None, lazy_geometry=False, where=None):
+    """
+    Read the attribute <columns> of the layer in <fp> without parsing geometries.
+    With <where> ({column: allowed values}, e.g. {'SITEID': [...]}) only the matching rows are read:
+    the filter is pushed down to the reader (OGR SQL or Parquet filters).
+    With <lazy_geometry> a LazyGeometry handle is stored in df.attrs['geometry'] (with <where> only for
+    shapefiles, whose index keeps the position of the records).
+    """
+    where = dict((col, list(values)) for col, values in (where or {}).items())
+    ext = os.path.splitext(fp)[1].lower()
+    if lazy_geometry and where and ext not in ('.shp', '.dbf'):
+        raise ValueError("Lazy geometries of filtered rows are supported only for shapefiles.")
+    if ext == '.parquet':
+        df = pd.read_parquet(fp, columns=columns, filters=[(col, 'in', values) for col, values in where.items()] or None)
+    else:
+        import pyogrio
+        # The FIDs of a shapefile are the positions of the records (used by the lazy geometries)
+        df = pyogrio.read_dataframe(fp, layer=layer, columns=columns, read_geometry=False,
+                                    where=sqlWhere(where) if where else None, fid_as_index=ext in ('.shp', '.dbf'))
+        if ext in ('.shp', '.dbf'):
+            df.index.name = None
+
+    if lazy_geometry:
+        df.attrs['geometry'] = LazyGeometry(fp, layer=layer)
+    return df
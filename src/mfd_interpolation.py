@@ -20,7 +20,8 @@ This script implements the multi-temporal dasymetric interpolation method (see J
 
 REQUIREMENTS:
 -------------
-Python 3 with following packages and their dependencies: pandas, geopandas.
+Python 3 with following packages and their dependencies: numpy, pandas, geopandas (numba is optional, see mfd_kernels.py;
+rasterio is needed only for the GeoTIFF output, see zrop_cube.py).
   
 DATA:
 -----
@@ -46,37 +47,94 @@ More information about license: http://creativecommons.org/licenses/by-sa/4.0/
   
 """
 
+import numpy as np
 import pandas as pd
-import geopandas as gpd
-from fiona.crs import from_epsg
 import os
 
-def main():    
-    
-    """ Main method that controls the Multi-temporal function-based dasymetric interpolation method (MFD interpolation). """
-   
+from background_writer import BackgroundWriter
+from time_axis import TimeAxis
+from run_manifest import RunManifest, runKey, writeUnit
+from mfd_kernels import segmentSum, segmentNormalize
 
-    # File paths
-    # ...........
-    
-    # Human activity type data
-    hat_fp = r"...\data\TimeUseData\TimeUse.xlsx"
-    
-    # Disaggregated physical surface layer ( landuse + buildings + coverage areas + predefined statistical units )
-    dps_fp = r"...\data\PhysicalSurfaceData\Disaggregated_physical_surface_250m.shp"
-    
-    # Mobile phone data (network data)
-    cdr_fp = r"...\data\MobilePhoneData\hourlymedian_HSPA_tz.xlsx"
-    
-    # Target zones (Predefined spatial units)
-    tz_fp = r"...\data\TargetZones\Target_zones_grid250m.shp"
-    
-    # Output folder for the results
-    out_dir = r"...\results"
-    
-    # Prefix for the output name (time info for the filename will be added automatically)
-    out_prefix = "ZROP_results_HSPA"
+# File paths
+# ...........
+
+# Human activity type data
+hat_fp = r"...\data\TimeUseData\TimeUse.xlsx"
+
+# Disaggregated physical surface layer ( landuse + buildings + coverage areas + predefined statistical units )
+dps_fp = r"...\data\PhysicalSurfaceData\Disaggregated_physical_surface_250m.shp"
+
+# Mobile phone data (network data)
+cdr_fp = r"...\data\MobilePhoneData\hourlymedian_HSPA_tz.xlsx"
+
+# Target zones (Predefined spatial units)
+tz_fp = r"...\data\TargetZones\Target_zones_grid250m.shp"
+
+# (optional) YKR grid lattice (json, see ykr_grid.py). If given, the target zone grid is generated
+# from the YKR_IDs of the results instead of reading <tz_fp>
+tz_lattice_fp = None
+
+# (optional) Coarser target zone levels {level name: parent map (.csv) from the target zones to the zones of the level},
+# see target_zone_hierarchy.py. The results of all levels are written to <out_dir>\<out_prefix>_<level name>.csv
+tz_levels = {}
+
+# Dasymetric weight columns in the disaggregated physical surface layer (e.g. RFA = relative floor area,
+# AW = areal weight, or custom weights such as population register based weights). All weights are
+# calculated in one pass and the results are labelled with the name of the weight column.
+weight_cols = ['RFA']
+
+# (optional) Subset of the area to interpolate, e.g. {'municipalities': [49]} (Espoo), {'bbox': (minx, miny, maxx, maxy)}
+# or {'polygon': fp or WKT}, see subset_selection.py. Only the target zones of the subset and the subunits of their
+# base stations are read; the RMP is normalized with the totals of the whole mobile phone data.
+subset = None
+
+# Output folder for the results
+out_dir = r"...\results"
+
+# Prefix for the output name (time info for the filename will be added automatically)
+out_prefix = "ZROP_results_HSPA"
+
+
+def main(hat_fp=hat_fp, dps_fp=dps_fp, cdr_fp=cdr_fp, tz_fp=tz_fp, out_dir=out_dir, out_prefix=out_prefix,
+         start_h=0, end_h=23, epsg=3067, write_shapes=True, out_cube=None, cube_scenario=out_prefix,
+         tz_lattice_fp=tz_lattice_fp, tz_levels=tz_levels, weight_cols=weight_cols, background_writes='thread',
+         max_pending_writes=2, subset=subset, minutes=60, resume=True, incremental_dir=None, executor=None,
+         partition_by='site', n_partitions=8, max_workers=None, out_geotiff=None):    
     
+    """
+    Main method that controls the Multi-temporal function-based dasymetric interpolation method (MFD interpolation).
+
+    The results of each hour are saved as Shapefile (<write_shapes>) and/or to the cube store
+    <out_cube> as scenario <cube_scenario> (see zrop_cube.py). With <out_geotiff> (a folder) each scenario
+    of the cube is also written as a multi-band GeoTIFF <out_geotiff>\\<scenario>.tif with one band per hour.
+
+    All hours and all weighting schemes in <weight_cols> are calculated in one pass. With several
+    weighting schemes the name of the weight column is added to the output names.
+
+    The outputs are written by a background worker (<background_writes> 'thread' or 'process', None to
+    write in the main loop) with at most <max_pending_writes> queued writes, see background_writer.py.
+
+    With <subset> only the target zones of the subset are interpolated (see subset_selection.py).
+
+    The time steps are hours from <start_h> to <end_h>, or steps of <minutes> (e.g. 15) within these
+    hours, see time_axis.py. All steps are calculated at once.
+
+    Each written output unit (scenario and time step, cube scenario, levels) is recorded with the hashes
+    of its files in <out_dir>\\<out_prefix>_manifest.json. With <resume> a rerun with the same inputs and
+    parameters skips the recorded units whose files are unchanged and writes missing or partial ones again
+    (see run_manifest.py).
+
+    With <incremental_dir> the contributions of the sites to the target zones are stored, and a rerun in
+    which only the mobile phone data has changed patches the results of the changed sites instead of
+    running the interpolation again (see zrop_incremental.py).
+
+    With <executor> ('inline', 'process', 'cluster' or a dask scheduler address) the sites are split into
+    <n_partitions> tasks by SITEID range or by spatial tile (<partition_by> 'site' or 'tile', tiles need
+    <tz_lattice_fp>) that run on <max_workers> workers, see partitioned_execution.py.
+    Returns the target zone ids and the ZROP array (target zones x weights x hours).
+    """
+   
     # Column names in the human activity data
     # .......................................
     
@@ -132,145 +190,340 @@ def main():
     
     # Time and projection parameters
     # ..............................
-    
-    # Start hour
-    start_h = 0
-    
-    # End hour
-    end_h = 23
-    
-    # EPSG code for desired output projection
-    epsg = 3067
+    # <start_h> and <end_h> are the first and last hour, <epsg> is the EPSG code for desired output projection
     
     # ----------------------------------------------------------
     
     print("Running MFD interpolation tool ...")
-    
-    # Iterate over the desired hours of the day
-    for xhour in range(start_h, end_h+1):
-        print("Processing hour: %s" % xhour)
-        
+
+    if out_geotiff is not None and out_cube is None:
+        raise ValueError("The GeoTIFF output is written from the cube store, give also <out_cube>.")
+
+    # Grid lattice for generating the target zones
+    tz_lattice = None
+    if tz_lattice_fp is not None:
+        from ykr_grid import readLattice
+        tz_lattice = readLattice(tz_lattice_fp)
+        tz_fp = None
+
+    # Incremental update: if only the mobile phone data has changed since the stored run, the results are
+    # patched from the stored contributions of the sites (see zrop_incremental.py)
+    state = None
+    if incremental_dir is not None:
+        from zrop_incremental import IncrementalZROP
+        from pipeline_dag import FileHasher
+        hasher = FileHasher(os.path.join(incremental_dir, 'file_hashes.json'))
+        state_key = runKey([hat_fp, dps_fp, tz_fp, tz_lattice_fp],
+                           {'start_h': start_h, 'end_h': end_h, 'minutes': minutes, 'weight_cols': weight_cols,
+                            'subset': subset}, hasher=hasher)
+        # Hashes of unchanged inputs are reused in the next update
+        os.makedirs(incremental_dir, exist_ok=True)
+        hasher.save()
+        state = IncrementalZROP.load(incremental_dir, state_key)
+
+    # Target zones column ==> I.e. a column for unique ids of desired spatial grid cells ('Grid Cell ID' in the article)
+    tz_col = target_zone_col
+    if state is not None:
+        cdr = readCDR(cdr_fp)
+        changed_sites, changed_zones = state.update(cdr, sz_id_col=source_zone_col_cdr)
+        print("Incremental update: %s changed sites, %s changed target zones" % (changed_sites, changed_zones))
+        state.save(incremental_dir, counts_only=True)
+
+        time_windows = state.time_windows
+        zone_ids, zrop = state.zrop()
+        target = None
+        if tz_fp is not None:
+            import geopandas as gpd
+            target = gpd.read_file(tz_fp)
+    else:
+        # Target zones and base stations of the subset
+        subset_zones, dps_where, tz_bbox = None, None, None
+        if subset is not None:
+            from subset_selection import resolveSubset
+            subset_area, subset_zones, subset_sites = resolveSubset(subset, dps_fp, lattice=tz_lattice, tz_fp=tz_fp,
+                                                                    sz_id_col=source_zone_col_dps, tz_id_col=target_zone_col)
+            print("Subset: %s target zones, %s source zones" % (len(subset_zones), len(subset_sites)))
+            dps_where = {'SITEID': subset_sites}
+            tz_bbox = subset_area.bounds
+
         # ------------------------------------------------------------------
-        # 1. Read input data
+        # 1. Read input data (once for all hours)
         # -------------------------------------------------------------------
-    
+
         # tu = time use
-        # dps = disaggregated physical layer
+        # dps = disaggregated physical layer (attributes and the weight columns)
         # cdr = mobile phone data
         # target = output spatial layer in statistical units
-        tu, dps, cdr, target = readFiles(time_use_fp=hat_fp, dps_fp=dps_fp, cdr_fp=cdr_fp, tz_fp=tz_fp)
-    
-        # Use time window (xhour) for the whole analysis 
-        # ...............................................
-        time_window = 'H%s' % xhour
-        
-        # --------------------------------------------------------------------
-        # 2. Calculate Relative share of Mobile Phone users (RMP)
-        # --------------------------------------------------------------------
-            
-        # Calculate RMP - i.e. normalize the Mobile Phone user counts to scale 0.0 - 1.0
-        # Note: In the here this part is done earlier than in the manuscript (--> chapter 3.4) for practical reasons. 
-        # ..........................................................................................
-        
-        # Name of the mobile phone user counts per site_id in the table
-        twm = time_window + 'm'
-        cdr = calculateRMP(cdr, time_window=time_window)
+        from dps_loader import DPS_COLUMNS
+        dps_columns = DPS_COLUMNS + [col for col in weight_cols if col not in DPS_COLUMNS]
+        tu, dps, cdr, target = readFiles(time_use_fp=hat_fp, dps_fp=dps_fp, cdr_fp=cdr_fp, tz_fp=tz_fp, dps_columns=dps_columns,
+                                         dps_where=dps_where, tz_bbox=tz_bbox)
+
+        # Time windows (hours) of the analysis
+        # (hourly H9, or sub-hourly H9M15 ... for time steps of <minutes>)
+        time_axis = TimeAxis.fromHours(start_h, end_h, minutes)
+        time_windows = time_axis.labels()
+
+        # Hourly time use factors are interpolated to sub-hourly time steps
+        tu = timeUseFactors(tu, time_axis)
 
         # --------------------------------------------------------------------
-        # 3. Reclassify Landuse layer ( based on Open Street Map information )
-        # --------------------------------------------------------------------
-    
-        """This step is done already earlier, due to requirements set by data.
-        """
-        # --------------------------------------------------------------------
-        # 4. Join layers into same DataFrame
+        # 2. Calculate Relative share of Mobile Phone users (RMP) and
+        # 4. Join layers into same DataFrame (all hours at once)
         # --------------------------------------------------------------------
-    
-        # Join necessary columns from <tu> table
-        # .........................................
-    
-        # Columns in the time-use dataset
-        # ...............................
-        # time_window + 't' -command below produces e.g. 'H10t' which is a column that has the time-usage information for specific hour
-        tu_cols = [time_window+'t', spatial_unit_col, activity_function_type, seasonal_factor_col]
-    
-        # Columns in the disaggregated physical surface layer
-        # ...............................
+        # (3. reclassification of the landuse layer and 5. the relative floor area (RFA) are done already earlier,
+        # due to requirements set by data)
+
         # Abbreviations:
         # AFT ==> Activity_function_type
         # SPUT ==> Spatial_unit
         # SF ==> Seasonal_factor
-        dps_cols = ['SPUT', 'AFT', 'SF']
-    
-        # Join the datasets together based on dps_cols and all tu_cols except the first item (i.e. time-usage info column such as 'H10t')
-        dps = dps.merge(tu[tu_cols], left_on=dps_cols, right_on=tu_cols[1:])
-        #print(dps.head())
-    
-        # Join necessary columns from <cdr> table
-        # .........................................
-    
-        # Source zones column ==> I.e. column that has unique IDs for mobile phone coverage areas (base stations)
-        sz_col_dps = source_zone_col_dps
-        sz_col_cdr = source_zone_col_cdr
-    
-        dps = dps.merge(cdr[[twm, 'RMP %s' % twm, sz_col_cdr]], left_on=sz_col_dps, right_on=sz_col_cdr)
-    
-        # ---------------------------------------------------------------------
-        # 5. Calculate the Relative Floor Area (RFA)
-        # ---------------------------------------------------------------------
-        
-        """This step is done already earlier, due to requirements set by data.
-        """
-        
+        dps_tu = joinTimeUse(dps, tu, time_windows, dps_cols=['SPUT', 'AFT', 'SF'],
+                             tu_cols=[spatial_unit_col, activity_function_type, seasonal_factor_col])
+        dps = joinRMP(dps_tu, cdr, time_windows, sz_col_dps=source_zone_col_dps, sz_col_cdr=source_zone_col_cdr)
+
         # ---------------------------------------------------------------------
-        # 6. Calculate the Estimated Human Presences (EHP)
+        # 6.-8. Calculate EHP, ROP and ZROP for all weights and hours in one pass
         # ---------------------------------------------------------------------
-    
-        # Abbreviations:
-        # sf_col ==> Seasonal factor column
-        
+
         # Note:
         # By default the seasonal factor is read from the human activity data (i.e. from the seasonal_factor_column)
         # However, you can also use the seasonal factor that is classified based on the physical surface layer features. Then, pass column 'SF' to sf_col below)
-        
-        EHP = calculateEHP(df=dps, time_window=time_window, sz_id_col=sz_col_dps, sf_col=seasonal_factor_col)
-        """note!! changed rfa -> dps"""
-        
-        # ----------------------------------------------------------------------
-        # 7. Calculate Relative Observed Population (ROP)
-        # ----------------------------------------------------------------------
-    
-        ROP = calculateROP(df=EHP, time_window=time_window)              
-    
-        # -----------------------------------------------------------------------
-        # 8. Aggregate spatially to desired target zones (ZROP)
-        # -----------------------------------------------------------------------
-    
-        # Target zones column ==> I.e. a column for unique ids of desired spatial grid cells ('Grid Cell ID' in the article)
-        tz_col = target_zone_col    
-        ZROP = calculateZROP(df=ROP, time_window=time_window, tz_id_col=tz_col)
-    
-        # -----------------------------------------------------------------------
-        # 9. Save result to disk in Shapefile format
-        # -----------------------------------------------------------------------
-        out_filename = "%s_%s.shp" % (out_prefix, time_window)
-        out = os.path.join(out_dir, out_filename)
-    
-        # Save file to disk
-        saveToShape(input_df=ZROP, grid_df=target, output_path=out, tz_id_col_spatial=target_zone_col_spatial, tz_id_col=tz_col, epsg_code=epsg)
+
+        if executor is None:
+            zone_ids, zrop = calculateZROPArray(dps, time_windows, weight_cols, sz_id_col=source_zone_col_dps,
+                                                tz_id_col=tz_col, sf_col=seasonal_factor_col)
+        else:
+            zone_ids, zrop = partitionedZROP(dps, time_windows, weight_cols, sz_id_col=source_zone_col_dps, tz_id_col=tz_col,
+                                             sf_col=seasonal_factor_col, executor=executor, partition_by=partition_by,
+                                             n_partitions=n_partitions, max_workers=max_workers, lattice=tz_lattice)
+
+        # Base stations of the subset reach also target zones outside of it, keep only the subset
+        if subset_zones is not None:
+            in_subset = np.isin(zone_ids, subset_zones)
+            zone_ids, zrop = zone_ids[in_subset], zrop[in_subset]
+
+        # Store the contributions of the sites to the target zones for incremental updates
+        if incremental_dir is not None:
+            state = IncrementalZROP.fromLayers(dps_tu, time_windows, weight_cols, sz_id_col=source_zone_col_dps,
+                                               tz_id_col=tz_col, sf_col=seasonal_factor_col, zones=subset_zones, key=state_key)
+            state.setCounts(cdr, sz_id_col=source_zone_col_cdr)
+            state.save(incremental_dir)
+
+    # -----------------------------------------------------------------------
+    # 9. Save result to disk in Shapefile format
+    # -----------------------------------------------------------------------
+
+    # Generate the grid cells of the results
+    if tz_lattice is not None:
+        from ykr_grid import gridGeoDataFrame
+        target = gridGeoDataFrame(zone_ids, tz_lattice, id_col=target_zone_col_spatial, epsg=epsg)
+
+    # Manifest of the written output units of this run (for resuming a failed run)
+    run_key = runKey([hat_fp, dps_fp, cdr_fp, tz_fp, tz_lattice_fp] + list(tz_levels.values()),
+                     {'start_h': start_h, 'end_h': end_h, 'minutes': minutes, 'epsg': epsg,
+                      'weight_cols': weight_cols, 'subset': subset})
+    manifest = RunManifest(os.path.join(out_dir, '%s_manifest.json' % out_prefix), run_key, resume=resume)
+
+    # Outputs are written in the background while the next hour is prepared, leaving the block waits for the
+    # remaining writes and checks the outputs (fails if any write failed)
+    with BackgroundWriter(max_pending=max_pending_writes, mode=background_writes) as writer:
+
+        def submitUnit(unit, func, outputs, **kwargs):
+            """ Write an output unit unless it is complete from an earlier run, and record it when it is written """
+            if manifest.isComplete(unit, outputs):
+                print("Skipping %s (already written)" % unit)
+                return
+            writer.submit(writeUnit, func, outputs, outputs=outputs,
+                          on_done=lambda hashes: manifest.record(unit, hashes), **kwargs)
+
+        for w, weight_col in enumerate(weight_cols):
+            # Results of several weighting schemes are labelled by the weight column
+            method_prefix = out_prefix if len(weight_cols) == 1 else "%s_%s" % (out_prefix, weight_col)
+            method_scenario = cube_scenario if len(weight_cols) == 1 else "%s_%s" % (cube_scenario, weight_col)
+
+            zrop_hours = []
+            for h, time_window in enumerate(time_windows):
+                print("Saving %s time step: %s" % (weight_col, time_window))
+                ZROP = pd.DataFrame({tz_col: zone_ids, 'ZROP %s' % time_window: zrop[:, w, h]})
+
+                out_filename = "%s_%s.shp" % (method_prefix, time_window)
+                out = os.path.join(out_dir, out_filename)
+
+                # Save file to disk
+                if write_shapes:
+                    submitUnit('%s/%s' % (method_prefix, time_window), saveToShape, [out], input_df=ZROP, grid_df=target,
+                               output_path=out, tz_id_col_spatial=target_zone_col_spatial, tz_id_col=tz_col, epsg_code=epsg)
+
+                zrop_hours.append(ZROP.set_index(tz_col)['ZROP %s' % time_window])
+
+            # Save all time steps to the cube store at once (rows x cols x hours x scenarios)
+            if out_cube is not None:
+                submitUnit('cube/%s' % method_scenario, saveToCube, [os.path.join(out_cube, method_scenario)],
+                           input_df=pd.concat(zrop_hours, axis=1).reset_index(), grid_df=target,
+                           cube_dir=out_cube, scenario=method_scenario, time_window=time_windows,
+                           tz_id_col_spatial=target_zone_col_spatial, tz_id_col=tz_col, epsg_code=epsg, lattice=tz_lattice)
+
+                # Multi-band GeoTIFF of the scenario (written from the cube after the cube write)
+                if out_geotiff is not None:
+                    tif_fp = os.path.join(out_geotiff, '%s.tif' % method_scenario)
+                    submitUnit('geotiff/%s' % method_scenario, saveToGeoTiff, [tif_fp], cube_dir=out_cube,
+                               scenario=method_scenario, out_fp=tif_fp, time_window=time_windows, epsg_code=epsg)
+
+            # -----------------------------------------------------------------------
+            # 10. Roll up all hours to the coarser target zone levels
+            # -----------------------------------------------------------------------
+            if len(tz_levels) > 0:
+                submitUnit('%s/levels' % method_prefix, saveLevels,
+                           [os.path.join(out_dir, "%s_%s.csv" % (method_prefix, name)) for name in tz_levels],
+                           zrop_hours=zrop_hours, tz_levels=tz_levels, out_dir=out_dir, out_prefix=method_prefix)
+
+    return zone_ids, zrop
         
 
-def readFiles(time_use_fp=None, dps_fp=None, cdr_fp=None, tz_fp=None):
+def readFiles(time_use_fp=None, dps_fp=None, cdr_fp=None, tz_fp=None, dps_columns=None, dps_where=None, tz_bbox=None):
     """ 
     Read files into memory that are needed for Multi-temporal Dasymetric Interpolation 
+
+    Only the attribute columns <dps_columns> of the disaggregated physical surface layer are read
+    (without geometries), by default the columns in dps_loader.DPS_COLUMNS. With <dps_where>
+    ({column: values}) only the matching subunits are read, with <tz_bbox> only the target zones
+    within the bounds.
     """
+    from dps_loader import readAttributes, DPS_COLUMNS
+
     # Read input files
     time_use = pd.read_excel(time_use_fp,sheet_name=0) #originally used param sheetname is deprecated:https://pandas.pydata.org/pandas-docs/stable/generated/pandas.read_excel.html
-    dps = gpd.read_file(dps_fp)
-    cdr = pd.read_excel(cdr_fp,sheet_name=0) 
-    tz = gpd.read_file(tz_fp)
+    dps = readAttributes(dps_fp, columns=dps_columns if dps_columns is not None else DPS_COLUMNS, where=dps_where)
+    cdr = readCDR(cdr_fp)
+    # Target zones are not read if they are generated from the grid lattice
+    tz = None
+    if tz_fp is not None:
+        import geopandas as gpd
+        tz = gpd.read_file(tz_fp, bbox=tz_bbox)
     return time_use, dps, cdr, tz
 
+def timeUseFactors(tu, time_axis):
+    """
+    Time use factors of the time steps of <time_axis> (columns e.g. 'H9M15t'). Steps that are not in
+    <tu> are interpolated from the hourly factors H0t ... H23t (see TimeAxis.fromHourly).
+    """
+    missing = [label for label in time_axis.labels('t') if label not in tu.columns]
+    if len(missing) == 0:
+        return tu
+    hourly = tu[['H%st' % hour for hour in range(24)]].values
+    factors = pd.DataFrame(time_axis.fromHourly(hourly), columns=time_axis.labels('t'), index=tu.index)
+    return pd.concat([tu, factors[missing]], axis=1)
+
+
+def readCDR(cdr_fp):
+    """ Mobile phone data as written by mobilephonedata_for_mfd.py (.csv) or as Excel sheet """
+    if cdr_fp.lower().endswith('.csv'):
+        return pd.read_csv(cdr_fp)
+    return pd.read_excel(cdr_fp,sheet_name=0)
+
+
+def joinLayers(dps, tu, cdr, time_windows, dps_cols, tu_cols, sz_col_dps, sz_col_cdr):
+    """
+    Join the time use of all <time_windows> (e.g. 'H10t') from <tu> and the RMP of all time windows
+    (e.g. 'RMP H10m') from <cdr> to the subunits of <dps>. Subunits without a match are dropped.
+    """
+    dps = joinTimeUse(dps, tu, time_windows, dps_cols, tu_cols)
+    return joinRMP(dps, cdr, time_windows, sz_col_dps, sz_col_cdr)
+
+
+def joinTimeUse(dps, tu, time_windows, dps_cols, tu_cols):
+    """ Join the time use of all <time_windows> (e.g. 'H10t') from <tu> to the subunits of <dps> """
+    # Join the datasets together based on dps_cols and tu_cols (i.e. spatial unit, activity function type and seasonal factor)
+    return dps.merge(tu[tu_cols + [tw + 't' for tw in time_windows]], left_on=dps_cols, right_on=tu_cols)
+
+
+def joinRMP(dps, cdr, time_windows, sz_col_dps, sz_col_cdr):
+    """ Join the RMP of all <time_windows> (e.g. 'RMP H10m') from <cdr> to the subunits of <dps> """
+    # Calculate RMP - i.e. normalize the Mobile Phone user counts to scale 0.0 - 1.0 (all time windows at once, see calculateRMP)
+    rmp_cols = ['RMP %sm' % tw for tw in time_windows]
+    counts = cdr[[tw + 'm' for tw in time_windows]]
+    cdr = cdr.assign(**dict(zip(rmp_cols, (counts / counts.sum()).T.values)))
+
+    return dps.merge(cdr[rmp_cols + [sz_col_cdr]], left_on=sz_col_dps, right_on=sz_col_cdr)
+
+
+def calculateZROPArray(df, time_windows, weight_cols, sz_id_col, tz_id_col, sf_col):
+    """
+    Calculate EHP, ROP and ZROP for all <time_windows> and all weight columns <weight_cols> in one
+    pass (see calculateEHP, calculateROP and calculateZROP for one time window and the RFA weight).
+    <df> is the output of joinLayers.
+
+    Returns the target zone ids (sorted) and a (target zones x weights x hours) array of ZROP.
+    """
+    n = len(df)
+    # (subunits x hours) time use and RMP, (subunits x weights) weights
+    hour_factor = np.nan_to_num(df[[tw + 't' for tw in time_windows]].values.astype(np.float64))
+    rmp = np.nan_to_num(df[['RMP %sm' % tw for tw in time_windows]].values.astype(np.float64))
+    weights = np.nan_to_num(df[weight_cols].values.astype(np.float64))
+    sf = np.nan_to_num(df[sf_col].values.astype(np.float64))
+
+    # (absolute) estimated human presence ==> [Weight] * [Seasonal Factor Coefficient] * [Hour Factor H]
+    aEHP = (weights * sf[:, None])[:, :, None] * hour_factor[:, None, :]
+
+    # EHP ==> aEHP normalized by source zone (scale 0.0 - 1.0) for each weight and hour
+    # (subunits without a source zone are skipped)
+    site_codes, site_ids = pd.factorize(df[sz_id_col])
+    valid = site_codes >= 0
+    EHP = np.zeros((n, aEHP[0].size))
+    EHP[valid] = segmentNormalize(aEHP.reshape(n, -1)[valid], site_codes[valid], len(site_ids))
+
+    # ROP ==> EHP * RMP
+    ROP = EHP.reshape(aEHP.shape) * rmp[:, None, :]
+
+    # ZROP ==> sum of ROP by target zone (subunits without a target zone are skipped)
+    zone_codes, zone_ids = pd.factorize(df[tz_id_col], sort=True)
+    valid = zone_codes >= 0
+    ZROP = segmentSum(ROP.reshape(n, -1)[valid], zone_codes[valid], len(zone_ids))
+    return np.asarray(zone_ids), ZROP.reshape(len(zone_ids), len(weight_cols), len(time_windows))
+
+
+def zropPartition(shared, sites):
+    """ ZROP of the subunits of the <sites> (site codes), a task of partitionedZROP """
+    rows = np.isin(shared['site_codes'], sites)
+    return calculateZROPArray(shared['df'].loc[rows], **shared['params'])
+
+
+def partitionedZROP(df, time_windows, weight_cols, sz_id_col, tz_id_col, sf_col, executor='process', partition_by='site',
+                    n_partitions=8, max_workers=None, lattice=None):
+    """
+    Calculate ZROP as calculateZROPArray in tasks of <n_partitions> groups of sites (<partition_by> 'site' or 'tile')
+    on the <executor>, and sum the partial results of the tasks by target zone (see partitioned_execution.py).
+    """
+    from partitioned_execution import newExecutor, partitionSites, addZoneSums
+
+    site_codes, site_ids = pd.factorize(df[sz_id_col], sort=True)
+    x = y = None
+    if partition_by == 'tile':
+        if lattice is None:
+            raise ValueError("Tile partitions need the YKR grid lattice (tz_lattice_fp).")
+        from ykr_grid import cellBounds
+        # Subunits without a target zone have no position (NaN)
+        zone_ids = df[tz_id_col].values.astype(np.float64)
+        located = ~np.isnan(zone_ids)
+        x, y = np.full(len(df), np.nan), np.full(len(df), np.nan)
+        minx, miny, maxx, maxy = cellBounds(zone_ids[located], lattice)
+        x[located], y[located] = (minx + maxx) / 2.0, (miny + maxy) / 2.0
+    partitions = partitionSites(site_codes, len(site_ids), n_partitions, by=partition_by, x=x, y=y)
+
+    # Only the columns that are needed in the tasks are shipped to the workers
+    cols = [sz_id_col, tz_id_col, sf_col] + list(weight_cols) + [tw + 't' for tw in time_windows] + \
+           ['RMP %sm' % tw for tw in time_windows]
+    shared = {'df': df[list(dict.fromkeys(cols))].reset_index(drop=True), 'site_codes': site_codes,
+              'params': dict(time_windows=time_windows, weight_cols=weight_cols, sz_id_col=sz_id_col,
+                             tz_id_col=tz_id_col, sf_col=sf_col)}
+
+    print("Running %s partitions (%s) on executor %s" % (len(partitions), partition_by, executor))
+    with newExecutor(executor, max_workers=max_workers) as tasks:
+        tasks.start(shared)
+        return tasks.reduce(addZoneSums, tasks.map(zropPartition, partitions))
+
+
 def calculateRMP(cdr, time_window):
     """
     Calculate Relative Mobile Phone data distribution (RMP) for each subunit within a given base station.
@@ -299,26 +552,18 @@ def calculateEHP(df, time_window, sz_id_col, sf_col):
     # Calculate (absolute) estimated human presence (aEHP) for selected time window  ==> [Relative Floor Area] * [Seasonal Factor Coefficient] * [Hour Factor H]
     df['aEHP %s' % tw] = df['RFA'] * df[sf_col] * df[tw]
 
-    # Create column for estimated human presence (EHP) that is a normalized aEHP (scale 0.0 - 1.0).
-    df['EHP %s' % tw] = None
-
-    # Group data by 'Base_station_id'
-    grouped = df.groupby(sz_id_col)
-
-    # Iterate over groups and normalize the values
-    for key, values in grouped:
-
-      # Get the indices of the values
-      sz_indices = values.index
+    # Estimated human presence (EHP) is aEHP normalized by 'Base_station_id' (scale 0.0 - 1.0)
+    site_codes, site_ids = pd.factorize(df[sz_id_col])
+    aEHP = df['aEHP %s' % tw].values.astype(np.float64)
+    valid = site_codes >= 0
 
-      # Get the sum of 'aEHP' values within site
-      sum_aEHP = values['aEHP %s' % tw].sum()
-     
-      # Normalize the aEHP values by 'Site_ID' for each time unit (scale 0.0 - 1.0) ==> RMP
-      EHP = values['aEHP %s' % tw] / sum_aEHP
+    # Sum of 'aEHP' values within site (missing values are skipped)
+    sum_aEHP = segmentSum(np.nan_to_num(aEHP[valid]), site_codes[valid], len(site_ids))
 
-      # Assign values to 'RMP' columns
-      df.loc[sz_indices, 'EHP %s' % tw] = EHP.values
+    EHP = np.full(len(df), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        EHP[valid] = aEHP[valid] / sum_aEHP[site_codes[valid]]
+    df['EHP %s' % tw] = EHP
 
     return df
 
@@ -345,23 +590,13 @@ def calculateZROP(df, time_window, tz_id_col):
     tw = time_window
     rop = 'ROP ' + tw + 't'
     
-    # Group data by 'Grid cell id'
-    grouped = df.groupby(tz_id_col)
+    # Sum all ROP features that belongs to the same 'Grid cell id' (missing values are skipped)
+    zone_codes, zone_ids = pd.factorize(df[tz_id_col], sort=True)
+    valid = zone_codes >= 0
+    zrop = segmentSum(np.nan_to_num(df[rop].values[valid].astype(np.float64)), zone_codes[valid], len(zone_ids))
 
-    # Create DataFrame for spatial units (e.g. a 100 m grid)
-    ZROP_grid = pd.DataFrame()
-
-    # Iterate over grid cells
-    for key, values in grouped:
-
-      # Sum all ROP features that belongs to the same 'Grid cell id'
-      zrop = values[rop].sum()
-
-      # Append to DataFrame
-      ZROP_grid = ZROP_grid.append([[key, zrop]])
-
-    # Set column names
-    ZROP_grid.columns = [tz_id_col, 'ZROP %s' % tw]
+    # DataFrame for spatial units (e.g. a 100 m grid)
+    ZROP_grid = pd.DataFrame({tz_id_col: np.asarray(zone_ids), 'ZROP %s' % tw: zrop})
 
     # Change grid cell id to numeric if possible
     try:
@@ -374,6 +609,7 @@ def calculateZROP(df, time_window, tz_id_col):
 
 def saveToShape(input_df, grid_df, output_path, tz_id_col_spatial, tz_id_col, epsg_code):
     """ Save ZROP values in <input_df> as Shapefile defined in <grid_df> to <output_path> using projection in <epsg code> """
+    import geopandas as gpd
     
     # Join the data with grid GeoDataFrame
     geo = grid_df[[tz_id_col_spatial, 'geometry']].merge(input_df, left_on=tz_id_col_spatial, right_on=tz_id_col, how='inner')
@@ -382,7 +618,7 @@ def saveToShape(input_df, grid_df, output_path, tz_id_col_spatial, tz_id_col, ep
     geo['geometry'] = geo['geometry'].to_crs(epsg=epsg_code)
 
     # Ensure that results is GeoDataFrame
-    geo = gpd.GeoDataFrame(geo, geometry='geometry', crs=from_epsg(epsg_code))
+    geo = gpd.GeoDataFrame(geo, geometry='geometry', crs='epsg:%s' % epsg_code)
 
     # Fill NaN values with 0
     geo = geo.fillna(value=0)
@@ -392,5 +628,44 @@ def saveToShape(input_df, grid_df, output_path, tz_id_col_spatial, tz_id_col, ep
 
     return geo
 
+def saveLevels(zrop_hours, tz_levels, out_dir, out_prefix):
+    """ Roll up the ZROP of all hours to the target zone levels in <tz_levels> and save each level as .csv """
+    from target_zone_hierarchy import ZoneHierarchy, readParentMap
+
+    # All hours as one (target zones x hours) table
+    zrop = pd.concat(zrop_hours, axis=1).fillna(0)
+
+    hierarchy = ZoneHierarchy(dict((name, readParentMap(fp)) for name, fp in tz_levels.items()))
+    levels = hierarchy.rollUp(zrop.index.values, zrop.values, columns=list(zrop.columns))
+    for name, level in levels.items():
+        level.to_csv(os.path.join(out_dir, "%s_%s.csv" % (out_prefix, name)), index=False)
+    return levels
+
+def saveToCube(input_df, grid_df, cube_dir, scenario, time_window, tz_id_col_spatial, tz_id_col, epsg_code, lattice=None):
+    """
+    Save ZROP values of <time_window> (or a list of time windows) in <input_df> to the cube store in <cube_dir>,
+    the cube is created from the grid in <grid_df> if needed
+    """
+    from zrop_cube import createCube, writeZROP
+    from ykr_grid import calibrateLattice
+
+    if not os.path.exists(os.path.join(cube_dir, 'cube.json')):
+        ids = grid_df[tz_id_col_spatial].values
+        if lattice is None:
+            # Calibrate the YKR lattice from the cell centroids of the target zones
+            centroids = grid_df['geometry'].to_crs(epsg=epsg_code).centroid
+            lattice = calibrateLattice(ids, centroids.x.values, centroids.y.values)
+        createCube(cube_dir, lattice, ids)
+
+    writeZROP(cube_dir, scenario, input_df, time_window, tz_id_col=tz_id_col)
+
+
+def saveToGeoTiff(cube_dir, scenario, out_fp, time_window, epsg_code):
+    """ Save the time windows <time_window> of <scenario> in the cube store <cube_dir> as multi-band GeoTIFF """
+    from zrop_cube import writeGeoTiff
+
+    os.makedirs(os.path.dirname(out_fp) or '.', exist_ok=True)
+    writeGeoTiff(cube_dir, scenario, out_fp, times=list(time_window), epsg=epsg_code)
+
 if __name__ == "__main__":
     geo = main()    
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 16:20:33 2026
+
+Aim of this script:
+===================
+Segmented reductions used in the MFD method: sums and normalization of values by a key, e.g.
+per base station (SSFA/RFA, EHP), per grid cell (ZROP) or per building UID (multimatches in the
+floor area estimation).
+
+The keys are given as integer segment codes (e.g. from pd.factorize). Two backends are available:
+
+- 'numba': compiled loops. If the codes are sorted (e.g. the DPS layer is sorted by SITEID), the
+  segments are contiguous and are processed in parallel, otherwise the columns of the values are
+  processed in parallel.
+- 'numpy': np.add.at, used automatically when Numba is not installed.
+
+Both backends add the values of a segment one by one in the order of the rows, so they give
+identical results (also with NaN values, which propagate to the sum of their segment).
+
+Numba is imported only when a kernel is first used. The backend can be set with setBackend() or
+with the environment variable MFD_KERNELS ('numba', 'numpy' or 'auto').
+
+REQUIREMENTS:
+-------------
+numba (optional)
+
+"""
+import os
+
+import numpy as np
+
+# Selected backend and compiled kernels (created on first use)
+_backend = os.environ.get('MFD_KERNELS', 'auto')
+_numba_kernels = None
+
+
+def setBackend(backend='auto'):
+    """ Select the backend: 'numba', 'numpy' or 'auto' (numba if it is installed) """
+    global _backend
+    if backend not in ('auto', 'numba', 'numpy'):
+        raise ValueError("Unknown backend '%s', use 'auto', 'numba' or 'numpy'." % backend)
+    _backend = backend
+
+
+def buildNumbaKernels():
+    """ Compile the Numba kernels """
+    import numba
+
+    @numba.njit(parallel=True, cache=True)
+    def sortedSegmentSum(values, starts, ends, out):
+        # Contiguous segments of sorted rows, segments in parallel
+        for s in numba.prange(len(starts)):
+            for i in range(starts[s], ends[s]):
+                for j in range(values.shape[1]):
+                    out[s, j] += values[i, j]
+
+    @numba.njit(parallel=True, cache=True)
+    def columnSegmentSum(values, codes, out):
+        # Unsorted rows, columns in parallel
+        for j in numba.prange(values.shape[1]):
+            for i in range(values.shape[0]):
+                out[codes[i], j] += values[i, j]
+
+    return {'sorted': sortedSegmentSum, 'columns': columnSegmentSum}
+
+
+def activeBackend():
+    """ Name of the backend that is used """
+    global _numba_kernels
+    if _backend == 'numpy':
+        return 'numpy'
+    if _numba_kernels is None:
+        try:
+            _numba_kernels = buildNumbaKernels()
+        except ImportError:
+            if _backend == 'numba':
+                raise
+            _numba_kernels = False
+    return 'numba' if _numba_kernels else 'numpy'
+
+
+def segmentSum(values, codes, n_segments):
+    """
+    Sum the rows of <values> (n or n x k) by segment <codes> (integers 0 ... n_segments-1).
+    Returns an array of (n_segments) or (n_segments x k).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    codes = np.asarray(codes, dtype=np.int64)
+    # Missing keys (code -1 of pd.factorize) would be added to the last segment, they are masked by the callers
+    if len(codes) > 0 and (codes.min() < 0 or codes.max() >= n_segments):
+        raise ValueError("Segment codes should be within 0 ... %s, mask missing keys first." % (n_segments - 1))
+    flat = values.ndim == 1
+    values2d = np.ascontiguousarray(values.reshape(len(values), -1))
+
+    out = np.zeros((n_segments, values2d.shape[1]), dtype=np.float64)
+    if activeBackend() == 'numba':
+        if len(codes) == 0 or np.all(codes[1:] >= codes[:-1]):
+            segments = np.arange(n_segments)
+            _numba_kernels['sorted'](values2d, np.searchsorted(codes, segments, 'left'),
+                                     np.searchsorted(codes, segments, 'right'), out)
+        else:
+            _numba_kernels['columns'](values2d, codes, out)
+    else:
+        np.add.at(out, codes, values2d)
+
+    return out[:, 0] if flat else out
+
+
+def segmentNormalize(values, codes, n_segments, fill=0.0):
+    """
+    Divide the rows of <values> by the sum of their segment (scale 0.0 - 1.0 within each segment).
+    Rows of segments whose sum is 0 get <fill>.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    sums = segmentSum(values, codes, n_segments)[codes]
+    return np.divide(values, sums, out=np.full_like(values, fill), where=sums != 0)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:05:12 2026
+
+Aim of this script:
+===================
+Command line entry point for the stages of the MFD pipeline.
+
+Every stage is a module in this folder with a main() function whose keyword arguments are the
+input/output paths and parameters of the stage. Importing a stage module has no side effects,
+and the heavy dependencies (geopandas, scipy, matplotlib, osmium ...) are imported only inside
+the functions that need them, so a worker that runs one small stage only pays for what it uses.
+The module of a stage is imported only when the stage is run.
+
+Usage:
+===================
+    python mfd_pipeline.py <stage> [--<argument> <value> ...]
+    python mfd_pipeline.py <stage> --help   (lists the arguments of the stage and their defaults)
+
+e.g.
+    python mfd_pipeline.py interpolation --cdr_fp hourlymedian_HSPA_mon_thu_tz.xlsx --start_h 2 --end_h 4
+
+String arguments are passed as they are, other arguments (numbers, booleans, lists) are parsed
+as Python literals.
+
+"""
+import argparse
+import ast
+import importlib
+import inspect
+import sys
+
+# Stage name: (module, description)
+STAGES = {
+    'osm': ('osm_data_retrieval_and_processing', 'Retrieve and classify OSM buildings'),
+    'osm-pbf': ('osm_pbf_ingestion', 'Classify buildings from a local OSM extract'),
+    'buildings': ('creation_of_mfd_buildings', 'Join floor areas to the buildings'),
+    'dps': ('disaggregated_physical_surface_layer_prep_for_mfd', 'Prepare the disaggregated physical surface layer'),
+    'cdr': ('mobilephonedata_for_mfd', 'Aggregate mobile phone data to hourly medians'),
+    'cdr-stream': ('mobilephonedata_streaming', 'Aggregate mobile phone data in chunks'),
+    'cdr-parquet': ('mobilephonedata_parquet', 'Convert raw mobile phone data to a Parquet dataset'),
+    'cdr-append': ('mobilephonedata_incremental', 'Append new days of mobile phone data'),
+    'interpolation': ('mfd_interpolation', 'Run the MFD interpolation'),
+    'validation': ('validation', 'Validate the MFD results'),
+    'dag': ('pipeline_dag', 'Run all stages that are not up to date'),
+    'plan': ('cost_planner', 'Estimate runtime and memory of the pipeline stages (dry run)'),
+}
+
+
+def loadStage(stage):
+    """ Import the module of <stage> and return its main function """
+    module, description = STAGES[stage]
+    return importlib.import_module(module).main
+
+
+def parseValue(value, default):
+    """ Parse a command line value to the type of the <default> value """
+    if isinstance(default, str):
+        return value
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def stageParser(stage, func):
+    """ Argument parser built from the keyword arguments of the main function of <stage> """
+    parser = argparse.ArgumentParser(prog='mfd_pipeline.py %s' % stage, description=STAGES[stage][1])
+    for name, param in inspect.signature(func).parameters.items():
+        if param.default is inspect.Parameter.empty:
+            continue
+        parser.add_argument('--%s' % name, default=param.default,
+                            type=lambda value, default=param.default: parseValue(value, default),
+                            help='(default: %(default)s)')
+    return parser
+
+
+def runStage(stage, argv=[]):
+    """ Run <stage> with command line arguments <argv> and return the result of its main function """
+    func = loadStage(stage)
+    kwargs = vars(stageParser(stage, func).parse_args(argv))
+    return func(**kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stages of the MFD pipeline.')
+    subparsers = parser.add_subparsers(dest='stage', metavar='stage')
+    for stage, (module, description) in STAGES.items():
+        subparsers.add_parser(stage, help=description, add_help=False)
+
+    args, rest = parser.parse_known_args(argv)
+    if args.stage is None:
+        parser.print_help()
+        return 1
+
+    runStage(args.stage, rest)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,162 +10,185 @@ Clean and process mobile phone data for MFD interpolation
 Structure:
 ===================
 This code is divided into the following main parts:
- 
-1) reading in data 
+
+1) reading in data
 2) data cleaning
-3) creating temporal subsets
-4) aggregating data and creating data for cropping
-5) cropping data to study area extent
-6) aggregating cropped data 
-7) writing out processed mobile phone data
+3) assigning temporal subsets (day types and time steps)
+4) aggregating data for all day types and network indicators in one pass and creating data for cropping
+5) cropping aggregated data to study area extent
+6) writing out processed mobile phone data
+
+Input: unprocessed mobile phone data (.csv-file or Parquet dataset, see mobilephonedata_parquet.py)
+Output: cleaned mobile phone dataset (.csv-files)
 
-Input: unprocessed mobile phone data (.csv-file)
-Output: cleaned mobile phone dataset (.csv-file)
+Note: for raw data that does not fit into memory, the same outputs can be produced in chunks with
+mobilephonedata_streaming.py (approximate or exact medians).
 
 """
 
+import os
+
 import pandas as pd
-import numpy as np
-import geopandas as gpd
-import matplotlib.pyplot as plt
-from shapely.geometry import Point
-from fiona.crs import from_epsg
+
+from mobilephonedata_streaming import DAY_TYPES, KEY_COLS, assignDayType, pivotHourlyMedians
 
 #---------------------------------------------------------------------------
-# SET FILEPATHS
+# SET FILEPATHS AND PARAMETERS
 #---------------------------------------------------------------------------
 
-#input data - unprocessed mobile phone data
+#input data - unprocessed mobile phone data (csv-file or folder of a Parquet dataset)
 #--------------------------------
 fp = r'...\MobilePhoneData.csv'
 
+#network indicators (column in the data: short name used in output file names)
+#--------------------------------
+indicators = {'HSPA_CALLS': 'HSPA'}
+
+#day types as lists of weekdays (0=MON...6=SUN 0,1,2,3,4,5,6), mon_thu refers to Monday to Thursday
+#--------------------------------
+day_types = DAY_TYPES
+
+#length of the time steps in minutes (60 = hourly H0m ... H23m, 15 = 96 steps H0M00m, H0M15m ... H23M45m).
+#For sub-hourly steps the data needs a MINUTE column (start minute of the count within the hour), see time_axis.py
+#--------------------------------
+minutes = 60
+
 #optional steps for cropping data
 #--------------------------------
 #output data (optional) - non-cropped data to create voronoi polygons of the base stations
-out_hspa=r'...\hourlymedian_HSPA.csv'
+#(first %s is filled with the indicator name, second with the day type)
+out_hourly = r'...\hourlymedian_%s_%s.csv'
 #input data (optional) - shapefile that contains the base stations, whose voronoi polygons intersect MFD target zones
 fp_tzbs = r'...\bs_whose_voronoi_intersect_tz.shp'
 
-#output data - processed mobile phone data 
+#output data - processed mobile phone data
 #--------------------------------
-out_hspa_tz = r'...\hourlymedian_HSPA_tz.csv'
+#one wide table (BS * time steps) per network indicator and day type, ready for MFD interpolation
+out_hourly_tz = r'...\hourlymedian_%s_%s_tz.csv'
+#all network indicators and day types in one tidy table
+out_tidy_tz = r'...\hourlymedian_tidy_tz.csv'
 
 
 #---------------------------------------------------------------------------
 # 1. READ IN DATA
 #---------------------------------------------------------------------------
 
-#read in mobile phone data (mpd) as csv
-#---------------------------------------------------------------------------
-mpd = pd.read_csv(fp, sep=',') 
+def readMobilePhoneDataForMfd(fp, indicators, day_types, time_axis=None):
+    """ Read the columns of mobile phone data (mpd) that are needed from a csv-file or a Parquet dataset """
+    time_cols = ['HOUR'] if time_axis is None or time_axis.hourly else ['HOUR', 'MINUTE']
+    cols = ['SITEID', 'WEEKDAY'] + time_cols + ['X', 'Y'] + list(indicators.keys())
 
-#convert df to GeoDataFrame
-#---------------------------------------------------------------------------
-geometry = [Point(xy) for xy in zip(mpd.X, mpd.Y)]
-crs = {'init': 'epsg:3067'} #http://www.spatialreference.org/ref/epsg/3067/
-mpd_geo = gpd.GeoDataFrame(mpd, crs=crs, geometry=geometry)
-
-#Sort values by date
-#---------------------------------------------------------------------------
-#convert DATE_TIME (str) to datetime
-mpd_geo['DATE_TIME'] = pd.to_datetime(mpd_geo['DATE_TIME'].astype(str), format='%Y-%m-%d %H:%M:%S')
-#sort values ascending based on date
-mpd_geo = mpd_geo.sort_values(by='DATE_TIME') 
-#Drop and reset old index
-mpd_geo = mpd_geo.reset_index(drop=True)
+    if os.path.isdir(fp):
+        #read only the weekdays that belong to a day type from the Parquet dataset
+        from mobilephonedata_parquet import readMobilePhoneData
+        weekdays = sorted(set(day for days in day_types.values() for day in days))
+        return readMobilePhoneData(fp, weekdays=weekdays, columns=cols)
+    return pd.read_csv(fp, sep=',', usecols=cols)
 
 
 #---------------------------------------------------------------------------
 # (2. DATA CLEANING IF NOT DONE ALREADY)
 #---------------------------------------------------------------------------
-# this step depends on data used. 
+# this step depends on data used.
 
 
 #------------------------------------------------------------------------
-# 3. CREATE TEMPORAL SUBSETS 
+# 3. ASSIGN TEMPORAL SUBSETS
 #------------------------------------------------------------------------
 
-#create new df based on weekday (mon_thu refers to Monday to Thursday)
-#similar logic was used to create df for Saturday and Sunday
-mon_thu=mpd_geo.loc[mpd_geo['WEEKDAY']<4] #0=MON...6=SUN 0,1,2,3,4,5,6
+def assignTemporalSubsets(mpd, day_types, time_axis=None):
+    """
+    Assign day type for each row based on weekday, rows outside of the day types are dropped.
+    With a sub-hourly <time_axis> the time step (TIME_STEP) of each row is assigned from HOUR and MINUTE.
+    """
+    mpd['day_type'] = assignDayType(mpd['WEEKDAY'].values, day_types)
+    mpd = mpd.loc[mpd['day_type'].notnull()]
+    if time_axis is not None and not time_axis.hourly:
+        mpd = mpd.assign(TIME_STEP=time_axis.steps(mpd['HOUR'].values, mpd['MINUTE'].values))
+        mpd = mpd.loc[mpd['TIME_STEP'] >= 0]
+    return mpd
+
 
 #------------------------------------------------------------------------
-#4. AGGREGATE VALUES PER BS AND HOUR
+#4. AGGREGATE VALUES PER BS, DAY TYPE AND HOUR (OR TIME STEP)
 #---------------------------------------------
 
-aggregations = {"HSPA_CALLS":'median'}
-#execute aggregation - yields median value for each hour for each siteid
-hourlymedian_BSgroup=mon_thu.groupby(['SITEID','HOUR']).agg(aggregations).reset_index()
+def aggregateMedians(mpd, indicators, time_axis=None):
+    """ Median value of each network indicator for each day type and hour (time step) for each siteid """
+    keys = KEY_COLS if time_axis is None else ['SITEID', 'day_type', time_axis.time_col]
+    return mpd.groupby(keys, observed=True)[list(indicators.keys())].median().reset_index()
 
-#change axis (transpose to BS * 24 hour per network indicator)
-hourlymedian_HSPA=hourlymedian_BSgroup.pivot(index='SITEID',columns='HOUR',values='HSPA_CALLS').reset_index()
 
-#4B. JOIN GEOMETRY TO AGGREGATED HOURLY DF
+#4B. CREATE GEOMETRY FOR EACH BS
 #--------------------------------------------------------------
 
-#Create df with X,Y and geom for each unique BS in data
-bscoords= mon_thu[['SITEID','X','Y','geometry']].copy().drop_duplicates('SITEID')
+def baseStationPoints(mpd):
+    """ Create df with X,Y and geom for each unique BS in data (geometry is created once per BS) """
+    import geopandas as gpd
 
-#Create funtion for joining geometry to hourly df
-def joinCoordsToHourlyBsData(data):
-    return data.set_index('SITEID').join(bscoords.set_index('SITEID')).reset_index()
+    bscoords = mpd[['SITEID','X','Y']].drop_duplicates('SITEID')
+    return gpd.GeoDataFrame(bscoords, geometry=gpd.points_from_xy(bscoords['X'], bscoords['Y']), crs='epsg:3067')
 
-#Call joinCoordsToHourlyBsData function:
-hourlymedian_HSPA=joinCoordsToHourlyBsData(hourlymedian_HSPA)
 
+#Create function for changing axis (transpose to BS * time steps per network indicator) and joining geometry
+#Hour columns are named H0m, H1m ... H23m (or by the labels of the time steps) as expected by mfd_interpolation.py
+def hourlyTable(data, bscoords, indicator, day_type, time_axis=None):
+    return pivotHourlyMedians(data, bscoords, indicator, day_type, hour_labels=True, time_axis=time_axis)
 
-#4C.  WRITE OUT FILE FOR CREATING VORONOI POLYGONS (used for cropping the data)
-#--------------------------------------------------------------
 
-#write out file for creating voronoi polygons
-hourlymedian_HSPA.fillna(value=0).to_csv(out_hspa, sep=',', float_format="%.2f")
+def writeHourlyTables(data, bscoords, indicators, day_types, out_template, time_axis=None):
+    """ Write out one wide file per network indicator and day type """
+    for indicator, name in indicators.items():
+        for day_type in day_types.keys():
+            hourlyTable(data, bscoords, indicator, day_type, time_axis).fillna(value=0).to_csv(out_template % (name, day_type), sep=',', float_format="%.2f")
 
 
 #------------------------------------------------------------------------
 #5. CROP DATA TO STUDY AREA EXTENT
 #------------------------------------------------------------------------
 #The dataset created in previous step was used to calculate voronoi polygons in QGIS, followed by a spatial overlay analysis.
-#Those base stations (bs), whose voroinoi polygons intersect with the MFD target zones (tz) were stored in the following file.
-
-#read in shapefile that contains the base stations that intersect MFD target zones
-tzbs = gpd.read_file(fp_tzbs)
+#Those base stations (bs), whose voroinoi polygons intersect with the MFD target zones (tz) were stored in the file fp_tzbs.
 
-#write site id col contents to a list
-tz_siteid = tzbs['SITEID'].tolist()
+def cropToTargetZones(hourlymedian_BSgroup, fp_tzbs):
+    """
+    Keep only those rows that have matching siteid with the base stations that intersect MFD target zones
+    (the medians of a BS do not depend on other BSs, so the aggregated data does not need to be aggregated again)
+    """
+    import geopandas as gpd
 
-#save only those rows to new df that have matching siteid with list
-mon_thu_tz = mon_thu.loc[mon_thu['SITEID'].isin(tz_siteid)]
+    #write site id col contents to a list
+    tz_siteid = gpd.read_file(fp_tzbs)['SITEID'].tolist()
+    return hourlymedian_BSgroup.loc[hourlymedian_BSgroup['SITEID'].isin(tz_siteid)]
 
 
 #------------------------------------------------------------------------
-#6. AGGREGATE VALUES PER BS AND HOUR
-#---------------------------------------------
-
-aggregations = {"HSPA_CALLS":'median'}
+#6. WRITE OUT PROCESSED MOBILE PHONE DATA FOR MFD INTERPOLATION
+#------------------------------------------------------------------------
 
-#execute aggregation - yields median value for each hour for each siteid
-hourlymedian_BSgroup=mon_thu_tz.groupby(['SITEID','HOUR']).agg(aggregations).reset_index()
+def main(fp=fp, fp_tzbs=fp_tzbs, out_hourly=out_hourly, out_hourly_tz=out_hourly_tz, out_tidy_tz=out_tidy_tz,
+         indicators=indicators, day_types=day_types, minutes=minutes):
+    """ Process mobile phone data for MFD interpolation and write out the results. """
+    from time_axis import TimeAxis
+    time_axis = TimeAxis(minutes)
 
-#change axis (transpose to BS * 24 hour per network indicator)
-hourlymedian_HSPA_tz=hourlymedian_BSgroup.pivot(index='SITEID',columns='HOUR',values='HSPA_CALLS').reset_index()
+    mpd = readMobilePhoneDataForMfd(fp, indicators, day_types, time_axis)
+    mpd = assignTemporalSubsets(mpd, day_types, time_axis)
 
+    hourlymedian_BSgroup = aggregateMedians(mpd, indicators, time_axis)
+    bscoords = baseStationPoints(mpd)
 
-#6B. JOIN GEOMETRY TO AGGREGATED HOURLY DF
-#--------------------------------------------------------------
+    #write out files for creating voronoi polygons (used for cropping the data)
+    writeHourlyTables(hourlymedian_BSgroup, bscoords, indicators, day_types, out_hourly, time_axis)
 
-#Create df with X,Y and geom for each unique BS in data
-bscoords_tz= mon_thu_tz[['SITEID','X','Y','geometry']].copy().drop_duplicates('SITEID')
+    hourlymedian_BSgroup_tz = cropToTargetZones(hourlymedian_BSgroup, fp_tzbs)
 
-#Create funtion for joining geometry to hourly df
-def joinCoordsToHourlyBsData(data):
-    return data.set_index('SITEID').join(bscoords_tz.set_index('SITEID')).reset_index()
+    #write out tidy file with all network indicators and day types
+    hourlymedian_BSgroup_tz.to_csv(out_tidy_tz, sep=',', float_format="%.2f", index=False)
 
-#Call function:
-hourlymedian_HSPA_tz=joinCoordsToHourlyBsData(hourlymedian_HSPA_tz)
+    #write out one wide file per network indicator and day type
+    writeHourlyTables(hourlymedian_BSgroup_tz, bscoords, indicators, day_types, out_hourly_tz, time_axis)
+    return hourlymedian_BSgroup_tz
 
-#------------------------------------------------------------------------
-#7. WRITE OUT PROCESSED MOBILE PHONE DATA FOR MFD INTERPOLATION
-#------------------------------------------------------------------------
 
-#write out file
-hourlymedian_HSPA_tz.fillna(value=0).to_csv(out_hspa_tz, sep=',', float_format="%.2f")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
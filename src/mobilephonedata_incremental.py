@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 13:05:44 2026
+
+Aim of this script:
+===================
+Incremental update of the hourly medians of mobile phone data when new days of data arrive.
+
+Instead of processing the whole history of mobile phone data again, a compact state is kept on
+disk for each (SITEID, day type, HOUR), and new days of data are appended to it. Only the medians
+of the (SITEID, day type, HOUR) keys that are touched by the new data (or by expired data) are
+recalculated, so the cost of an update depends on the size of the new data.
+
+Two kinds of state are supported:
+
+- 'buffer': the raw values are kept in one part file per day. The medians are exact (the same as
+  in a full recompute, missing values are ignored), a day that is delivered again replaces its part
+  file, and a sliding window (e.g. last 56 days) can be used, in which case the part files of days
+  that fall out of the window are deleted. An update writes only the part files of the new days and
+  reads the parts of the window only for the affected keys.
+- 'histogram': the values of each key are kept as quantile sketches (see mobilephonedata_streaming.py).
+  The state does not grow with the number of days, but there is no sliding window and days can be
+  appended only once.
+
+Structure:
+===================
+1) reading in new days of data
+2) updating the state and expiring days outside of the sliding window
+3) recalculating the medians of the affected keys
+4) writing out the hourly medians for MFD interpolation
+
+State folder:
+    state.json          parameters and the dates in the state
+    values/DATE=<day>/part.parquet      raw values of one day ('buffer')
+    values.parquet      sketch counts ('histogram')
+    medians.parquet     current medians (tidy)
+    sites.parquet       coordinates of the base stations
+
+REQUIREMENTS:
+-------------
+pyarrow (for reading and writing Parquet)
+
+"""
+import os
+import json
+import shutil
+from datetime import date, timedelta
+
+import pandas as pd
+
+from mobilephonedata_streaming import (DAY_TYPES, KEY_COLS, QuantileSketch, assignDayType, readChunks,
+                                       pivotHourlyMedians)
+
+
+def createState(state_dir, indicators=['HSPA_CALLS'], day_types=DAY_TYPES, mode='buffer',
+                window_days=None, relative_accuracy=0.01):
+    """
+    Create an empty incremental state in <state_dir>. <window_days> (e.g. 56 for the last 8 weeks)
+    is supported only with mode 'buffer'.
+    """
+    if mode not in ('buffer', 'histogram'):
+        raise ValueError("Unknown mode '%s', use 'buffer' or 'histogram'." % mode)
+    if mode == 'histogram' and window_days is not None:
+        raise ValueError("A sliding window requires mode 'buffer'.")
+
+    if not os.path.exists(state_dir):
+        os.makedirs(state_dir)
+
+    params = {'indicators': list(indicators), 'day_types': day_types, 'mode': mode,
+              'window_days': window_days, 'relative_accuracy': relative_accuracy, 'dates': []}
+    writeParams(state_dir, params)
+    return params
+
+
+def readParams(state_dir):
+    with open(os.path.join(state_dir, 'state.json')) as f:
+        return json.load(f)
+
+
+def writeParams(state_dir, params):
+    fp = os.path.join(state_dir, 'state.json')
+    with open(fp + '.tmp', 'w') as f:
+        json.dump(params, f, indent=2)
+    os.replace(fp + '.tmp', fp)
+
+
+def readTable(state_dir, name):
+    """ Read a table of the state, returns None if it does not exist yet """
+    fp = os.path.join(state_dir, name + '.parquet')
+    if not os.path.exists(fp):
+        return None
+    df = pd.read_parquet(fp)
+    if 'day_type' in df.columns:
+        df['day_type'] = df['day_type'].astype(str)
+    return df
+
+
+def writeTable(state_dir, name, df):
+    """ Write a table of the state via a temporary file """
+    fp = os.path.join(state_dir, name + '.parquet')
+    df.to_parquet(fp + '.tmp', index=False)
+    os.replace(fp + '.tmp', fp)
+
+
+def dayFile(state_dir, day):
+    """ Part file of the raw values of <day> (hive style folder DATE=<day>) """
+    return os.path.join(state_dir, 'values', 'DATE=%s' % day, 'part.parquet')
+
+
+def writeDay(state_dir, day, df):
+    """ Write (or replace) the part file of <day> via a temporary file """
+    fp = dayFile(state_dir, day)
+    os.makedirs(os.path.dirname(fp), exist_ok=True)
+    df.to_parquet(fp + '.tmp', index=False)
+    os.replace(fp + '.tmp', fp)
+
+
+def readDays(state_dir, days, columns, keys=None):
+    """
+    Read the <columns> of the part files of <days>. With <keys> (DataFrame of key columns) only the
+    rows of these keys are returned (the base stations of the keys are pushed down to the reader).
+    """
+    filters = None if keys is None else [('SITEID', 'in', keys['SITEID'].unique().tolist())]
+    parts = []
+    for day in days:
+        fp = dayFile(state_dir, day)
+        if os.path.exists(fp):
+            parts.append(pd.read_parquet(fp, columns=columns, filters=filters))
+    if len(parts) == 0:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.concat(parts, ignore_index=True)
+    df['day_type'] = df['day_type'].astype(str)
+    if keys is not None:
+        df = df.merge(keys, on=KEY_COLS, how='inner')
+    return df
+
+
+def readNewDays(fp, indicators, day_types, chunksize=2000000, sep=','):
+    """
+    Read new days of raw mobile phone data (one row per record, with the DATE of the record).
+    Returns the values and the coordinates of the base stations.
+    """
+    cols = ['SITEID', 'DATE_TIME', 'WEEKDAY', 'HOUR', 'X', 'Y'] + list(indicators)
+    if os.path.isdir(fp):
+        # Parquet dataset has the date as partition key instead of the timestamp
+        cols = ['SITEID', 'DATE', 'WEEKDAY', 'HOUR', 'X', 'Y'] + list(indicators)
+
+    parts = []
+    site_parts = []
+    for chunk in readChunks(fp, cols, chunksize, sep=sep):
+        if 'DATE' not in chunk.columns:
+            chunk['DATE'] = chunk['DATE_TIME'].astype(str).str.slice(0, 10)
+        chunk['day_type'] = assignDayType(chunk['WEEKDAY'].values, day_types).astype(object)
+        chunk = chunk.loc[chunk['day_type'].notnull()]
+        site_parts.append(chunk[['SITEID', 'X', 'Y']].drop_duplicates('SITEID'))
+        parts.append(chunk[KEY_COLS + ['DATE'] + list(indicators)])
+
+    values = pd.concat(parts, ignore_index=True)
+    values['day_type'] = values['day_type'].astype(str)
+
+    # The raw records are kept as they are (missing values and several records of an hour), so that
+    # the medians are the same as in the full recompute (mobilephonedata_for_mfd.py)
+    sites = pd.concat(site_parts, ignore_index=True).drop_duplicates('SITEID')
+    return values, sites
+
+
+def appendDays(fp, state_dir, chunksize=2000000, sep=','):
+    """
+    Append the days of raw mobile phone data in <fp> (csv-file or Parquet dataset folder) to the
+    incremental state in <state_dir> and update the medians. Returns the updated medians (tidy), or the
+    current medians if <fp> has no days of the day types of the state.
+    """
+    params = readParams(state_dir)
+    indicators = params['indicators']
+
+    # 1. Read new days of data
+    new_values, new_sites = readNewDays(fp, indicators, params['day_types'], chunksize=chunksize, sep=sep)
+    new_dates = sorted(new_values['DATE'].unique().tolist())
+    if len(new_dates) == 0:
+        print("No days of the day types %s in %s, the state is not changed." % (sorted(params['day_types']), fp))
+        return readTable(state_dir, 'medians')
+    print("Appending %s days (%s - %s) ..." % (len(new_dates), new_dates[0], new_dates[-1]))
+
+    # 2-3. Update state and recalculate medians of the affected keys
+    if params['mode'] == 'buffer':
+        affected, medians_affected, dates = updateBuffers(state_dir, params, new_values, new_dates)
+    else:
+        affected, medians_affected, dates = updateHistograms(state_dir, params, new_values, new_dates)
+
+    # Patch the medians table: drop medians of the affected keys and add the recalculated ones
+    medians = readTable(state_dir, 'medians')
+    if medians is not None:
+        medians = medians.merge(affected, on=KEY_COLS, how='left', indicator=True)
+        medians = medians.loc[medians['_merge'] == 'left_only'].drop(columns=['_merge'])
+        medians = pd.concat([medians, medians_affected], ignore_index=True)
+    else:
+        medians = medians_affected
+    medians = medians.sort_values(KEY_COLS).reset_index(drop=True)
+
+    # Update coordinates of the base stations
+    sites = readTable(state_dir, 'sites')
+    sites = new_sites if sites is None else pd.concat([sites, new_sites]).drop_duplicates('SITEID', keep='last')
+
+    writeTable(state_dir, 'medians', medians)
+    writeTable(state_dir, 'sites', sites.reset_index(drop=True))
+    params['dates'] = dates
+    writeParams(state_dir, params)
+
+    return medians
+
+
+def updateBuffers(state_dir, params, new_values, new_dates):
+    """ Write the new days as part files, expire days outside of the window and recalculate affected medians """
+    indicators = params['indicators']
+    columns = KEY_COLS + list(indicators)
+
+    affected = [new_values[KEY_COLS]]
+    dates = sorted(set(params['dates']) | set(new_dates))
+
+    # A day that is delivered again replaces the earlier values
+    replaced = sorted(set(params['dates']) & set(new_dates))
+    affected.append(readDays(state_dir, replaced, KEY_COLS))
+
+    # Expire days that fall out of the sliding window
+    expired = []
+    if params['window_days'] is not None:
+        last = date.fromisoformat(dates[-1])
+        first = (last - timedelta(days=params['window_days'] - 1)).isoformat()
+        expired = [day for day in dates if day < first]
+        affected.append(readDays(state_dir, expired, KEY_COLS))
+        dates = [day for day in dates if day >= first]
+
+    affected = pd.concat(affected).drop_duplicates().reset_index(drop=True)
+
+    # Only the part files of the new and the expired days are touched
+    for day, day_values in new_values.groupby('DATE'):
+        if day in dates:
+            writeDay(state_dir, day, day_values[columns])
+    for day in expired:
+        shutil.rmtree(os.path.dirname(dayFile(state_dir, day)), ignore_errors=True)
+
+    # Recalculate medians only for the affected keys (from the days in the window)
+    subset = readDays(state_dir, dates, columns, keys=affected)
+    medians_affected = subset.groupby(KEY_COLS)[indicators].median().reset_index()
+
+    return affected, medians_affected, dates
+
+
+def updateHistograms(state_dir, params, new_values, new_dates):
+    """ Add new values to the quantile sketches and recalculate medians of the affected keys """
+    indicators = params['indicators']
+    already = sorted(set(new_dates) & set(params['dates']))
+    if len(already) > 0:
+        raise ValueError("Days %s are already in the state. Histogram state can not replace days, "
+                         "use mode 'buffer' for re-delivered data." % already)
+
+    counts = readTable(state_dir, 'values')
+    affected = new_values[KEY_COLS].drop_duplicates().reset_index(drop=True)
+
+    medians_affected = affected.copy()
+    updated = []
+    for ind in indicators:
+        sketch = QuantileSketch(params['relative_accuracy'])
+        if counts is not None:
+            old = counts.loc[counts['indicator'] == ind].drop(columns=['indicator'])
+            sketch.counts = old.set_index(KEY_COLS + ['bucket'])['count']
+        sketch.update(new_values[KEY_COLS], new_values[ind].values)
+        sketch._consolidate()
+
+        # Medians of the affected keys only
+        sub = QuantileSketch(params['relative_accuracy'])
+        key_index = pd.MultiIndex.from_frame(affected)
+        sub.counts = sketch.counts[sketch.counts.index.droplevel('bucket').isin(key_index)]
+        medians_affected = medians_affected.merge(sub.quantile(0.5).rename(ind).reset_index(), on=KEY_COLS, how='left')
+
+        table = sketch.counts.rename('count').reset_index()
+        table['indicator'] = ind
+        updated.append(table)
+
+    writeTable(state_dir, 'values', pd.concat(updated, ignore_index=True))
+    return affected, medians_affected, sorted(set(params['dates']) | set(new_dates))
+
+
+def writeHourlyMedians(state_dir, out_template, indicator_names=None, siteids=None):
+    """
+    Write the current medians as one wide table (BS * 24 hour) per network indicator and day type.
+    <out_template> is filled with the indicator name and the day type (e.g. r'...\\hourlymedian_%s_%s_tz.csv').
+    If <siteids> is given, only those base stations are written (crop to study area extent).
+    """
+    import geopandas as gpd
+
+    params = readParams(state_dir)
+    if indicator_names is None:
+        indicator_names = {ind: ind for ind in params['indicators']}
+
+    medians = readTable(state_dir, 'medians')
+    if siteids is not None:
+        medians = medians.loc[medians['SITEID'].isin(siteids)]
+
+    sites = readTable(state_dir, 'sites')
+    sites = gpd.GeoDataFrame(sites, geometry=gpd.points_from_xy(sites['X'], sites['Y']), crs='epsg:3067')
+
+    for indicator, name in indicator_names.items():
+        for day_type in params['day_types'].keys():
+            hourly = pivotHourlyMedians(medians, sites, indicator, day_type, hour_labels=True)
+            hourly.fillna(value=0).to_csv(out_template % (name, day_type), sep=',', float_format="%.2f")
+
+
+def main():
+    """ Append a new delivery of mobile phone data to the incremental state and write out updated hourly medians. """
+
+    #input data - new days of unprocessed mobile phone data
+    fp = r'...\MobilePhoneData_new_week.csv'
+
+    #folder of the incremental state
+    state_dir = r'...\MobilePhoneData_state'
+
+    #input data (optional) - shapefile that contains the base stations, whose voronoi polygons intersect MFD target zones
+    fp_tzbs = r'...\bs_whose_voronoi_intersect_tz.shp'
+
+    #output data - processed mobile phone data (indicator name and day type are added to the name)
+    out_hourly_tz = r'...\hourlymedian_%s_%s_tz.csv'
+
+    #create state on first run (medians over the last 8 weeks)
+    if not os.path.exists(os.path.join(state_dir, 'state.json')):
+        createState(state_dir, indicators=['HSPA_CALLS'], mode='buffer', window_days=56)
+
+    appendDays(fp, state_dir)
+
+    import geopandas as gpd
+    tz_siteid = gpd.read_file(fp_tzbs)['SITEID'].tolist()
+    writeHourlyMedians(state_dir, out_hourly_tz, indicator_names={'HSPA_CALLS': 'HSPA'}, siteids=tz_siteid)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:47:51 2026
+
+Aim of this script:
+===================
+Columnar, partitioned storage of raw mobile phone data.
+
+The raw csv-file is converted once into a Parquet dataset that is partitioned by date and weekday
+(hive style folders DATE=2018-03-05/WEEKDAY=0/...). Within the files SITEID is dictionary-encoded
+and the rows are sorted by SITEID, so that the row group statistics can be used for filtering
+base stations. Hours, minutes (of sub-hourly data) and weekdays are stored as 8-bit integers and network indicators as 32-bit
+floats.
+
+Temporal subsets (e.g. Monday to Thursday, WEEKDAY<4) and the crop to the base stations of the
+study area (SITEID.isin(tz_siteid)) are then pushed down to the reader as partition and row
+group filters, so only the relevant partitions are read.
+
+Structure:
+===================
+1) converting raw data in chunks to a partitioned Parquet dataset
+2) reading subsets of the dataset with partition and row group filters
+
+Input: unprocessed mobile phone data (.csv-file)
+Output: partitioned Parquet dataset (folder)
+
+REQUIREMENTS:
+-------------
+pyarrow
+
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Columns that are not network indicators
+BASE_COLS = ['SITEID', 'DATE_TIME', 'WEEKDAY', 'HOUR', 'MINUTE', 'X', 'Y']
+
+
+def partitionSchema():
+    """ Schema of the partition keys of the dataset """
+    import pyarrow as pa
+    return pa.schema([('DATE', pa.string()), ('WEEKDAY', pa.int8())])
+
+
+def convertCsvToParquet(fp, out_dir, indicators=None, chunksize=2000000, sep=',', row_group_size=250000):
+    """
+    Convert raw mobile phone data in <fp> into a Parquet dataset in <out_dir>, partitioned by
+    date and weekday. If <indicators> is None, all columns other than the base columns are
+    stored as network indicators.
+
+    Partitions of the same dates from an earlier conversion are replaced (other dates are kept), so
+    converting a file again does not duplicate its rows.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    file_format = ds.ParquetFileFormat()
+    file_options = file_format.make_write_options(use_dictionary=['SITEID'], compression='zstd')
+    partitioning = ds.partitioning(partitionSchema(), flavor='hive')
+
+    # Partitions written by this conversion (the chunks of one conversion add files to the same partitions)
+    written = set()
+
+    for i, chunk in enumerate(pd.read_csv(fp, sep=sep, chunksize=chunksize)):
+        if indicators is None:
+            indicators = [col for col in chunk.columns if col not in BASE_COLS]
+
+        # Date of the row as partition key (no need to parse the timestamps)
+        chunk['DATE'] = chunk['DATE_TIME'].astype(str).str.slice(0, 10)
+
+        # Compact numeric types
+        chunk['WEEKDAY'] = chunk['WEEKDAY'].astype(np.int8)
+        chunk['HOUR'] = chunk['HOUR'].astype(np.int8)
+        # Start minute of the count within the hour (only in sub-hourly data)
+        time_cols = ['HOUR', 'MINUTE'] if 'MINUTE' in chunk.columns else ['HOUR']
+        if 'MINUTE' in chunk.columns:
+            chunk['MINUTE'] = chunk['MINUTE'].astype(np.int8)
+        for ind in indicators:
+            chunk[ind] = chunk[ind].astype(np.float32)
+        if pd.api.types.is_integer_dtype(chunk['SITEID']):
+            chunk['SITEID'] = chunk['SITEID'].astype(np.int32)
+
+        # Sort by site so that row group statistics of SITEID are selective
+        chunk = chunk.sort_values(['DATE', 'WEEKDAY', 'SITEID'] + time_cols)
+        chunk = chunk[['SITEID'] + time_cols + ['X', 'Y'] + list(indicators) + ['DATE', 'WEEKDAY']]
+
+        # Remove the files of an earlier conversion from the partitions that this conversion writes first
+        for date, weekday in chunk[['DATE', 'WEEKDAY']].drop_duplicates().itertuples(index=False):
+            if (date, weekday) not in written:
+                shutil.rmtree(os.path.join(out_dir, 'DATE=%s' % date, 'WEEKDAY=%s' % weekday), ignore_errors=True)
+                written.add((date, weekday))
+
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        ds.write_dataset(table, out_dir, format=file_format, file_options=file_options,
+                         partitioning=partitioning, basename_template='part-%s-{i}.parquet' % i,
+                         max_rows_per_group=row_group_size, existing_data_behavior='overwrite_or_ignore')
+
+
+def datasetFilter(weekdays=None, dates=None, siteids=None):
+    """ Filter expression for the partition keys (weekdays, dates) and base stations (siteids) """
+    import pyarrow.dataset as ds
+
+    expr = None
+    for field, values in (('WEEKDAY', weekdays), ('DATE', dates), ('SITEID', siteids)):
+        if values is None:
+            continue
+        condition = ds.field(field).isin(list(values))
+        expr = condition if expr is None else expr & condition
+    return expr
+
+
+def openDataset(dataset_dir):
+    """ Open the partitioned Parquet dataset """
+    import pyarrow.dataset as ds
+    return ds.dataset(dataset_dir, format='parquet', partitioning=ds.partitioning(partitionSchema(), flavor='hive'))
+
+
+def readMobilePhoneData(dataset_dir, weekdays=None, dates=None, siteids=None, columns=None):
+    """
+    Read a subset of the Parquet dataset into a DataFrame. Only the partitions of <weekdays> and
+    <dates> are read, and row groups without any of <siteids> are skipped.
+    """
+    dataset = openDataset(dataset_dir)
+    table = dataset.to_table(columns=columns, filter=datasetFilter(weekdays, dates, siteids))
+    return table.to_pandas()
+
+
+def iterMobilePhoneData(dataset_dir, weekdays=None, dates=None, siteids=None, columns=None, batch_size=2000000):
+    """ Iterate over a subset of the Parquet dataset in DataFrame chunks of at most <batch_size> rows """
+    dataset = openDataset(dataset_dir)
+    scanner = dataset.scanner(columns=columns, filter=datasetFilter(weekdays, dates, siteids), batch_size=batch_size)
+    for batch in scanner.to_batches():
+        if batch.num_rows > 0:
+            yield batch.to_pandas()
+
+
+def main():
+    """ Convert raw mobile phone data into a partitioned Parquet dataset. """
+
+    #input data - unprocessed mobile phone data
+    fp = r'...\MobilePhoneData.csv'
+
+    #output folder for the Parquet dataset
+    out_dir = r'...\MobilePhoneData_parquet'
+
+    convertCsvToParquet(fp, out_dir)
+
+
+if __name__ == "__main__":
+    main()
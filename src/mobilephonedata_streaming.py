@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:02:18 2026
+
+Aim of this script:
+===================
+Chunked (streaming) processing of raw mobile phone data for MFD interpolation.
+
+The raw data (one row per base station and hour) is read in chunks, so the whole file never has
+to fit into memory. For each chunk the rows are assigned to a day type (e.g. Monday to Thursday)
+and the values of the network indicators are added into a quantile sketch that is kept per
+(SITEID, day type, HOUR). After the last chunk the hourly medians are read from the sketches.
+
+The sketch is a logarithmic histogram: values are counted in buckets whose width grows with the
+value, so that the median read from the sketch is within <relative_accuracy> of a value of the
+data (default 1 %). Zero counts are kept in their own bucket and are therefore exact. If the
+data fits in memory, the exact medians can be calculated instead (method='exact').
+
+Point geometry is created only once for each unique base station.
+
+Structure:
+===================
+1) reading in data in chunks and updating the per site/day type/hour sketches
+2) calculating hourly medians
+3) cropping data to study area extent (from the aggregated data)
+4) writing out processed mobile phone data
+
+Input: unprocessed mobile phone data (.csv-file or Parquet dataset, see mobilephonedata_parquet.py)
+Output: cleaned mobile phone dataset (.csv-file)
+
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# Day types as lists of weekdays (0=MON...6=SUN)
+DAY_TYPES = {'mon_thu': [0, 1, 2, 3], 'fri': [4], 'sat': [5], 'sun': [6]}
+
+# Bucket that is used for zero (and negative) values in the sketch
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+# Key columns of the aggregation
+KEY_COLS = ['SITEID', 'day_type', 'HOUR']
+
+
+def assignDayType(weekday, day_types=DAY_TYPES):
+    """
+    Assign a day type for each weekday value (0=MON...6=SUN).
+    Returns a categorical with the day type names, weekdays without a day type are set to NaN.
+    """
+    names = list(day_types.keys())
+
+    # Lookup table from weekday to day type code
+    lookup = np.full(7, -1, dtype=np.int8)
+    for code, name in enumerate(names):
+        lookup[day_types[name]] = code
+
+    codes = lookup[np.asarray(weekday, dtype=np.int64)]
+    return pd.Categorical.from_codes(codes, categories=names)
+
+
+class QuantileSketch(object):
+    """
+    Mergeable logarithmic histogram sketch for quantiles of many groups at once.
+    The counts are kept in a Series indexed by the group keys and the bucket number.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.counts = None
+        self._pending = []
+
+    def bucket(self, values):
+        """ Bucket number for each value """
+        values = np.asarray(values, dtype=np.float64)
+        buckets = np.full(len(values), ZERO_BUCKET, dtype=np.int64)
+        positive = values > 0
+        buckets[positive] = np.ceil(np.log(values[positive]) / self.log_gamma).astype(np.int64)
+        return buckets
+
+    def bucketValue(self, buckets):
+        """ Representative value of each bucket (relative error <= relative_accuracy) """
+        buckets = np.asarray(buckets, dtype=np.int64)
+        values = 2 * np.power(self.gamma, buckets.astype(np.float64)) / (self.gamma + 1)
+        return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+    def update(self, keys, values):
+        """ Add <values> of the groups in <keys> (DataFrame of key columns) to the sketch """
+        valid = ~np.isnan(np.asarray(values, dtype=np.float64))
+        df = keys.loc[valid].copy()
+        df['bucket'] = self.bucket(np.asarray(values, dtype=np.float64)[valid])
+        counts = df.groupby(list(df.columns), observed=True).size()
+        self._pending.append(counts)
+
+        # Consolidate pending chunk counts every now and then to keep the memory footprint low
+        if len(self._pending) >= 16:
+            self._consolidate()
+
+    def merge(self, other):
+        """ Merge the counts of another sketch into this one """
+        other._consolidate()
+        if other.counts is not None:
+            self._pending.append(other.counts)
+            self._consolidate()
+
+    def _consolidate(self):
+        parts = self._pending if self.counts is None else [self.counts] + self._pending
+        if len(parts) > 0:
+            counts = pd.concat(parts)
+            self.counts = counts.groupby(level=list(range(counts.index.nlevels)), observed=True).sum()
+        self._pending = []
+
+    def quantile(self, q=0.5):
+        """
+        Quantile <q> for each group as a Series. For the median of an even number of values,
+        the mean of the two middle values is returned (as in pandas).
+        """
+        self._consolidate()
+        counts = self.counts.sort_index()
+        key_levels = list(range(counts.index.nlevels - 1))
+
+        df = counts.rename('count').reset_index()
+        keys = list(df.columns[:-2])
+        df['cum'] = counts.groupby(level=key_levels, observed=True).cumsum().values
+        total = counts.groupby(level=key_levels, observed=True).transform('sum').values
+
+        # Zero based ranks of the values around the quantile
+        position = q * (total - 1)
+        lower = np.floor(position)
+        upper = np.ceil(position)
+
+        # The row whose bucket contains a given rank: cum - count <= rank < cum
+        start = df['cum'].values - df['count'].values
+        value = self.bucketValue(df['bucket'].values)
+        lower_value = np.where((start <= lower) & (lower < df['cum'].values), value, 0.0)
+        upper_value = np.where((start <= upper) & (upper < df['cum'].values), value, 0.0)
+
+        weight = position - lower
+        df['q'] = lower_value * (1 - weight) + upper_value * weight
+        return df.groupby(keys, observed=True)['q'].sum()
+
+
+def readChunks(fp, columns, chunksize, weekdays=None, siteids=None, sep=','):
+    """
+    Iterate over raw mobile phone data in chunks. <fp> is either a csv-file or a Parquet dataset
+    folder (see mobilephonedata_parquet.py), in which case <weekdays> and <siteids> are pushed
+    down to the reader as partition and row group filters.
+    """
+    if os.path.isdir(fp):
+        from mobilephonedata_parquet import iterMobilePhoneData
+        for chunk in iterMobilePhoneData(fp, weekdays=weekdays, siteids=siteids, columns=columns, batch_size=chunksize):
+            yield chunk
+        return
+
+    dtypes = {'WEEKDAY': np.int8, 'HOUR': np.int8}
+    for chunk in pd.read_csv(fp, sep=sep, usecols=columns, dtype=dtypes, chunksize=chunksize):
+        if siteids is not None:
+            chunk = chunk.loc[chunk['SITEID'].isin(siteids)]
+        yield chunk
+
+
+def aggregateHourlyMedians(fp, indicators=['HSPA_CALLS'], day_types=DAY_TYPES, method='sketch',
+                           chunksize=2000000, relative_accuracy=0.01, siteids=None, sep=','):
+    """
+    Read raw mobile phone data from <fp> (csv-file or Parquet dataset folder) in chunks of
+    <chunksize> rows and calculate the median of each indicator for each (SITEID, day type, HOUR).
+    If <siteids> is given, only those base stations are read.
+
+    <method> is either 'sketch' (approximate medians, memory depends only on the number of
+    sites, hours and distinct value buckets) or 'exact' (keeps the key and indicator columns of
+    all rows in memory).
+
+    Returns a tidy DataFrame (one row per SITEID, day type and HOUR, one column per indicator) and
+    a GeoDataFrame of the base stations.
+    """
+    usecols = ['SITEID', 'WEEKDAY', 'HOUR', 'X', 'Y'] + list(indicators)
+
+    # Only weekdays that belong to a day type need to be read
+    weekdays = sorted(set(day for days in day_types.values() for day in days))
+
+    sketches = {ind: QuantileSketch(relative_accuracy) for ind in indicators}
+    exact_parts = []
+    site_parts = []
+
+    for chunk in readChunks(fp, usecols, chunksize, weekdays=weekdays, siteids=siteids, sep=sep):
+        chunk['day_type'] = assignDayType(chunk['WEEKDAY'].values, day_types)
+        chunk = chunk.loc[chunk['day_type'].notnull()]
+
+        # Keep coordinates of each base station only once
+        site_parts.append(chunk[['SITEID', 'X', 'Y']].drop_duplicates('SITEID'))
+
+        if method == 'exact':
+            exact_parts.append(chunk[KEY_COLS + list(indicators)])
+        else:
+            for ind in indicators:
+                sketches[ind].update(chunk[KEY_COLS], chunk[ind].values)
+
+    if method == 'exact':
+        data = pd.concat(exact_parts, ignore_index=True)
+        medians = data.groupby(KEY_COLS, observed=True)[list(indicators)].median()
+    else:
+        medians = pd.concat([sketches[ind].quantile(0.5).rename(ind) for ind in indicators], axis=1)
+
+    medians = medians.reset_index()
+
+    # Create point geometry once per unique base station
+    import geopandas as gpd
+    sites = pd.concat(site_parts, ignore_index=True).drop_duplicates('SITEID')
+    sites = gpd.GeoDataFrame(sites, geometry=gpd.points_from_xy(sites['X'], sites['Y']), crs='epsg:3067')
+
+    return medians, sites
+
+
+def pivotHourlyMedians(medians, sites, indicator, day_type, hour_labels=False, time_axis=None):
+    """
+    Transpose the medians of <indicator> on <day_type> to one row per base station (BS * 24 hour)
+    and join the coordinates and geometry of the base stations.
+    If <hour_labels> is True, the hour columns are named H0m, H1m ... H23m as expected by mfd_interpolation.py.
+    With a sub-hourly <time_axis> (see time_axis.py) the medians are pivoted by the TIME_STEP column and
+    the columns are named by the labels of the steps (e.g. H9M15m).
+    """
+    time_col = time_axis.time_col if time_axis is not None else 'HOUR'
+    subset = medians.loc[medians['day_type'] == day_type]
+    hourly = subset.pivot(index='SITEID', columns=time_col, values=indicator).reset_index()
+    hourly.columns.name = None
+    if hour_labels and time_col == 'TIME_STEP':
+        step_labels = time_axis.labels('m')
+        hourly = hourly.rename(columns=lambda col: step_labels[col] if not isinstance(col, str) else col)
+    elif hour_labels:
+        hourly = hourly.rename(columns=lambda col: 'H%sm' % col if not isinstance(col, str) else col)
+    return hourly.set_index('SITEID').join(sites.set_index('SITEID')).reset_index()
+
+
+def main():
+    """ Aggregate raw mobile phone data in chunks and write out hourly medians for MFD interpolation. """
+    import geopandas as gpd
+
+    #input data - unprocessed mobile phone data
+    fp = r'...\MobilePhoneData.csv'
+
+    #output data (optional) - non-cropped data to create voronoi polygons of the base stations
+    out_hspa = r'...\hourlymedian_HSPA.csv'
+
+    #input data (optional) - shapefile that contains the base stations, whose voronoi polygons intersect MFD target zones
+    fp_tzbs = r'...\bs_whose_voronoi_intersect_tz.shp'
+
+    #output data - processed mobile phone data
+    out_hspa_tz = r'...\hourlymedian_HSPA_tz.csv'
+
+    #1-2. read data in chunks and aggregate values per BS, day type and hour
+    medians, sites = aggregateHourlyMedians(fp, indicators=['HSPA_CALLS'], method='sketch')
+
+    #write out non-cropped file for creating voronoi polygons
+    hourlymedian_HSPA = pivotHourlyMedians(medians, sites, 'HSPA_CALLS', 'mon_thu')
+    hourlymedian_HSPA.fillna(value=0).to_csv(out_hspa, sep=',', float_format="%.2f")
+
+    #3. crop the aggregated data to base stations whose voronoi polygons intersect target zones
+    tz_siteid = gpd.read_file(fp_tzbs)['SITEID'].tolist()
+    hourlymedian_HSPA_tz = hourlymedian_HSPA.loc[hourlymedian_HSPA['SITEID'].isin(tz_siteid)]
+
+    #4. write out processed mobile phone data
+    hourlymedian_HSPA_tz.fillna(value=0).to_csv(out_hspa_tz, sep=',', float_format="%.2f")
+
+
+if __name__ == "__main__":
+    main()
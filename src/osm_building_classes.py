@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:40 2026
+
+Aim of this script:
+===================
+Rule table based classification of OpenStreetMap (OSM) buildings into their estimated primary
+Activity Function Type (AFT).
+
+The rules are read from a table (osm_building_rules.csv) with one row per tag:
+
+    key, value, activity_type, priority
+
+A rule matches a building if the building has tag <key> with <value> ('*' matches any value).
+If several rules match, the one with the highest priority wins. Rules with an empty activity type
+mark tags that are known but not used (such buildings are dropped). Rules can be given for
+'building' as well as for e.g. 'amenity' and 'shop' tags, so new rules do not need code edits.
+
+The rule table is shared by the live OSM retrieval (osm_data_retrieval_and_processing.py) and the
+offline ingestion from local .osm.pbf extracts (osm_pbf_ingestion.py), so that both produce the
+same classification.
+
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# Default rule table
+RULES_FP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'osm_building_rules.csv')
+
+
+def readRules(fp=RULES_FP):
+    """ Read the tag --> activity type rule table """
+    rules = pd.read_csv(fp, comment='#', dtype={'key': str, 'value': str, 'activity_type': str},
+                        keep_default_na=False, skipinitialspace=True)
+    rules['priority'] = rules['priority'].astype(int)
+    return rules
+
+
+def compileRules(rules):
+    """
+    Compile the rule table into a dictionary {key: {value: (priority, activity_type)}}.
+
+    A tag that is listed several times takes the rule with the highest priority. Listing the same
+    tag for two different activity types with the same priority is ambiguous and raises an error.
+    """
+    compiled = {}
+    for row in rules.itertuples(index=False):
+        key_rules = compiled.setdefault(row.key, {})
+        current = key_rules.get(row.value)
+
+        if current is not None and current[0] == row.priority and current[1] != row.activity_type:
+            raise ValueError("Tag %s=%s is classified both as '%s' and '%s' with priority %s."
+                             % (row.key, row.value, current[1], row.activity_type, row.priority))
+
+        if current is None or row.priority > current[0]:
+            key_rules[row.value] = (row.priority, row.activity_type)
+
+    return compiled
+
+
+def classifyBuildings(df, compiled):
+    """
+    Classify buildings in <df> with the compiled rules.
+
+    Each tag column that has rules is evaluated once as a categorical: the rules are looked up for
+    the unique tag values only and broadcast to the rows through the category codes. The matching
+    rule with the highest priority wins (on equal priority, the key that comes first in the rules).
+
+    Returns the activity type of each row ("" if not classified) and the report of unmapped tags
+    {key: counts of the values of <key> that did not match any rule}, so that e.g. new 'building'
+    values are reported also when the building is classified by its amenity or shop tag.
+    """
+    n = len(df)
+    best_priority = np.full(n, -1, dtype=np.int64)
+    best_class = np.full(n, -1, dtype=np.int64)
+    unmapped = {}
+
+    # Activity types as integer codes
+    classes = sorted(set(at for key_rules in compiled.values() for _, at in key_rules.values() if at != ""))
+    class_codes = {at: i for i, at in enumerate(classes)}
+
+    for key, key_rules in compiled.items():
+        if key not in df.columns:
+            continue
+
+        cat = pd.Categorical(df[key])
+        wildcard = key_rules.get('*')
+
+        # Look up the rule of each unique tag value (last item is for missing values, code -1)
+        cat_known = np.zeros(len(cat.categories) + 1, dtype=bool)
+        cat_priority = np.full(len(cat.categories) + 1, -1, dtype=np.int64)
+        cat_class = np.full(len(cat.categories) + 1, -1, dtype=np.int64)
+        for i, value in enumerate(cat.categories):
+            rule = key_rules.get(value, wildcard)
+            if rule is None:
+                continue
+            cat_known[i] = True
+            # Empty activity type only marks a known tag, it never assigns a class
+            if rule[1] != "":
+                cat_priority[i] = rule[0]
+                cat_class[i] = class_codes[rule[1]]
+
+        row_priority = cat_priority[cat.codes]
+        row_class = cat_class[cat.codes]
+
+        # Values of this key without a rule (missing values are not reported)
+        unknown = ~cat_known[cat.codes] & (cat.codes >= 0)
+        unmapped[key] = df.loc[unknown, key].value_counts()
+
+        better = (row_class >= 0) & (row_priority > best_priority)
+        best_priority[better] = row_priority[better]
+        best_class[better] = row_class[better]
+
+    activity_type = np.array(classes + [""], dtype=object)[best_class]
+    activity_type = pd.Series(activity_type, index=df.index, name='activity_type')
+
+    return activity_type, unmapped
+
+
+def lookupActivityType(tags, compiled):
+    """
+    Classify a single building from its <tags> (a mapping such as osmium TagList).
+    Returns the activity type or None if the building is not classified.
+    """
+    best = None
+    for key, key_rules in compiled.items():
+        value = tags.get(key)
+        if value is None:
+            continue
+        rule = key_rules.get(value, key_rules.get('*'))
+        if rule is not None and rule[1] != "" and (best is None or rule[0] > best[0]):
+            best = rule
+    return None if best is None else best[1]
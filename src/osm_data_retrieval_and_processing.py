@@ -6,15 +6,15 @@ Author: Bergroth, Claudia
 
 Aim of this script:
 ===================
-Retrieval of OpenStreetMap (OSM) data for the MFD interpolation. 
+Retrieval of OpenStreetMap (OSM) data for the MFD interpolation.
 
-Using building data from OpenStreetMap, the building classification was expanded to cover also retail and service and transport activity function types, 
+Using building data from OpenStreetMap, the building classification was expanded to cover also retail and service and transport activity function types,
 which could not be extracted from the original building dataset.
 
 
 Structure:
 ===================
-This code is divided into 4 main parts: 
+This code is divided into 4 main parts:
 1) Retrieving building polygon data from OSM
 2) Classifying buildings based on their estimated primary Activity Function Type (AFT)
 3) Cropping data to study area extent
@@ -23,10 +23,11 @@ This code is divided into 4 main parts:
 Input: Study area extent (.shp-file)
 Output: Reclassified building dataset (.shp-file)
 
+Note: for reproducible, network-free runs the same output can be produced from a local .osm.pbf
+extract with osm_pbf_ingestion.py.
+
 """
-import osmnx as ox
-import geopandas as gpd
-from shapely.geometry import Point, Polygon
+from osm_building_classes import readRules, compileRules, classifyBuildings
 
 #------------------------------------------------------------
 '''SET FILEPATHS'''
@@ -36,6 +37,9 @@ from shapely.geometry import Point, Polygon
 fp_tz_wgs= r'...\targetzonesdissolve_wgs.shp'
 fp_tz_3067= r'...\targetzonesdissolve_3067.shp'
 
+#cache folder for the OSM tiles (a rerun only refetches tiles that are stale)
+osm_cache_dir = r'...\osm_tile_cache'
+
 #output paths
 out_buildings = r'...\osmnx_buildings_reclassified.shp'
 
@@ -44,106 +48,100 @@ out_buildings = r'...\osmnx_buildings_reclassified.shp'
 '''1. RETRIEVING BUILDING POLYGONS FROM OSM '''
 #------------------------------------------------------------
 
-#read in data
-study_area = gpd.read_file(fp_tz_wgs)
-study_area_3067 = gpd.read_file(fp_tz_3067)
+def retrieveBuildings(study_area, cache_dir):
+    """ Retrieve buildings from OSM within the study area polygon (in tiles of 0.05 degrees, max 4 parallel requests) """
+    from osm_tiled_retrieval import fetchBuildingsTiled
 
-#extract the geometry of the study area polygon to a variable
-polygon = study_area['geometry'].iloc[0]
+    #extract the geometry of the study area polygon to a variable
+    polygon = study_area['geometry'].iloc[0]
 
-#retrieve buildings from OSM within study area polygon
-buildings = ox.buildings_from_polygon(polygon)
-buildings['building'].value_counts()
+    buildings = fetchBuildingsTiled(polygon, cache_dir, tile_size=0.05, max_workers=4, max_age_days=30)
+    print(buildings['building'].value_counts())
+    return buildings
 
 
 #------------------------------------------------------------
 '''2. CLASSIFYING BUILDINGS '''
 #------------------------------------------------------------
 
-#create lists for building classification (values based on value counts)
-buildings_residential = ['residential', 'apartments', 'cabin', 'duplex','triplex', 
-                         'house', 'detached', 'semidetached_house', 'semi', 'prison', 
-                         'bungalow',  'hotel', 'hostel', 'dormitory', 'farm', 'garage',
-                         'manor', 'mansion', 'villa', 'estate', 'terrace', 'terraced']
-
-buildings_work = ['industrial', 'warehouse', 'school', 'office', 'public', 'civic',
-                  'public_building', 'childcare', 'education','townhouse', 
-                  'university', 'construction', 'utility', 'roundhouse', 'commercial', 'Commercial',
-                  'hospital', 'kindergarten', 'logistics', 'storage', 'PK-yritykset', 
-                  'hangar', 'gatehouse', 'greenhouse','glasshouse', 'farm_auxiliary', 
-                  'cowshed', 'barn', 'stable', 'silo', 'stables', 'guard_booth', 'guard', 'manufacture']
-
-buildings_service = ['retail', 'shop', 'mall', 'service', 'carwash', 'store', 
-                     'supermarket', 'kiosk']
-
-buildings_other = ['library', 'stadium', 'cafe', 'Cafe', 'sports_centre', 'swimming hall',
-                   'sauna', 'museum', 'sport', 'horse arena', 'event_space', 'pavilion', 'hall',
-                   'cathedral', 'church', 'chapel', 'social_facility', 'hut', 'shed', 'workshop', 
-                   'play_hut','playhut', 'manege', 'outhouse', 'bird_hide']
-
-buildings_transport =['parking', 'train_station', 'station', 'transportation', 'underground_entrance'] 
-
-buildings_irrelevant = ['yes', 'bunker', 'ruins', 'block','garages', 'garage_shed','bike_shed', 'carport',
-                        'tent', 'container', 'disused kiosk', 'atrium', 'basement',
-                        'canopy', 'roof', 'antenna', 'hidden', 'wall', 'cage',
-                        'transformer_tower', 'transformer',  'bridge', 'ship', 'barge', 
-                        'storage_tank', 'tank', 'tanks',  'garbage_shed', 'waste_disposal',
-                        'extension','foundations', 'hovel', 'shelter_entrance',
-                        'tunnelexit', 'tunnel_entry', 'underpass_entrance', 
-                        'entrance', 'tunnel_entrance?', 'passage', 'chimney', 
-                        'collapsed', 'tower', 'undefined', 'abandoned', 'burned',
-                        'interdimensional portal cabinet out of plywood']
-						
-
-#create new df and use lists to reclassify the rows
-reclassified_buildings = buildings
-
-#create new column that will later be used to store the new class (activity types)
-reclassified_buildings['activity_type']= ""
-
-#assign new column values based on list -column matches
-reclassified_buildings.loc[reclassified_buildings['building'].isin(buildings_transport), 'activity_type'] = 'transport'
-reclassified_buildings.loc[reclassified_buildings['building'].isin(buildings_residential), 'activity_type'] = 'residential'
-reclassified_buildings.loc[reclassified_buildings['building'].isin(buildings_service), 'activity_type'] = 'service'
-reclassified_buildings.loc[reclassified_buildings['building'].isin(buildings_work), 'activity_type'] = 'work'
-reclassified_buildings.loc[reclassified_buildings['building'].isin(buildings_other), 'activity_type'] = 'other'
-
-#calculate value counts for new classification
-reclassified_buildings['activity_type'].value_counts()
-
-#remove rows that were not classified
-reclassified_buildings = reclassified_buildings[reclassified_buildings.activity_type != ""]   
-
-#copy geometry column and old and new classification columns to new df
-reclassified_buildings_cleaned = reclassified_buildings[['activity_type', 'name','amenity', 'geometry', 'building']].copy()
+def reclassifyBuildings(buildings, rules=None):
+    """
+    Classify buildings into activity types and drop buildings that were not classified.
+    Rules for building classification (values based on value counts) are defined in osm_building_rules.csv
+    so that the offline ingestion in osm_pbf_ingestion.py uses the same classification.
+    """
+    if rules is None:
+        rules = compileRules(readRules())
+
+    #create new df and use rules to reclassify the rows
+    reclassified_buildings = buildings
+
+    #assign activity types based on the tag rules (single pass, highest priority rule wins)
+    reclassified_buildings['activity_type'], unmapped_tags = classifyBuildings(reclassified_buildings, rules)
+
+    #check building tags that are not covered by the rules (add new rules to osm_building_rules.csv if needed)
+    for key, counts in unmapped_tags.items():
+        if len(counts) > 0:
+            print("Unmapped %s tags:" % key)
+            print(counts)
+
+    #calculate value counts for new classification
+    print(reclassified_buildings['activity_type'].value_counts())
+
+    #remove rows that were not classified
+    reclassified_buildings = reclassified_buildings[reclassified_buildings.activity_type != ""]
+
+    #copy geometry column and old and new classification columns to new df
+    return reclassified_buildings[['activity_type', 'name','amenity', 'geometry', 'building']].copy()
+
 
 #------------------------------------------------------------
 '''3. CROPPING DATA TO STUDY AREA EXTENT '''
 #------------------------------------------------------------
 
-#save classified buildings to shp
-df_buildings = gpd.GeoDataFrame(reclassified_buildings_cleaned, geometry='geometry')
+def cropToStudyArea(buildings, study_area_3067):
+    """ Reproject classified buildings to EPSG:3067 and keep the ones that intersect the study area """
+    import geopandas as gpd
+
+    df_buildings = gpd.GeoDataFrame(buildings, geometry='geometry')
 
-#set native crs
-df_buildings.crs={'init':'epsg:4326'}
+    #set native crs
+    df_buildings = df_buildings.set_crs(epsg=4326, allow_override=True)
 
-#reproject study area and building layer to 3067
-df_buildings_3067=df_buildings.to_crs({'init': 'epsg:3067'})
-study_area_3067 = study_area_3067.to_crs({'init': 'epsg:3067'})
+    #reproject study area and building layer to 3067
+    df_buildings_3067 = df_buildings.to_crs(epsg=3067)
+    study_area_3067 = study_area_3067.to_crs(epsg=3067)
 
-#crop to study area extent
-df_buildings_clip = gpd.sjoin(df_buildings_3067, study_area_3067, how = "inner")
+    #crop to study area extent
+    df_buildings_clip = gpd.sjoin(df_buildings_3067, study_area_3067, how = "inner")
 
-#check value counts for clipped data
-df_buildings_clip['activity_type'].value_counts()
+    #check value counts for clipped data
+    print(df_buildings_clip['activity_type'].value_counts())
+
+    #drop unnecessary columns
+    return df_buildings_clip.drop(['x','y','YKR_ID','index_right'], axis=1, errors='ignore')
 
-#drop unnecessary columns
-df_buildings_clip = df_buildings_clip.drop(['x','y','YKR_ID','index_right'],axis=1)
 
 #------------------------------------------------------------
 '''4. WRITE OUT DATA '''
 #------------------------------------------------------------
 
-#write out buildings
-#-------------------------------------------------------------------------------
-df_buildings_clip.to_file(out_buildings) 
\ No newline at end of file
+def main(fp_tz_wgs=fp_tz_wgs, fp_tz_3067=fp_tz_3067, out_buildings=out_buildings, osm_cache_dir=osm_cache_dir):
+    """ Retrieve, classify and crop OSM buildings and write them out. """
+    import geopandas as gpd
+
+    #read in data
+    study_area = gpd.read_file(fp_tz_wgs)
+    study_area_3067 = gpd.read_file(fp_tz_3067)
+
+    buildings = retrieveBuildings(study_area, osm_cache_dir)
+    buildings = reclassifyBuildings(buildings)
+    df_buildings_clip = cropToStudyArea(buildings, study_area_3067)
+
+    #write out buildings
+    df_buildings_clip.to_file(out_buildings)
+    return df_buildings_clip
+
+
+if __name__ == "__main__":
+    main()
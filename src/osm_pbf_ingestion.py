@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:40:05 2026
+
+Aim of this script:
+===================
+Offline retrieval of OpenStreetMap (OSM) building data for the MFD interpolation from a local
+.osm.pbf extract (e.g. a country extract from Geofabrik).
+
+This is an alternative to the live Overpass retrieval in osm_data_retrieval_and_processing.py.
+The extract is streamed with pyosmium: building ways and multipolygon relations are assembled
+into areas, classified into Activity Function Types (AFT) and tested against the study area in
+the same pass. Only the buildings that are kept are held in memory, so also full-country
+extracts can be processed.
+
+
+Structure:
+===================
+This code is divided into 3 main parts:
+1) Streaming building areas from the .osm.pbf extract and classifying them on the fly
+2) Building geometries in bulk and cropping them to study area extent (batch by batch)
+3) Writing out cropped building data as shapefile
+
+Input: Study area extent (.shp-file), OSM extract (.osm.pbf-file)
+Output: Reclassified building dataset (.shp-file)
+
+REQUIREMENTS:
+-------------
+pyosmium (pip install osmium), geopandas and shapely >= 2.0
+
+"""
+import pandas as pd
+
+from osm_building_classes import readRules, compileRules, lookupActivityType
+
+
+def readBuildingsFromPbf(pbf_fp, study_area, rules=None, batch_size=50000, idx='flex_mem'):
+    """
+    Stream buildings from <pbf_fp>, classify them into activity types and keep the ones that
+    intersect <study_area>. Returns a GeoDataFrame in the projection of <study_area>.
+
+    <rules> is a compiled rule table (see osm_building_classes.py), by default the rules in
+    osm_building_rules.csv are used.
+
+    <batch_size> controls how many classified buildings are held as WKB before their geometries
+    are built and cropped. <idx> is the node location index used by osmium; for very large
+    extracts a file based index such as 'dense_file_array,nodes.idx' can be used.
+    """
+    import geopandas as gpd
+    import shapely
+
+    if rules is None:
+        rules = compileRules(readRules())
+
+    # Study area as a single geometry in its own projection
+    crs = study_area.crs
+    area_geom = shapely.union_all(study_area.geometry.values)
+    shapely.prepare(area_geom)
+
+    # Bounding box of the study area in WGS84 for a cheap pre-filter of each batch
+    minx, miny, maxx, maxy = study_area.to_crs(epsg=4326).total_bounds
+
+    handler = BuildingHandler(rules, batch_size=batch_size,
+                              flush=lambda batch: cropBatch(batch, area_geom, crs, (minx, miny, maxx, maxy)))
+    handler.apply_file(pbf_fp, locations=True, idx=idx)
+    handler.flushBatch()
+
+    if len(handler.kept) == 0:
+        return gpd.GeoDataFrame(columns=['activity_type', 'name', 'amenity', 'geometry', 'building'],
+                                geometry='geometry', crs=crs)
+
+    buildings = pd.concat(handler.kept, ignore_index=True)
+    return gpd.GeoDataFrame(buildings, geometry='geometry', crs=crs)
+
+
+class BuildingHandler(object):
+    """
+    Osmium handler that collects classified building areas as WKB in batches.
+    The actual osmium.SimpleHandler is created lazily so that importing this module does not
+    require pyosmium.
+    """
+
+    def __init__(self, rules, batch_size, flush):
+        self.rules = rules
+        self.batch_size = batch_size
+        self.flush = flush
+        self.kept = []
+        self._reset()
+
+    def _reset(self):
+        self.batch = {'activity_type': [], 'name': [], 'amenity': [], 'building': [], 'wkb': []}
+
+    def apply_file(self, pbf_fp, locations, idx):
+        import osmium
+
+        factory = osmium.geom.WKBFactory()
+        outer = self
+
+        class _Handler(osmium.SimpleHandler):
+
+            def area(self, a):
+                tag = a.tags.get('building')
+                if tag is None:
+                    return
+
+                # Classify in the same pass (the area is already assembled by osmium here, but the
+                # WKB of unclassified buildings is never built or held in memory)
+                activity_type = lookupActivityType(a.tags, outer.rules)
+                if activity_type is None:
+                    return
+
+                try:
+                    wkb = factory.create_multipolygon(a)
+                except RuntimeError:
+                    # Broken or incomplete geometries in the extract
+                    return
+
+                outer.batch['activity_type'].append(activity_type)
+                outer.batch['name'].append(a.tags.get('name'))
+                outer.batch['amenity'].append(a.tags.get('amenity'))
+                outer.batch['building'].append(tag)
+                outer.batch['wkb'].append(wkb)
+
+                if len(outer.batch['wkb']) >= outer.batch_size:
+                    outer.flushBatch()
+
+        _Handler().apply_file(pbf_fp, locations=locations, idx=idx)
+
+    def flushBatch(self):
+        """ Build the geometries of the current batch and keep the ones inside the study area """
+        if len(self.batch['wkb']) > 0:
+            kept = self.flush(self.batch)
+            if len(kept) > 0:
+                self.kept.append(kept)
+        self._reset()
+
+
+def cropBatch(batch, area_geom, crs, bbox):
+    """
+    Build geometries for a batch of buildings in bulk, reproject them to <crs> and return
+    the ones that intersect <area_geom>.
+    """
+    import geopandas as gpd
+    import shapely
+
+    geoms = shapely.from_wkb(batch['wkb'])
+
+    # Drop buildings outside of the study area bounding box before reprojecting
+    minx, miny, maxx, maxy = bbox
+    inside_bbox = shapely.intersects(geoms, shapely.box(minx, miny, maxx, maxy))
+
+    df = pd.DataFrame({'activity_type': batch['activity_type'],
+                       'name': batch['name'],
+                       'amenity': batch['amenity'],
+                       'building': batch['building']})
+    df = df.loc[inside_bbox]
+
+    geo = gpd.GeoDataFrame(df, geometry=geoms[inside_bbox], crs='epsg:4326').to_crs(crs)
+
+    # Crop to study area extent
+    geo = geo.loc[shapely.intersects(geo.geometry.values, area_geom)]
+
+    return geo[['activity_type', 'name', 'amenity', 'geometry', 'building']]
+
+
+def main():
+    """ Read buildings from a local OSM extract, classify and crop them, and write them out. """
+    import geopandas as gpd
+
+    # File paths
+    # ...........
+
+    # Local OSM extract
+    fp_pbf = r'...\finland-latest.osm.pbf'
+
+    # Study area extent
+    fp_tz_3067 = r'...\targetzonesdissolve_3067.shp'
+
+    # Output path
+    out_buildings = r'...\osmnx_buildings_reclassified.shp'
+
+    #read in study area and reproject to 3067
+    study_area_3067 = gpd.read_file(fp_tz_3067).to_crs(epsg=3067)
+
+    #stream, classify and crop buildings
+    buildings = readBuildingsFromPbf(fp_pbf, study_area_3067)
+
+    #check value counts for clipped data
+    print(buildings['activity_type'].value_counts())
+
+    #write out buildings
+    buildings.to_file(out_buildings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:21:37 2026
+
+Aim of this script:
+===================
+Tiled and cached retrieval of OpenStreetMap (OSM) building data from an Overpass API endpoint.
+
+Instead of sending one large request for the whole study area, the bounding box of the study
+area is split into fixed tiles (aligned to a regular lat/lon lattice). Each tile is fetched
+separately and cached on disk together with its query, the time of retrieval and the ETag of
+the response. Tiles are fetched concurrently with a bounded number of workers, and a rerun only
+refetches tiles whose cache entry is missing, stale or was made with a different query.
+Buildings that cross tile borders are returned by several tiles and are de-duplicated by their
+OSM type and id.
+
+The endpoint is given as a parameter, so the retrieval can be run against a local stand-in
+Overpass service as well.
+
+Output: GeoDataFrame of buildings (EPSG:4326) with 'building', 'name', 'amenity' and 'shop' tags
+
+"""
+import os
+import json
+import time
+import hashlib
+import http.client
+import urllib.request
+import urllib.error
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from math import floor, ceil
+
+# Default Overpass API endpoint
+OVERPASS_URL = 'https://overpass-api.de/api/interpreter'
+
+# Tags that are stored for each building
+BUILDING_TAGS = ['building', 'name', 'amenity', 'shop']
+
+
+def createTiles(polygon, tile_size=0.05):
+    """
+    Split the bounding box of <polygon> (EPSG:4326) into tiles of <tile_size> degrees and return
+    the (south, west, north, east) bounds of the tiles that intersect the polygon.
+    The tiles are aligned to a fixed lattice so that the same tiles (and cache entries) are
+    produced on every run.
+    """
+    from shapely.geometry import box
+
+    minx, miny, maxx, maxy = polygon.bounds
+    tiles = []
+    for i in range(int(floor(minx / tile_size)), int(ceil(maxx / tile_size))):
+        for j in range(int(floor(miny / tile_size)), int(ceil(maxy / tile_size))):
+            west, south = round(i * tile_size, 6), round(j * tile_size, 6)
+            east, north = round(west + tile_size, 6), round(south + tile_size, 6)
+            if polygon.intersects(box(west, south, east, north)):
+                tiles.append((south, west, north, east))
+    return tiles
+
+
+def buildTileQuery(tile, timeout=180):
+    """ Overpass QL query for building ways and multipolygon relations within <tile> """
+    bbox = '%s,%s,%s,%s' % tile
+    return ('[out:json][timeout:%s];\n'
+            '(\n'
+            '  way["building"](%s);\n'
+            '  relation["building"]["type"="multipolygon"](%s);\n'
+            ');\n'
+            'out tags geom;' % (timeout, bbox, bbox))
+
+
+def fetchTile(tile, cache_dir, overpass_url=OVERPASS_URL, max_age=30*24*3600, timeout=180, retries=3):
+    """
+    Return the Overpass elements of <tile>, using the cached response in <cache_dir> if it is
+    still valid. A cache entry is valid if it was made with the same query and is younger than
+    <max_age> seconds. A stale entry with an ETag is revalidated with the server, so an unchanged
+    tile is not downloaded again.
+    """
+    query = buildTileQuery(tile, timeout=timeout)
+    key = 'tile_%s_%s_%s_%s' % tile
+    data_fp = os.path.join(cache_dir, key + '.json')
+    meta_fp = os.path.join(cache_dir, key + '.meta.json')
+
+    meta = None
+    if os.path.exists(meta_fp) and os.path.exists(data_fp):
+        with open(meta_fp) as f:
+            meta = json.load(f)
+        # Cache made with another query is not usable
+        if meta.get('query') != query:
+            meta = None
+        elif time.time() - meta['timestamp'] < max_age:
+            return readCachedElements(data_fp)
+
+    request = urllib.request.Request(overpass_url, data=urllib.parse.urlencode({'data': query}).encode('utf-8'))
+    if meta is not None and meta.get('etag'):
+        request.add_header('If-None-Match', meta['etag'])
+
+    for attempt in range(retries):
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                content = response.read()
+                etag = response.headers.get('ETag')
+            break
+        except urllib.error.HTTPError as e:
+            # Not modified since last retrieval --> keep the cached data and refresh the timestamp
+            if e.code == 304 and meta is not None:
+                meta['timestamp'] = time.time()
+                writeJson(meta_fp, meta)
+                return readCachedElements(data_fp)
+            # Overpass is busy or the query timed out on the server --> wait and try again
+            if e.code in (429, 502, 503, 504) and attempt < retries - 1:
+                time.sleep(2 ** attempt * 5)
+                continue
+            raise
+        except (urllib.error.URLError, TimeoutError, ConnectionError, http.client.IncompleteRead):
+            # Client side timeout, a dropped connection or a truncated response --> wait and try again
+            if attempt < retries - 1:
+                time.sleep(2 ** attempt * 5)
+                continue
+            raise
+
+    # Write data before metadata so that an interrupted run never leaves a valid looking entry
+    tmp_fp = data_fp + '.tmp'
+    with open(tmp_fp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_fp, data_fp)
+    writeJson(meta_fp, {'query': query, 'timestamp': time.time(), 'etag': etag, 'url': overpass_url,
+                        'sha1': hashlib.sha1(content).hexdigest()})
+
+    return json.loads(content.decode('utf-8'))['elements']
+
+
+def readCachedElements(data_fp):
+    """ Read the elements of a cached Overpass response """
+    with open(data_fp, 'rb') as f:
+        return json.loads(f.read().decode('utf-8'))['elements']
+
+
+def writeJson(fp, data):
+    """ Write <data> as json to <fp> via a temporary file """
+    tmp_fp = fp + '.tmp'
+    with open(tmp_fp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_fp, fp)
+
+
+def elementGeometry(element):
+    """ Build a shapely geometry for an Overpass way or multipolygon relation (returned with 'out geom') """
+    from shapely.geometry import Polygon, LineString
+    from shapely.ops import polygonize, unary_union
+
+    if element['type'] == 'way':
+        coords = [(p['lon'], p['lat']) for p in element.get('geometry', [])]
+        # Only closed ways are building polygons
+        if len(coords) < 4 or coords[0] != coords[-1]:
+            return None
+        return Polygon(coords)
+
+    # Multipolygon relation: polygonize the outer and inner member ways separately
+    rings = {'outer': [], 'inner': []}
+    for member in element.get('members', []):
+        if member['type'] != 'way' or 'geometry' not in member:
+            continue
+        role = 'inner' if member.get('role') == 'inner' else 'outer'
+        coords = [(p['lon'], p['lat']) for p in member['geometry']]
+        if len(coords) >= 2:
+            rings[role].append(LineString(coords))
+
+    outer = unary_union(list(polygonize(unary_union(rings['outer'])))) if rings['outer'] else None
+    if outer is None or outer.is_empty:
+        return None
+    if rings['inner']:
+        outer = outer.difference(unary_union(list(polygonize(unary_union(rings['inner'])))))
+    return outer
+
+
+def elementsToGeoDataFrame(elements):
+    """ Convert Overpass elements into a GeoDataFrame of buildings (EPSG:4326) """
+    import geopandas as gpd
+
+    records = []
+    for element in elements:
+        geom = elementGeometry(element)
+        if geom is None:
+            continue
+        tags = element.get('tags', {})
+        record = {'osmid': element['id'], 'element_type': element['type'], 'geometry': geom}
+        for tag in BUILDING_TAGS:
+            record[tag] = tags.get(tag)
+        records.append(record)
+
+    columns = ['osmid', 'element_type'] + BUILDING_TAGS + ['geometry']
+    if len(records) == 0:
+        return gpd.GeoDataFrame(columns=columns, geometry='geometry', crs='epsg:4326')
+    return gpd.GeoDataFrame(records, columns=columns, geometry='geometry', crs='epsg:4326')
+
+
+def fetchBuildingsTiled(polygon, cache_dir, tile_size=0.05, max_workers=4, max_age_days=30,
+                        overpass_url=OVERPASS_URL, timeout=180):
+    """
+    Retrieve buildings within <polygon> (EPSG:4326) tile by tile.
+
+    Tiles are fetched with at most <max_workers> concurrent requests and cached in <cache_dir>.
+    Tiles cached less than <max_age_days> ago are read from the cache. Buildings returned by
+    several tiles are kept only once.
+    """
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    tiles = createTiles(polygon, tile_size=tile_size)
+    print("Retrieving buildings in %s tiles ..." % len(tiles))
+
+    def fetch(tile):
+        return fetchTile(tile, cache_dir, overpass_url=overpass_url, max_age=max_age_days*24*3600, timeout=timeout)
+
+    # Fetch tiles concurrently (bounded parallelism to avoid being rate limited)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tile_elements = list(executor.map(fetch, tiles))
+
+    # De-duplicate buildings that were returned by several tiles
+    elements = {}
+    for tile_result in tile_elements:
+        for element in tile_result:
+            elements[(element['type'], element['id'])] = element
+
+    return elementsToGeoDataFrame(elements.values())
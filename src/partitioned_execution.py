@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 10:02:31 2026
+
+Aim of this script:
+===================
+Running the interpolation and the preparation of the disaggregated physical surface layer (DPS) as
+partitioned tasks, e.g. for a national scenario sweep that does not fit on one machine.
+
+EHP and the relative weights (RFA, AW) are normalized within a source zone (base station), so all
+subunits of a site belong to the same task. The sites are partitioned:
+
+    'site'    contiguous SITEID ranges
+    'tile'    spatial tiles of <tile_size> meters (by the mean position of the subunits of each site),
+              so that the target zones of a task are mostly not shared with other tasks
+
+Both give partitions of about the same number of subunits. The tasks are run by an executor:
+
+    None / 'inline'     in the calling process (one task after another)
+    'process'           local process pool
+    'cluster'           local dask cluster on this machine (stand-in for a multi-node cluster)
+    'tcp://host:8786'   address of the scheduler of a dask cluster
+
+The input data of the tasks is shipped once per worker (pool initializer or a broadcast scatter to
+the dask workers), and the tasks get only their partition (site codes). The results of the tasks
+are partial sums by target zone, which are combined pairwise in a tree reduction (on the cluster
+workers with dask).
+
+Usage:
+    with newExecutor('process', max_workers=4) as executor:
+        executor.start(shared)
+        result = executor.reduce(addZoneSums, executor.map(task, partitions))
+
+REQUIREMENTS:
+-------------
+dask.distributed (only for the cluster executors)
+
+"""
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from mfd_kernels import segmentSum
+
+# Default tile size (meters) for the 'tile' partitions
+TILE_SIZE = 10000
+
+
+#------------------------------------------------------------
+'''1. PARTITIONS '''
+#------------------------------------------------------------
+
+def partitionSites(site_codes, n_sites, n_partitions, by='site', x=None, y=None, tile_size=TILE_SIZE):
+    """
+    Split the sites (codes 0 ... <n_sites> - 1 of the subunits, sorted by SITEID) into at most
+    <n_partitions> groups of about the same number of subunits. With <by> 'tile' the sites are
+    ordered by the tile of the mean subunit position <x>, <y> (subunits without a position (NaN) are
+    left out of the mean, sites without any position come last). Subunits without a site (code -1)
+    go with the first partition.
+    """
+    site_codes = np.asarray(site_codes)
+    valid = site_codes >= 0
+    sizes = np.bincount(site_codes[valid], minlength=n_sites)
+
+    if by == 'site':
+        order = np.arange(n_sites)
+    elif by == 'tile':
+        if x is None or y is None:
+            raise ValueError("Tile partitions need the positions of the subunits.")
+        xy = np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+        located = valid & np.isfinite(xy).all(axis=1)
+        n_located = np.bincount(site_codes[located], minlength=n_sites)
+        with np.errstate(invalid='ignore'):
+            anchors = segmentSum(xy[located], site_codes[located], n_sites) / n_located[:, None]
+        tile_x, tile_y = np.floor(anchors / tile_size).T
+        # Tiles row by row from north to south, sites in SITEID order within a tile
+        order = np.lexsort((np.arange(n_sites), tile_x, -tile_y))
+    else:
+        raise ValueError("Unknown partitioning '%s', use 'site' or 'tile'." % by)
+
+    cumulative = np.cumsum(sizes[order])
+    # A partition ends with the site at which its share of the subunits is reached
+    bounds = np.searchsorted(cumulative, cumulative[-1] * np.arange(1, n_partitions) / n_partitions) + 1 if n_sites else []
+    partitions = [part for part in np.split(order, np.unique(bounds)) if len(part) > 0]
+    if len(partitions) > 0 and not valid.all():
+        partitions[0] = np.append(partitions[0], -1)
+    return partitions
+
+
+def addZoneSums(a, b):
+    """ Sum of two partial results (zone ids (sorted), values by zone) """
+    ids = np.union1d(a[0], b[0])
+    values = np.zeros((len(ids),) + a[1].shape[1:], dtype=np.result_type(a[1], b[1]))
+    values[np.searchsorted(ids, a[0])] += a[1]
+    values[np.searchsorted(ids, b[0])] += b[1]
+    return ids, values
+
+
+def treeReduce(combine, items, submit=None):
+    """ Combine <items> pairwise level by level, with submit(combine, a, b) e.g. on cluster workers """
+    items = list(items)
+    if len(items) == 0:
+        raise ValueError("Nothing to reduce.")
+    while len(items) > 1:
+        pairs = [(items[i], items[i + 1]) for i in range(0, len(items) - 1, 2)]
+        combined = [combine(a, b) if submit is None else submit(combine, a, b) for a, b in pairs]
+        items = combined + items[len(pairs) * 2:]
+    return items[0]
+
+
+#------------------------------------------------------------
+'''2. EXECUTORS '''
+#------------------------------------------------------------
+
+# Input data of the tasks in a pool worker (set once per worker by the pool initializer)
+_shared = None
+
+
+def setShared(shared):
+    global _shared
+    _shared = shared
+
+
+def runShared(func, partition):
+    return func(_shared, partition)
+
+
+class LocalExecutor(object):
+    """ Tasks in the calling process (<mode> None) or in a local process pool (<mode> 'process') """
+
+    def __init__(self, mode=None, max_workers=None):
+        if mode not in (None, 'process'):
+            raise ValueError("Unknown mode '%s', use None or 'process'." % mode)
+        self.mode = mode
+        self.max_workers = max_workers
+        self.pool = None
+        self.shared = None
+
+    def start(self, shared):
+        """ Ship the input data <shared> of the tasks to the workers """
+        self.shared = shared
+        if self.mode == 'process':
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=setShared, initargs=(shared,))
+
+    def map(self, func, partitions):
+        """ Results of func(shared, partition) for all <partitions> """
+        if self.pool is None:
+            return [func(self.shared, partition) for partition in partitions]
+        futures = [self.pool.submit(runShared, func, partition) for partition in partitions]
+        return [future.result() for future in futures]
+
+    def gather(self, results):
+        return list(results)
+
+    def reduce(self, combine, results):
+        return treeReduce(combine, results)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ClusterExecutor(object):
+    """ Tasks on a dask cluster at <address>, or on a local cluster of <max_workers> processes """
+
+    def __init__(self, address=None, max_workers=None):
+        from dask.distributed import Client, LocalCluster
+
+        self.cluster = None
+        if address is None:
+            self.cluster = LocalCluster(n_workers=max_workers, threads_per_worker=1, processes=True)
+            address = self.cluster
+        self.client = Client(address)
+        self.shared = None
+
+    def start(self, shared):
+        """ Ship the input data <shared> of the tasks once to every worker """
+        # (in a list, a dictionary would be scattered as separate values)
+        self.shared = self.client.scatter([shared], broadcast=True)[0]
+
+    def map(self, func, partitions):
+        """ Futures of func(shared, partition) for all <partitions> """
+        return [self.client.submit(func, self.shared, partition, pure=False) for partition in partitions]
+
+    def gather(self, futures):
+        return self.client.gather(futures)
+
+    def reduce(self, combine, futures):
+        return treeReduce(combine, futures, submit=self.client.submit).result()
+
+    def close(self):
+        self.client.close()
+        if self.cluster is not None:
+            self.cluster.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def newExecutor(executor=None, max_workers=None):
+    """ Executor of the name or scheduler address <executor>, see the description of the script """
+    if executor is None or executor == 'inline':
+        return LocalExecutor(None)
+    if executor == 'process':
+        return LocalExecutor('process', max_workers=max_workers)
+    if executor == 'cluster':
+        return ClusterExecutor(None, max_workers=max_workers)
+    if '://' in executor:
+        return ClusterExecutor(executor)
+    raise ValueError("Unknown executor '%s', use 'inline', 'process', 'cluster' or a scheduler address." % executor)
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:12:37 2026
+
+Aim of this script:
+===================
+Run the stages of the MFD pipeline as a graph, and skip the stages whose outputs are up to date.
+
+Each stage declares the stage that it runs (see mfd_pipeline.py), its parameters, and its input
+and output files. The inputs and outputs are patterns that are filled with the parameters of the
+stage, e.g. '{dps_fp}', and in which '%s' placeholders (e.g. hour or day type of templated file
+names) match any text. The dependencies between the stages are derived from the patterns: a stage
+depends on the stages whose outputs it reads.
+
+Before a stage is run, a key is calculated from the content hashes of its input files, its
+parameters and the source code of its module (with the modules of this folder that it imports and
+their data files, e.g. the OSM rule table). The key and the hashes of the outputs are recorded
+in the state folder after the stage has finished. A stage is skipped if its key has not changed and
+its outputs still have the recorded hashes. So a change to the mobile phone data reruns only the
+CDR preparation and the stages downstream of it, not the building and overlay work.
+
+Stages whose dependencies are done are run concurrently in separate worker processes.
+
+Structure:
+===================
+1) resolving stage parameters, inputs and outputs and the dependencies between the stages
+2) hashing files, parameters and code
+3) running the stages that are not up to date in dependency order
+
+State folder:
+    <stage name>.json   key and output hashes of the last successful run of the stage
+    file_hashes.json    cache of file hashes by path, size and modification time
+
+"""
+import os
+import ast
+import glob
+import json
+import fnmatch
+import hashlib
+import importlib
+import inspect
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from mfd_pipeline import STAGES
+from cost_planner import recordBenchmark
+
+# Folder of the recorded stage states
+STATE_DIR = r'...\pipeline_state'
+
+# Default pipeline, stage parameters that are not given here use the defaults of the main() of the stage.
+# Manual steps (voronoi polygons and overlays in QGIS) are not part of the graph, their products are inputs.
+PIPELINE = [
+    {'name': 'osm', 'stage': 'osm',
+     'inputs': ['{fp_tz_wgs}', '{fp_tz_3067}'],
+     'outputs': ['{out_buildings}']},
+    {'name': 'buildings', 'stage': 'buildings',
+     'inputs': ['{fp_municipal}', '{fp_nls}'],
+     'outputs': ['{out}']},
+    {'name': 'dps', 'stage': 'dps',
+     'inputs': ['{fp_disaggregated_physica_surface}'],
+     'outputs': ['{out_raw}', '{out}'],
+     'after': ['osm', 'buildings']},
+    {'name': 'cdr', 'stage': 'cdr',
+     'inputs': ['{fp}', '{fp_tzbs}'],
+     'outputs': ['{out_hourly}', '{out_hourly_tz}', '{out_tidy_tz}']},
+    {'name': 'interpolation', 'stage': 'interpolation',
+     'params': {'cdr_fp': r'...\hourlymedian_HSPA_mon_thu_tz.csv',
+                'dps_fp': r'...\data\PhysicalSurfaceData\Disaggregated_physical_surface_250m.shp'},
+     'inputs': ['{hat_fp}', '{dps_fp}', '{cdr_fp}', '{tz_fp}'],
+     'outputs': [os.path.join('{out_dir}', '{out_prefix}_H%s.shp')]},
+    {'name': 'validation', 'stage': 'validation',
+     'params': {'fp_hspa': os.path.join(r'...\results', 'ZROP_results_HSPA_H%s.shp'), 'plot': False},
+     'inputs': ['{fp_val}', '{fp_hspa}'],
+     'outputs': ['{out_clusters}']},
+]
+
+# Folder of the pipeline scripts (code and data files of the stages)
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Extensions of the files that belong to a shapefile
+SHAPEFILE_PARTS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+
+#------------------------------------------------------------
+'''1. RESOLVING THE GRAPH '''
+#------------------------------------------------------------
+
+def stageDefaults(stage):
+    """ Default keyword arguments of the main() of <stage> (importing a stage module has no side effects) """
+    module, description = STAGES[stage]
+    main = importlib.import_module(module).main
+    return {name: param.default for name, param in inspect.signature(main).parameters.items()
+            if param.default is not inspect.Parameter.empty}
+
+
+def filePattern(template, params):
+    """ Fill <template> with the stage <params> and turn '%s' placeholders into wildcards """
+    return template.format(**params).replace('%s', '*')
+
+
+def resolvePipeline(pipeline=PIPELINE):
+    """
+    Resolve the parameters, input and output patterns of each stage of <pipeline> and the stages
+    that each stage depends on. Returns a dictionary {stage name: resolved stage}.
+    """
+    resolved = {}
+    for spec in pipeline:
+        params = stageDefaults(spec['stage'])
+        params.update(spec.get('params', {}))
+        resolved[spec['name']] = {'name': spec['name'],
+                                  'stage': spec['stage'],
+                                  'params': params,
+                                  'inputs': [filePattern(t, params) for t in spec.get('inputs', [])],
+                                  'outputs': [filePattern(t, params) for t in spec.get('outputs', [])],
+                                  'depends': set(spec.get('after', []))}
+
+    # A stage depends on the stages whose outputs match its inputs
+    for name, stage in resolved.items():
+        for other_name, other in resolved.items():
+            if other_name == name:
+                continue
+            for inp in stage['inputs']:
+                if any(fnmatch.fnmatch(inp, out) or fnmatch.fnmatch(out, inp) for out in other['outputs']):
+                    stage['depends'].add(other_name)
+
+    unknown = set.union(set(), *[stage['depends'] for stage in resolved.values()]) - set(resolved)
+    if unknown:
+        raise ValueError("Unknown stages in dependencies: %s" % ', '.join(sorted(unknown)))
+    return resolved
+
+
+def topologicalOrder(resolved):
+    """ Stage names in dependency order, raises ValueError for cyclic dependencies """
+    order, done = [], set()
+    remaining = dict((name, set(stage['depends'])) for name, stage in resolved.items())
+    while remaining:
+        ready = sorted(name for name, depends in remaining.items() if depends <= done)
+        if not ready:
+            raise ValueError("Cyclic dependencies between stages: %s" % ', '.join(sorted(remaining)))
+        for name in ready:
+            order.append(name)
+            done.add(name)
+            del remaining[name]
+    return order
+
+
+#------------------------------------------------------------
+'''2. HASHING '''
+#------------------------------------------------------------
+
+def matchFiles(pattern):
+    """ Files matching <pattern>, including the files of a shapefile and the files within a folder """
+    files = []
+    for path in sorted(glob.glob(pattern)):
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in sorted(names))
+        elif path.lower().endswith('.shp'):
+            stem = path[:-4]
+            files.extend(stem + ext for ext in SHAPEFILE_PARTS if os.path.exists(stem + ext))
+        else:
+            files.append(path)
+    return files
+
+
+class FileHasher(object):
+    """ Content hashes of files, cached by path, size and modification time """
+
+    def __init__(self, cache_fp=None):
+        self.cache_fp = cache_fp
+        self.cache = {}
+        if cache_fp is not None and os.path.exists(cache_fp):
+            with open(cache_fp) as f:
+                self.cache = json.load(f)
+
+    def fileHash(self, fp, block_size=2**20):
+        stat = os.stat(fp)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        cached = self.cache.get(fp)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        sha = hashlib.sha256()
+        with open(fp, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha.update(block)
+        self.cache[fp] = [stamp, sha.hexdigest()]
+        return sha.hexdigest()
+
+    def patternHashes(self, patterns):
+        """ {file: hash} of all files matching <patterns> """
+        return dict((fp, self.fileHash(fp)) for pattern in patterns for fp in matchFiles(pattern))
+
+    def save(self):
+        if self.cache_fp is not None:
+            tmp_fp = self.cache_fp + '.tmp'
+            with open(tmp_fp, 'w') as f:
+                json.dump(self.cache, f)
+            os.replace(tmp_fp, self.cache_fp)
+
+
+def localImports(module):
+    """ Names of the modules of this folder that <module> imports (also imports within functions) """
+    with open(os.path.join(SRC_DIR, module + '.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module is not None and node.level == 0:
+            names.add(node.module.split('.')[0])
+    return sorted(name for name in names if os.path.exists(os.path.join(SRC_DIR, name + '.py')))
+
+
+def codeFiles(module):
+    """
+    Source files of <module> and of the modules of this folder that it imports (transitively), and
+    the data files of this folder that their code refers to by name (e.g. the OSM rule table)
+    """
+    modules, pending = set(), [module]
+    while pending:
+        name = pending.pop()
+        if name not in modules:
+            modules.add(name)
+            pending.extend(localImports(name))
+
+    sources = dict((name, os.path.join(SRC_DIR, name + '.py')) for name in modules)
+    texts = []
+    for fp in sources.values():
+        with open(fp, encoding='utf-8') as f:
+            texts.append(f.read())
+    data = [fn for fn in os.listdir(SRC_DIR) if not fn.endswith(('.py', '.pyc')) and
+            os.path.isfile(os.path.join(SRC_DIR, fn)) and any(fn in text for text in texts)]
+    return sorted(sources.values()) + sorted(os.path.join(SRC_DIR, fn) for fn in data)
+
+
+def codeHash(stage):
+    """ Hash of the source code of the module of <stage>, the local modules it imports and their data files """
+    module, description = STAGES[stage]
+    sha = hashlib.sha256()
+    for fp in codeFiles(module):
+        sha.update(os.path.basename(fp).encode('utf-8'))
+        with open(fp, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def stageKey(stage, hasher):
+    """ Key of a stage from its input file hashes, parameters and code """
+    key = {'inputs': hasher.patternHashes(stage['inputs']),
+           'params': dict((k, repr(v)) for k, v in sorted(stage['params'].items())),
+           'code': codeHash(stage['stage'])}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def readStageState(state_dir, name):
+    fp = os.path.join(state_dir, '%s.json' % name)
+    if not os.path.exists(fp):
+        return None
+    with open(fp) as f:
+        return json.load(f)
+
+
+def writeStageState(state_dir, name, key, outputs):
+    fp = os.path.join(state_dir, '%s.json' % name)
+    with open(fp + '.tmp', 'w') as f:
+        json.dump({'key': key, 'outputs': outputs}, f, indent=2)
+    os.replace(fp + '.tmp', fp)
+
+
+def isUpToDate(stage, key, state, hasher):
+    """ A stage is up to date if its key is unchanged and its outputs exist with the recorded hashes """
+    if state is None or state['key'] != key or len(state['outputs']) == 0:
+        return False
+    return hasher.patternHashes(stage['outputs']) == state['outputs']
+
+
+#------------------------------------------------------------
+'''3. RUNNING THE STAGES '''
+#------------------------------------------------------------
+
+def runStageProcess(stage, params):
+    """ Run the main() of <stage> with <params> (in a worker process), returns the runtime (s) and peak memory (MB) """
+    from cost_planner import runMeasured
+    module, description = STAGES[stage]
+    return runMeasured(importlib.import_module(module).main, **params)
+
+
+def newExecutor(max_workers):
+    """ Process pool that starts a new process for each stage (Python >= 3.11, otherwise processes are reused) """
+    try:
+        return ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1)
+    except TypeError:
+        return ProcessPoolExecutor(max_workers=max_workers)
+
+
+def runPipeline(pipeline=PIPELINE, state_dir=STATE_DIR, max_workers=2, force=None, dry_run=False, memory_mb=16000):
+    """
+    Run the stages of <pipeline> that are not up to date. Stages in <force> are run in any case.
+    With <dry_run> the stages that would be run are only reported, with their estimated runtime and
+    memory within a budget of <memory_mb> (see cost_planner.py).
+
+    The runtime and peak memory of each stage that is run are recorded in <state_dir>\\benchmarks.jsonl
+    for calibrating the estimates. Each stage runs in a new worker process, so its peak memory is its own.
+
+    Returns a dictionary {stage name: 'skipped', 'run' or 'failed'}.
+    """
+    force = force or []
+    os.makedirs(state_dir, exist_ok=True)
+    resolved = resolvePipeline(pipeline)
+    order = topologicalOrder(resolved)
+    hasher = FileHasher(os.path.join(state_dir, 'file_hashes.json'))
+
+    status = {}
+    keys = {}
+    running = {}
+
+    def schedule(executor):
+        """ Submit (or skip) every stage whose dependencies are done """
+        for name in order:
+            stage = resolved[name]
+            if name in status or name in running.values() or not stage['depends'] <= set(status):
+                continue
+            if any(status[dep] in ('failed', 'blocked') for dep in stage['depends']):
+                status[name] = 'blocked'
+                continue
+
+            key = stageKey(stage, hasher)
+            # In a dry run the inputs of a stage downstream of a stage that would run are not updated
+            rerun = any(status[dep] == 'would run' for dep in stage['depends'])
+            if name not in force and not rerun and isUpToDate(stage, key, readStageState(state_dir, name), hasher):
+                print("%s: up to date" % name)
+                status[name] = 'skipped'
+            elif dry_run:
+                print("%s: would run" % name)
+                status[name] = 'would run'
+            else:
+                print("%s: running" % name)
+                keys[name] = key
+                running[executor.submit(runStageProcess, stage['stage'], stage['params'])] = name
+
+    with newExecutor(max_workers) as executor:
+        # Stages are visited in dependency order, so skipped stages make further stages ready in the same pass
+        schedule(executor)
+        while running:
+            done, pending = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    print("%s: failed (%s)" % (name, error))
+                    status[name] = 'failed'
+                else:
+                    writeStageState(state_dir, name, keys[name], hasher.patternHashes(resolved[name]['outputs']))
+                    status[name] = 'run'
+                    seconds, peak_mb = future.result()
+                    recordBenchmark(state_dir, resolved[name], seconds, peak_mb)
+            schedule(executor)
+
+    hasher.save()
+
+    if dry_run:
+        would_run = [name for name, result in status.items() if result == 'would run']
+        if would_run:
+            from cost_planner import planPipeline, printPlan
+            plan, workers = planPipeline(pipeline, state_dir=state_dir, memory_mb=memory_mb, stages=would_run)
+            printPlan(plan, workers, memory_mb)
+    return status
+
+
+def main(state_dir=STATE_DIR, max_workers=2, force=None, dry_run=False, memory_mb=16000):
+    """ Run the default pipeline. """
+    status = runPipeline(PIPELINE, state_dir=state_dir, max_workers=max_workers, force=force, dry_run=dry_run,
+                         memory_mb=memory_mb)
+    for name, result in status.items():
+        print("%s: %s" % (name, result))
+    return status
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 15:48:26 2026
+
+Aim of this script:
+===================
+Checkpoints of long MFD interpolation runs, so that a run that fails (e.g. disk full or a killed
+node) can be restarted without writing the finished outputs again.
+
+Each output unit of a run (e.g. the Shapefile of one scenario and hour, the cube scenario or the
+target zone levels) is recorded in a manifest with the content hashes of its files when its write
+has finished. A restarted run skips the units whose files still have the recorded hashes. Units
+that were not recorded, or whose files are missing or differ from the recorded hashes (e.g. a
+Shapefile that was only partly written), are written again.
+
+The manifest belongs to a run key calculated from the content hashes of the input files and the
+parameters of the run. If the inputs or parameters change, the manifest is started anew.
+
+Manifest (.json):
+    {"run_key": ..., "units": {unit name: {file: hash}}}
+
+"""
+import os
+import json
+import hashlib
+import threading
+
+from pipeline_dag import FileHasher
+
+
+def runKey(input_patterns, params, hasher=None):
+    """ Key of a run from the content hashes of the files matching <input_patterns> and the <params> dictionary """
+    hasher = hasher if hasher is not None else FileHasher()
+    key = {'inputs': hasher.patternHashes([pattern for pattern in input_patterns if pattern]),
+           'params': dict((k, repr(v)) for k, v in sorted(params.items()))}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def writeUnit(func, patterns, **kwargs):
+    """ Run the write task func(**kwargs) and return the hashes of its output files (run in the writer) """
+    func(**kwargs)
+    return FileHasher().patternHashes(patterns)
+
+
+class RunManifest(object):
+    """ Completed output units of the run <run_key>, stored in <fp> (without <resume> earlier units are discarded) """
+
+    def __init__(self, fp, run_key, resume=True):
+        self.fp = fp
+        self.run_key = run_key
+        self.units = {}
+        self.lock = threading.Lock()
+        if resume and os.path.exists(fp):
+            with open(fp) as f:
+                manifest = json.load(f)
+            if manifest.get('run_key') == run_key:
+                self.units = manifest['units']
+
+    def isComplete(self, unit, patterns):
+        """ The unit is complete if it was recorded and its files still have the recorded hashes """
+        recorded = self.units.get(unit)
+        return bool(recorded) and FileHasher().patternHashes(patterns) == recorded
+
+    def record(self, unit, hashes):
+        with self.lock:
+            self.units[unit] = hashes
+            self.save()
+
+    def save(self):
+        tmp_fp = self.fp + '.tmp'
+        with open(tmp_fp, 'w') as f:
+            json.dump({'run_key': self.run_key, 'units': self.units}, f, indent=2)
+        os.replace(tmp_fp, self.fp)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:31:50 2026
+
+Aim of this script:
+===================
+Spatial diagnostics of the interpolation error (e.g. the difference between the register based
+population and the MFD results, 'diff_hspa') on the YKR grid.
+
+A single global RMSE does not tell where the interpolation fails. This script calculates global
+and local Moran's I and the Getis-Ord Gi* hot spot statistic of the residual surface, and
+classifies each grid cell into a cluster (High-High, Low-Low, High-Low, Low-High) and into hot
+and cold spots.
+
+The spatial weights are a sparse contiguity matrix (rook or queen) that is derived directly from
+the YKR_IDs of the regular grid (see ykr_grid.py), so no polygon adjacency search is needed.
+All hours are processed at once: the residuals are a (cells x hours) array and the spatial lags
+of all hours are one sparse matrix product.
+
+Structure:
+===================
+1) building the contiguity matrix from the grid ids
+2) calculating global Moran's I for each hour
+3) calculating local Moran's I and Getis-Ord Gi* for each cell and hour
+4) classifying cells into clusters and hot spots
+
+Input: grid cell ids and (cells x hours) residuals
+Output: global statistics per hour (DataFrame), per cell cluster layer (DataFrame)
+
+"""
+import numpy as np
+import pandas as pd
+
+from ykr_grid import idsToRowCol, rowColToIds
+
+# Neighbour offsets (row, col) of the contiguity types
+NEIGHBOURS = {'rook': [(-1, 0), (1, 0), (0, -1), (0, 1)],
+              'queen': [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]}
+
+
+def contiguityWeights(ids, lattice, kind='queen'):
+    """
+    Binary contiguity matrix (cells x cells) of the grid cells <ids> in the order of <ids>.
+    Neighbours are looked up arithmetically from the row and column of each cell.
+    """
+    from scipy import sparse
+
+    ids = np.asarray(ids, dtype=np.int64)
+    n = len(ids)
+    rows, cols = idsToRowCol(ids, lattice)
+
+    # Sorted ids for looking up the position of the neighbour ids
+    order = np.argsort(ids)
+    sorted_ids = ids[order]
+
+    i_parts, j_parts = [], []
+    for dr, dc in NEIGHBOURS[kind]:
+        nb_cols = cols + dc
+        inside = (nb_cols >= 0) & (nb_cols < lattice['ncols'])
+        nb_ids = rowColToIds(rows + dr, nb_cols, lattice)
+
+        pos = np.minimum(np.searchsorted(sorted_ids, nb_ids), n - 1)
+        found = inside & (sorted_ids[pos] == nb_ids)
+
+        i_parts.append(np.nonzero(found)[0])
+        j_parts.append(order[pos[found]])
+
+    i = np.concatenate(i_parts)
+    j = np.concatenate(j_parts)
+    return sparse.csr_matrix((np.ones(len(i)), (i, j)), shape=(n, n))
+
+
+def rowStandardize(W):
+    """ Row standardize the weights (islands keep a row of zeros) """
+    from scipy import sparse
+
+    row_sums = np.asarray(W.sum(axis=1)).ravel()
+    scale = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)
+    return sparse.diags(scale) @ W
+
+
+def globalMoransI(W, values):
+    """
+    Global Moran's I of each column of (cells x k) <values> with (row standardized) weights <W>.
+    Returns a DataFrame with I, its expectation, z-score and p-value (normality assumption).
+    """
+    from scipy.special import ndtr
+
+    n = values.shape[0]
+    z = values - values.mean(axis=0)
+    lag = W @ z
+
+    S0 = W.sum()
+    I = n / S0 * (z * lag).sum(axis=0) / (z ** 2).sum(axis=0)
+
+    # Variance under normality assumption
+    WT = W + W.T
+    S1 = 0.5 * WT.multiply(WT).sum()
+    S2 = ((np.asarray(W.sum(axis=1)).ravel() + np.asarray(W.sum(axis=0)).ravel()) ** 2).sum()
+    EI = -1.0 / (n - 1)
+    VI = (n ** 2 * S1 - n * S2 + 3 * S0 ** 2) / ((n ** 2 - 1) * S0 ** 2) - EI ** 2
+
+    zI = (I - EI) / np.sqrt(VI)
+    return pd.DataFrame({'I': I, 'EI': EI, 'z': zI, 'p': 2 * ndtr(-np.abs(zI))})
+
+
+def localMoransI(W, values):
+    """
+    Local Moran's I of each cell for each column of (cells x k) <values> with row standardized
+    weights <W>. Returns I, z-scores (randomization assumption, Anselin 1995) and the spatial lags
+    of the deviations from the mean, all as (cells x k) arrays.
+    """
+    n = values.shape[0]
+    z = values - values.mean(axis=0)
+    lag = W @ z
+
+    m2 = (z ** 2).sum(axis=0) / n
+    m4 = (z ** 4).sum(axis=0) / n
+    b2 = m4 / m2 ** 2
+    I = z / m2 * lag
+
+    # Expectation and variance of each cell
+    wi = np.asarray(W.sum(axis=1)).ravel()[:, None]
+    wi2 = np.asarray(W.multiply(W).sum(axis=1)).ravel()[:, None]
+    EI = -wi / (n - 1)
+    VI = (wi2 * (n - b2) / (n - 1) + (wi ** 2 - wi2) * (2 * b2 - n) / ((n - 1) * (n - 2))
+          - wi ** 2 / (n - 1) ** 2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zI = (I - EI) / np.sqrt(VI)
+    return I, np.nan_to_num(zI), lag
+
+
+def getisOrdGiStar(W, values):
+    """
+    Getis-Ord Gi* z-score of each cell for each column of (cells x k) <values>.
+    <W> is the binary contiguity matrix, the cell itself is included in its neighbourhood.
+    """
+    from scipy import sparse
+
+    n = values.shape[0]
+    Ws = W + sparse.identity(n, format='csr')
+
+    wi = np.asarray(Ws.sum(axis=1)).ravel()[:, None]
+    s1i = np.asarray(Ws.multiply(Ws).sum(axis=1)).ravel()[:, None]
+
+    mean = values.mean(axis=0)
+    s = np.sqrt((values ** 2).mean(axis=0) - mean ** 2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        G = (Ws @ values - mean * wi) / (s * np.sqrt((n * s1i - wi ** 2) / (n - 1)))
+    return np.nan_to_num(G)
+
+
+def spatialDiagnostics(ids, values, lattice, labels=None, kind='queen', alpha=0.05):
+    """
+    Global and local spatial autocorrelation diagnostics of (cells x k) <values> (e.g. residuals of
+    each hour) on the grid cells <ids>. <labels> names the columns (e.g. hours).
+
+    Returns:
+    - global statistics (Moran's I) per column
+    - per cell cluster layer with columns <YKR_ID>, and for each column label: local Moran's I
+      ('LISA <label>'), cluster ('CL <label>': HH, LL, HL, LH or ns) and hot spot class
+      ('HS <label>': hot, cold or ns)
+    """
+    from scipy.special import ndtri
+
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    if labels is None:
+        labels = [str(i) for i in range(values.shape[1])]
+
+    # 1. Contiguity matrix from the grid ids
+    W = contiguityWeights(ids, lattice, kind=kind)
+    Wr = rowStandardize(W)
+
+    # 2. Global Moran's I
+    global_stats = globalMoransI(Wr, values)
+    global_stats.insert(0, 'label', labels)
+
+    # 3. Local statistics
+    I, zI, lag = localMoransI(Wr, values)
+    G = getisOrdGiStar(W, values)
+
+    # 4. Classification of significant cells
+    z_crit = ndtri(1 - alpha / 2)
+    dev = values - values.mean(axis=0)
+    significant = np.abs(zI) > z_crit
+
+    quadrant = np.select([(dev > 0) & (lag > 0), (dev < 0) & (lag < 0), (dev > 0) & (lag < 0), (dev < 0) & (lag > 0)],
+                         ['HH', 'LL', 'HL', 'LH'], default='ns')
+    cluster = np.where(significant, quadrant, 'ns')
+    hotspot = np.select([G > z_crit, G < -z_crit], ['hot', 'cold'], default='ns')
+
+    layer = {'YKR_ID': np.asarray(ids)}
+    for k, label in enumerate(labels):
+        layer['LISA %s' % label] = I[:, k]
+        layer['CL %s' % label] = cluster[:, k]
+        layer['HS %s' % label] = hotspot[:, k]
+
+    return global_stats, pd.DataFrame(layer)
+
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 11:05:52 2026
+
+Aim of this script:
+===================
+Subset runs of the MFD interpolation, e.g. one municipality (Espoo, Vantaa ...) after its local data
+has changed.
+
+A subset is given as a bounding box, a polygon or a list of municipality codes. From it:
+
+1) the target zones of the subset are resolved (grid cells that intersect the subset area, from the
+   YKR grid lattice arithmetically or from the target zone layer with a bbox read)
+2) the source zones (SITEIDs) are resolved whose subunits overlap these target zones. Only the
+   SITEID and YKR_ID columns of the disaggregated physical surface layer (DPS) are read for this.
+3) only the subunits of these SITEIDs are read from the DPS (all subunits of a site, also outside
+   of the subset, because EHP is normalized within the whole site)
+
+The RMP is still normalized with the totals of the whole mobile phone data, so the results of the
+target zones of the subset are the same as in a run of the whole area.
+
+Subset definitions (dictionary):
+    {'bbox': (minx, miny, maxx, maxy)}                  in EPSG:3067
+    {'polygon': r'...\area.shp'} or {'polygon': 'POLYGON ((...))'}
+    {'municipalities': [49, 92]}                        codes in the municipality layer
+
+REQUIREMENTS:
+-------------
+shapely >= 2.0, geopandas (only for reading polygon and municipality layers or the target zone layer)
+
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from ykr_grid import pointsToRowCol, rowColToIds, cellGeometries
+from dps_loader import readAttributes
+
+#(optional) municipality layer and its code column for municipality subsets
+fp_municipalities = r'...\data\TargetZones\municipalities.shp'
+municipality_col = 'KUNTA'
+
+
+#------------------------------------------------------------
+'''1. SUBSET AREA AND TARGET ZONES '''
+#------------------------------------------------------------
+
+def subsetGeometry(subset, fp_municipalities=fp_municipalities, municipality_col=municipality_col, epsg=3067):
+    """ Area of the <subset> definition as shapely geometry in EPSG:<epsg> """
+    import shapely
+
+    if 'bbox' in subset:
+        return shapely.box(*subset['bbox'])
+
+    import geopandas as gpd
+    if 'polygon' in subset:
+        polygon = subset['polygon']
+        if not os.path.exists(polygon):
+            return shapely.from_wkt(polygon)
+        return gpd.read_file(polygon).to_crs(epsg=epsg).union_all()
+
+    if 'municipalities' in subset:
+        codes = list(subset['municipalities'])
+        municipalities = gpd.read_file(fp_municipalities).to_crs(epsg=epsg)
+        selected = municipalities.loc[municipalities[municipality_col].isin(codes + [str(code) for code in codes])]
+        if len(selected) == 0:
+            raise ValueError("Municipalities %s not found in %s." % (codes, fp_municipalities))
+        return selected.union_all()
+
+    raise ValueError("Subset should have one of the keys 'bbox', 'polygon' or 'municipalities'.")
+
+
+def intersecting(geoms, area):
+    """ Mask of the <geoms> that share area with <area> (touching borders are not enough) """
+    import shapely
+    return shapely.intersects(geoms, area) & ~shapely.touches(geoms, area)
+
+
+def subsetZoneIds(area, lattice=None, tz_fp=None, tz_id_col='YKR_ID'):
+    """
+    Ids of the target zones that intersect <area>, from the grid <lattice> or from the target zone layer <tz_fp>.
+    The cells of the lattice are limited to its columns and to its rows (if the lattice has 'nrows').
+    """
+    if lattice is not None:
+        minx, miny, maxx, maxy = area.bounds
+        (row0, row1), (col0, col1) = pointsToRowCol([minx, maxx], [maxy, miny], lattice)
+        row1 = min(row1, lattice['nrows'] - 1) if 'nrows' in lattice else row1
+        rows, cols = np.mgrid[max(row0, 0):row1 + 1, max(col0, 0):min(col1, lattice['ncols'] - 1) + 1]
+        ids = rowColToIds(rows.ravel(), cols.ravel(), lattice)
+        return ids[intersecting(cellGeometries(ids, lattice), area)]
+
+    import geopandas as gpd
+    # Only the target zones within the bounds are read (uses the spatial index of the layer)
+    tz = gpd.read_file(tz_fp, bbox=area.bounds)
+    return tz.loc[intersecting(tz.geometry.values, area), tz_id_col].values
+
+
+#------------------------------------------------------------
+'''2. SOURCE ZONES AND 3. READING THE SUBSET '''
+#------------------------------------------------------------
+
+def subsetSites(dps_fp, zone_ids, sz_id_col='SITEID', tz_id_col='YKR_ID'):
+    """ Source zones (SITEIDs) of the DPS subunits in the target zones <zone_ids> """
+    keys = readAttributes(dps_fp, columns=[sz_id_col, tz_id_col], where={tz_id_col: zone_ids})
+    return pd.unique(keys[sz_id_col].dropna())
+
+
+def resolveSubset(subset, dps_fp, lattice=None, tz_fp=None, sz_id_col='SITEID', tz_id_col='YKR_ID', **kwargs):
+    """
+    Target zone ids and source zone ids (SITEIDs) of the <subset> definition.
+    <kwargs> are passed to subsetGeometry (municipality layer and code column).
+    """
+    area = subsetGeometry(subset, **kwargs)
+    zone_ids = subsetZoneIds(area, lattice=lattice, tz_fp=tz_fp, tz_id_col=tz_id_col)
+    site_ids = subsetSites(dps_fp, zone_ids, sz_id_col=sz_id_col, tz_id_col=tz_id_col)
+    return area, zone_ids, site_ids
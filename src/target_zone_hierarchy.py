@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 13:22:48 2026
+
+Aim of this script:
+===================
+Aggregation of the MFD interpolation results (ZROP) from the finest target zones (250 m YKR grid)
+to any number of coarser levels (e.g. 1 km grid, postal code areas, municipalities) in one run.
+
+Each coarser level is described by a parent map: a table of (child_id, parent_id, weight), where
+child_id is a zone of the finest level and weight is the share of the child that belongs to the
+parent. For levels that nest (e.g. 250 m cells in 1 km cells) the weight is 1, for zones that do not
+nest (e.g. grid cells on the border of two postal code areas) the child is split by area.
+
+The parent maps are turned once into sparse (parents x children) matrices, and the results of all
+hours of all levels are then one sparse matrix product per level.
+
+Structure:
+===================
+1) creating parent maps (grid blocks arithmetically, other zones by area weighted overlay)
+2) building sparse aggregation matrices
+3) rolling up the finest level to all levels
+
+Input: ZROP of the finest level, parent maps (.csv-files with columns child_id, parent_id, weight)
+Output: ZROP of each level (DataFrame)
+
+"""
+import numpy as np
+import pandas as pd
+
+from ykr_grid import idsToRowCol, rowColToIds
+
+PARENT_MAP_COLS = ['child_id', 'parent_id', 'weight']
+
+
+#------------------------------------------------------------
+'''1. PARENT MAPS '''
+#------------------------------------------------------------
+
+def gridParentMap(ids, lattice, factor=4):
+    """
+    Parent map from YKR cells <ids> to a coarser grid of <factor> x <factor> cells (4 --> 1 km grid).
+    The cells of the coarser grid are numbered row by row like the YKR grid (first cell 1), see
+    coarseLattice().
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    rows, cols = idsToRowCol(ids, lattice)
+    parents = rowColToIds(rows // factor, cols // factor, coarseLattice(lattice, factor))
+    return pd.DataFrame({'child_id': ids, 'parent_id': parents, 'weight': 1.0})
+
+
+def coarseLattice(lattice, factor):
+    """ Lattice of the grid of <factor> x <factor> cells aligned with <lattice> """
+    return {'x0': lattice['x0'], 'y0': lattice['y0'], 'cell_size': lattice['cell_size'] * factor,
+            'ncols': -(-lattice['ncols'] // factor), 'first_id': 1}
+
+
+def overlayParentMap(children, zones, child_id_col='YKR_ID', zone_id_col='ID'):
+    """
+    Parent map from the polygons of <children> to the polygons of <zones> (GeoDataFrames in the same
+    projection). Children that are split by zone borders are shared by area; children that are only
+    partly covered by zones lose the share outside of the zones.
+    """
+    import geopandas as gpd
+
+    children = children[[child_id_col, 'geometry']].copy()
+    children['child_area'] = children.geometry.area
+
+    parts = gpd.overlay(children, zones[[zone_id_col, 'geometry']], how='intersection', keep_geom_type=True)
+    weight = parts.geometry.area / parts['child_area']
+
+    parent_map = pd.DataFrame({'child_id': parts[child_id_col].values,
+                               'parent_id': parts[zone_id_col].values,
+                               'weight': weight.values})
+    return parent_map.groupby(['child_id', 'parent_id'], as_index=False)['weight'].sum()
+
+
+def composeParentMaps(lower, upper):
+    """
+    Parent map from the children of <lower> to the parents of <upper>, where the parents of <lower>
+    are the children of <upper> (e.g. 250 m --> postal code area and postal code area --> municipality).
+    """
+    composed = lower.merge(upper, left_on='parent_id', right_on='child_id', suffixes=('', '_upper'))
+    composed = pd.DataFrame({'child_id': composed['child_id'],
+                             'parent_id': composed['parent_id_upper'],
+                             'weight': composed['weight'] * composed['weight_upper']})
+    return composed.groupby(['child_id', 'parent_id'], as_index=False)['weight'].sum()
+
+
+def readParentMap(fp):
+    return pd.read_csv(fp, usecols=PARENT_MAP_COLS)
+
+
+def writeParentMap(parent_map, fp):
+    parent_map[PARENT_MAP_COLS].to_csv(fp, index=False)
+
+
+#------------------------------------------------------------
+'''2. AGGREGATION MATRICES AND 3. ROLL UP '''
+#------------------------------------------------------------
+
+class ZoneHierarchy(object):
+    """
+    Sparse aggregation matrices of all levels of a target zone hierarchy. <levels> is a dictionary
+    {level name: parent map from the finest level}. The finest level itself can be included with
+    an identity parent map or left out.
+    """
+
+    def __init__(self, levels):
+        from scipy import sparse
+
+        child_ids = np.unique(np.concatenate([np.asarray(pm['child_id']) for pm in levels.values()]))
+        self.child_ids = child_ids
+        self.levels = {}
+        for name, parent_map in levels.items():
+            parent_ids, parents = np.unique(np.asarray(parent_map['parent_id']), return_inverse=True)
+            children = np.searchsorted(child_ids, np.asarray(parent_map['child_id']))
+            matrix = sparse.csr_matrix((np.asarray(parent_map['weight'], dtype=np.float64), (parents, children)),
+                                       shape=(len(parent_ids), len(child_ids)))
+            self.levels[name] = (parent_ids, matrix)
+
+    def align(self, ids, values):
+        """ Values (cells x k) of the cells <ids> aligned to the children of the hierarchy (0 for missing cells) """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        pos = np.searchsorted(self.child_ids, ids)
+        pos_clipped = np.minimum(pos, len(self.child_ids) - 1)
+        known = self.child_ids[pos_clipped] == ids
+
+        aligned = np.zeros((len(self.child_ids), values.shape[1]), dtype=np.float64)
+        aligned[pos_clipped[known]] = values[known]
+        return aligned
+
+    def rollUp(self, ids, values, columns=None):
+        """
+        Aggregate the (cells x k) <values> of the finest level cells <ids> to all levels.
+        Returns a dictionary {level name: DataFrame with columns zone_id and <columns>}.
+        """
+        aligned = self.align(ids, values)
+        if columns is None:
+            columns = list(range(aligned.shape[1]))
+
+        results = {}
+        for name, (parent_ids, matrix) in self.levels.items():
+            result = pd.DataFrame(matrix @ aligned, columns=columns)
+            result.insert(0, 'zone_id', parent_ids)
+            results[name] = result
+        return results
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 13:37:14 2026
+
+Aim of this script:
+===================
+Time axis of the MFD method: the time steps (bins) of a day that are used in the mobile phone data,
+the time use data and the interpolation.
+
+The hourly axis of the original method (H0 ... H23) is the default. Finer bins (e.g. 15 minute
+counts, 96 steps per day) or coarser bins are described by their length in minutes. Each step has
+a label that is used in the column names of the data:
+
+    hourly steps      H9      -->  H9m (mobile phone data), H9t (time use), ZROP H9
+    15 minute steps   H9M00, H9M15 ...  -->  H9M15m, H9M15t, ZROP H9M15
+
+The time use data gives hourly factors. For other bins the factors are interpolated linearly
+between the hour midpoints (over midnight) to the midpoint of each bin, so for the hourly axis the
+factors are unchanged and a two hour bin gets the mean of its hours.
+
+All steps are handled as one array axis (steps are columns), so a finer axis makes the arrays
+wider but does not add loops over the steps.
+
+"""
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class TimeAxis(object):
+    """ Time steps of <minutes> from minute <start> to minute <end> (exclusive) of the day """
+
+    def __init__(self, minutes=60, start=0, end=MINUTES_PER_DAY):
+        if minutes <= 0 or MINUTES_PER_DAY % minutes != 0:
+            raise ValueError("The length of the time steps should divide a day, got %s minutes." % minutes)
+        if start % minutes != 0 or end % minutes != 0 or not 0 <= start < end <= MINUTES_PER_DAY:
+            raise ValueError("The axis should start and end on step borders within a day.")
+        self.minutes = minutes
+        self.starts = np.arange(start, end, minutes)
+
+    @classmethod
+    def fromHours(cls, start_h=0, end_h=23, minutes=60):
+        """ Axis from the beginning of hour <start_h> to the end of hour <end_h> """
+        return cls(minutes, start=start_h * 60, end=(end_h + 1) * 60)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def hourly(self):
+        return self.minutes == 60
+
+    @property
+    def time_col(self):
+        """ Column of the time step in the aggregated mobile phone data """
+        return 'HOUR' if self.hourly else 'TIME_STEP'
+
+    def label(self, start):
+        """ Label of the step starting at minute <start> of the day """
+        hour, minute = divmod(int(start), 60)
+        return 'H%s' % hour if minute == 0 and self.minutes % 60 == 0 else 'H%sM%02d' % (hour, minute)
+
+    def labels(self, suffix=''):
+        """ Labels of all steps, e.g. suffix 'm' --> H0m, H1m ... """
+        return [self.label(start) + suffix for start in self.starts]
+
+    def steps(self, hour, minute=0):
+        """ Step of each time (<hour>, <minute>), -1 for times outside of the axis """
+        minutes = np.asarray(hour, dtype=np.int64) * 60 + np.asarray(minute, dtype=np.int64)
+        steps = (minutes - self.starts[0]) // self.minutes
+        return np.where((steps >= 0) & (steps < len(self.starts)), steps, -1)
+
+    def fromHourly(self, hourly):
+        """
+        Values of the steps from hourly values (n x 24, e.g. time use factors of hours 0 ... 23),
+        interpolated linearly between the hour midpoints to the midpoints of the steps.
+        """
+        hourly = np.asarray(hourly, dtype=np.float64)
+        midpoints = self.starts + self.minutes / 2.0
+        hour_midpoints = np.arange(24) * 60 + 30.0
+
+        # Position of each step midpoint between two hour midpoints (the last hour wraps over midnight)
+        pos = (midpoints - 30.0) / 60.0
+        lower = np.floor(pos).astype(np.int64) % 24
+        upper = (lower + 1) % 24
+        frac = (midpoints - hour_midpoints[lower]) % MINUTES_PER_DAY / 60.0
+        return hourly[:, lower] * (1 - frac) + hourly[:, upper] * frac
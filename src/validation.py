@@ -2,121 +2,163 @@
 """
 Created on Fri Aug 31 14:18:58 2018
 """
-import geopandas as gpd
+import os
+
 import pandas as pd
-from scipy.stats import linregress
-from functools import reduce
-import matplotlib.pyplot as plt
-from math import sqrt
 import numpy as np
-from numpy.polynomial.polynomial import polyfit
+
+from validation_engine import loadHourlyResults, joinRegister, windowMeans, validateScenario
+from spatial_diagnostics import spatialDiagnostics
+from ykr_grid import calibrateLattice
 
 #---------------------------------------------
-'''SET FILEPATHS AND READ IN DATA '''
+'''SET FILEPATHS'''
 #---------------------------------------------
 
 #validation data
 fp_val= r'...\ykr_rttk_spatjoin.shp'
-#hourly mobile phone data
-fp_hspa2= r'...\ZROP_results_hspa_H2.shp'
-fp_hspa3= r'...\ZROP_results_hspa_H3.shp'
-fp_hspa4= r'...\ZROP_results_hspa_H4.shp'
-fp_hspa15= r'...\ZROP_results_hspa_H15.shp'
-
-val =  gpd.read_file(fp_val) #val = validation df
-
-hspa2 =  gpd.read_file(fp_hspa2)
-hspa3 =  gpd.read_file(fp_hspa3)
-hspa4 =  gpd.read_file(fp_hspa4)
-hspa15 =  gpd.read_file(fp_hspa15)
-
-#--------------------------------------------------------------------
-'''CREATE NIGHT-TIME DF'''
-#--------------------------------------------------------------------
-#join data
-night_hspa = hspa2.merge(hspa3,on='YKR_ID').merge(hspa4,on='YKR_ID')
-
-#calc mean for each df
-night_hspa['MEAN_hspa'] = night_hspa[['ZROP H2', 'ZROP H3', 'ZROP H4']].mean(axis=1)
-
-#merge dfs
-night_dfs = [night_hspa]
-night_mpd= reduce(lambda left,right: pd.merge(left,right,on='YKR_ID'), night_dfs)
+#hourly mobile phone data (%s is filled with the hour), or the folder of a cube store (see zrop_cube.py)
+fp_hspa= r'...\ZROP_results_hspa_H%s.shp'
+#scenario in the cube store
+cube_scenario = 'ZROP_results_HSPA'
+#(optional) YKR grid lattice (json, see ykr_grid.py), if given the geometry of the validation data is not read
+fp_lattice = None
+#output - per cell cluster layer of the interpolation error
+out_clusters= r'...\diff_hspa_clusters.shp'
 
-#clean data and save to new df
-night_mpd_clean = night_mpd[['MEAN_hspa', 'YKR_ID', 'geometry']].copy()
-
-#save hevaki_y and ykrid to own df
-val_clean = val[['YKR_ID', 'he_vakiy']].copy()
-
-#execute join to validation data
-night_mpd_val = night_mpd_clean.merge(val_clean,left_on='YKR_ID', right_on='YKR_ID', how='outer')
-
-#normalize population data (scale of 0-1)
-night_mpd_val['pop_norm'] = night_mpd_val['he_vakiy'] /night_mpd_val['he_vakiy'].sum()
-
-#compare po register to mpd
-night_mpd_val['diff_hspa'] = night_mpd_val['pop_norm'] - night_mpd_val['MEAN_hspa'] 
-
-night_mpd_val = night_mpd_val.fillna(0)
+#hours to validate and hour windows (first and last hour) whose mean is validated
+hours = list(range(0, 24))
+windows = [(2, 4)] #night-time (2 AM - 5 AM)
 
 
 #----------------------------------
 '''VALIDATION'''
 #----------------------------------
 
+def nightTimeTable(ids, pop_norm, hspa, hours, windows):
+    """ Night-time df for plotting: normalized population, mean of the first window and their difference """
+    night_mpd_val = pd.DataFrame({'YKR_ID': ids, 'pop_norm': pop_norm,
+                                  'MEAN_hspa': windowMeans(hspa, hours, windows)[:, 0]})
+
+    #compare po register to mpd
+    night_mpd_val['diff_hspa'] = night_mpd_val['pop_norm'] - night_mpd_val['MEAN_hspa']
+    return night_mpd_val
+
 
-#CALC CORRELATION COEFFICIENT & STANDARD ERROR
-#----------------------------------------------------------------
-night_mpd_val[['pop_norm','MEAN_hspa']].corr(method='pearson')
-linregress(night_mpd_val['pop_norm'], night_mpd_val['MEAN_hspa'])
+def diagnoseErrors(val, ids, pop_norm, hspa, hours, windows, ykr_lattice=None):
+    """
+    Global Moran's I for each period, local Moran's I clusters and Getis-Ord Gi* hot spots for each cell
+    of the difference between population register and mpd. Returns the global statistics and the
+    cluster layer joined to the geometry of the validation grid (generated from <ykr_lattice> if given).
+    """
+    if ykr_lattice is None:
+        #calibrate the YKR grid lattice from the cell centroids of the validation grid (cell ids --> rows and cols)
+        centroids = val.geometry.centroid
+        ykr_lattice = calibrateLattice(val['YKR_ID'].values, centroids.x.values, centroids.y.values)
 
-#CALC RMSE
-#-----------------------------------
-#rmse:
-rmse = sqrt(((night_mpd_val['pop_norm'] - night_mpd_val['MEAN_hspa'])**2).sum()/13231)
+    #difference between population register and mpd for all hours and the night-time window (cells x periods)
+    diff_hspa = pop_norm[:, None] - np.hstack([hspa, windowMeans(hspa, hours, windows)])
+    diff_labels = ['H%s' % hour for hour in hours] + ['H%s-H%s' % window for window in windows]
 
-#CALC MAE
-#-----------------------------------
-mae = (abs(night_mpd_val['pop_norm'] - night_mpd_val['MEAN_hspa'])).sum()/13231
+    moran_global, diff_clusters = spatialDiagnostics(ids, diff_hspa, ykr_lattice, labels=diff_labels, kind='queen')
+    if 'geometry' not in val:
+        from ykr_grid import gridGeoDataFrame
+        return moran_global, gridGeoDataFrame(diff_clusters['YKR_ID'].values, ykr_lattice).merge(diff_clusters, on='YKR_ID')
+    return moran_global, val[['YKR_ID', 'geometry']].merge(diff_clusters, on='YKR_ID', how='inner')
 
-#CALC CV based on rmse 
-#-----------------------------------
-# the ratio of the standard deviation to the mean 
-pop = night_mpd_val['pop_norm'].sum()
-rmse/pop
 
 #---------------
 '''PLOTTING'''
 #---------------
 
-#specify variables
-y=night_mpd_val['pop_norm']
-x1=night_mpd_val['MEAN_hspa']
-
-#HSPA-VAL
-#--------------------
-#specify plot size
-plt.figure(1, figsize=(9, 9))
-#run plotting
-plt.scatter(x1,y, s=40, alpha=0.45, label="r = 0.683***")
-#Edit axis ticks
-ax = plt.gca()
-ax.tick_params(axis = 'both', which = 'major', labelsize = 22)
-ax.tick_params(axis = 'both', which = 'minor', labelsize = 22)
-ax.tick_params(axis='x', pad=5)
-ax.tick_params(axis='y', pad=5)
-#Edit Axis labels
-label_properties = {'size':'26', 'weight':'bold'}
-plt.ylabel('Residential Population', fontdict=label_properties, labelpad=35)
-plt.xlabel('HSPA Calls (2 AM - 5 AM)', fontdict=label_properties, labelpad=30)
-#Set r line
-b, m = polyfit(x1, y, 1)
-plt.plot(np.unique(x1), np.poly1d(np.polyfit(x1, y, 1))(np.unique(x1)),c='k', alpha=0.6)
-#Adjust axis value range
-plt.ylim(ymin=-0.00004,ymax=(y.max()+0.0005))
-plt.xlim(xmin=-0.0001,xmax=(x1.max()+0.001))
-#Edit Legend
-legend_properties = {'size':'26'}
-plt.legend(markerscale=0, frameon=False, prop=legend_properties, loc='lower right')
-plt.show()
\ No newline at end of file
+def plotNightTime(night_mpd_val):
+    """ Scatter plot of the night-time mpd against the population register """
+    import matplotlib.pyplot as plt
+    from numpy.polynomial.polynomial import polyfit
+
+    #specify variables
+    y=night_mpd_val['pop_norm']
+    x1=night_mpd_val['MEAN_hspa']
+
+    #HSPA-VAL
+    #--------------------
+    #specify plot size
+    plt.figure(1, figsize=(9, 9))
+    #run plotting
+    plt.scatter(x1,y, s=40, alpha=0.45, label="r = 0.683***")
+    #Edit axis ticks
+    ax = plt.gca()
+    ax.tick_params(axis = 'both', which = 'major', labelsize = 22)
+    ax.tick_params(axis = 'both', which = 'minor', labelsize = 22)
+    ax.tick_params(axis='x', pad=5)
+    ax.tick_params(axis='y', pad=5)
+    #Edit Axis labels
+    label_properties = {'size':'26', 'weight':'bold'}
+    plt.ylabel('Residential Population', fontdict=label_properties, labelpad=35)
+    plt.xlabel('HSPA Calls (2 AM - 5 AM)', fontdict=label_properties, labelpad=30)
+    #Set r line
+    b, m = polyfit(x1, y, 1)
+    plt.plot(np.unique(x1), np.poly1d(np.polyfit(x1, y, 1))(np.unique(x1)),c='k', alpha=0.6)
+    #Adjust axis value range
+    plt.ylim(ymin=-0.00004,ymax=(y.max()+0.0005))
+    plt.xlim(xmin=-0.0001,xmax=(x1.max()+0.001))
+    #Edit Legend
+    legend_properties = {'size':'26'}
+    plt.legend(markerscale=0, frameon=False, prop=legend_properties, loc='lower right')
+    plt.show()
+
+
+def main(fp_val=fp_val, fp_hspa=fp_hspa, out_clusters=out_clusters, hours=hours, windows=windows, plot=True,
+         cube_scenario=cube_scenario, fp_lattice=fp_lattice):
+    """ Validate the hourly MFD results against the population register. """
+    import geopandas as gpd
+    from scipy.stats import linregress
+
+    #READ IN DATA
+    #--------------------------------------------------------------------
+    ykr_lattice = None
+    if fp_lattice is not None:
+        from ykr_grid import readLattice
+        ykr_lattice = readLattice(fp_lattice)
+        val = gpd.read_file(fp_val, columns=['YKR_ID', 'he_vakiy'], ignore_geometry=True)
+    else:
+        val =  gpd.read_file(fp_val, columns=['YKR_ID', 'he_vakiy']) #val = validation df
+
+    #load all hourly results as (cells x hours) array
+    if os.path.isdir(fp_hspa):
+        from zrop_cube import loadCubeResults
+        ids, hspa = loadCubeResults(fp_hspa, cube_scenario, ['H%s' % hour for hour in hours])
+    else:
+        ids, hspa = loadHourlyResults(fp_hspa, hours)
+
+    #JOIN TO VALIDATION DATA
+    #--------------------------------------------------------------------
+    #execute join to validation data once (outer join, missing cells get 0) and normalize population data (scale of 0-1)
+    ids, pop_norm, hspa = joinRegister(ids, hspa, val, id_col='YKR_ID', pop_col='he_vakiy')
+
+    #CALC CORRELATION COEFFICIENT, RMSE, MAE AND CV (based on rmse) FOR ALL HOURS AND WINDOWS
+    #----------------------------------------------------------------
+    #with 95 % bootstrap confidence intervals
+    validation_results = validateScenario(pop_norm, hspa, hours, windows=windows, n_boot=1000, seed=0)
+    print(validation_results.pivot(index='period', columns='metric', values='value'))
+
+    night_mpd_val = nightTimeTable(ids, pop_norm, hspa, hours, windows)
+
+    #standard error of the regression
+    print(linregress(night_mpd_val['pop_norm'], night_mpd_val['MEAN_hspa']))
+
+    #SPATIAL DIAGNOSTICS OF THE INTERPOLATION ERROR
+    #----------------------------------------------------------------
+    moran_global, diff_clusters = diagnoseErrors(val, ids, pop_norm, hspa, hours, windows, ykr_lattice=ykr_lattice)
+    print(moran_global)
+
+    #write out cluster layer
+    diff_clusters.to_file(out_clusters)
+
+    if plot:
+        plotNightTime(night_mpd_val)
+    return validation_results
+
+
+if __name__ == "__main__":
+    main()
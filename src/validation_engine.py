@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:10:26 2026
+
+Aim of this script:
+===================
+Vectorized validation of MFD interpolation results against register based population data.
+
+All hourly results of a scenario are loaded into one (cells x hours) array that is joined to the
+register grid once. Correlation (Pearson r), RMSE, MAE and the coefficient of variation of the
+RMSE are then calculated for every hour and for any number of hour windows (e.g. night time
+2 AM - 5 AM) at once. Window means are calculated from cumulative sums over the hours.
+
+Bootstrap confidence intervals are calculated in batches: a batch of bootstrap resamples is
+expressed as a (resamples x cells) matrix of resampling counts, so the sums needed for the
+metrics of all resamples and all hours/windows are obtained with matrix products.
+
+Structure:
+===================
+1) loading hourly results as (cells x hours) array and joining register data
+2) calculating hour window means
+3) calculating validation metrics and bootstrap confidence intervals
+
+Input: hourly MFD results (.shp-files), register based population data (.shp-file)
+Output: validation metrics (DataFrame)
+
+"""
+import numpy as np
+import pandas as pd
+
+
+def readAttributes(fp, columns):
+    """ Read attribute columns of a spatial file without parsing the geometries """
+    import geopandas as gpd
+    return gpd.read_file(fp, columns=columns, ignore_geometry=True)
+
+
+def loadHourlyResults(fp_template, hours, id_col='YKR_ID', value_template='ZROP H%s'):
+    """
+    Load hourly results into one array. <fp_template> is filled with the hour
+    (e.g. r'...\\ZROP_results_hspa_H%s.shp') and <value_template> gives the value column of the hour.
+
+    Returns the cell ids (sorted) and a (cells x hours) array of values (0 for cells without a value).
+    """
+    parts = []
+    for hour in hours:
+        df = readAttributes(fp_template % hour, [id_col, value_template % hour])
+        parts.append(df.set_index(id_col)[value_template % hour])
+
+    # Join all hours at once on the union of cell ids
+    results = pd.concat(parts, axis=1, join='outer').sort_index()
+    return results.index.values, results.fillna(0).values.astype(np.float64)
+
+
+def joinRegister(ids, values, register, id_col='YKR_ID', pop_col='he_vakiy'):
+    """
+    Join the (cells x hours) <values> to the <register> population once.
+    Cells that are missing from either dataset get value 0 (outer join).
+    The register population is normalized to scale 0-1.
+
+    Returns the cell ids, the normalized population (cells) and the aligned values (cells x hours).
+    """
+    pop = register[[id_col, pop_col]].groupby(id_col)[pop_col].sum()
+    all_ids = np.union1d(ids, pop.index.values)
+
+    aligned = np.zeros((len(all_ids), values.shape[1]), dtype=np.float64)
+    aligned[np.searchsorted(all_ids, ids)] = values
+
+    pop_aligned = np.zeros(len(all_ids), dtype=np.float64)
+    pop_aligned[np.searchsorted(all_ids, pop.index.values)] = np.nan_to_num(pop.values.astype(np.float64))
+
+    return all_ids, pop_aligned / pop_aligned.sum(), aligned
+
+
+def windowMeans(values, hours, windows):
+    """
+    Mean of the (cells x hours) <values> over each hour window. <windows> is a list of
+    (first hour, last hour) tuples (inclusive), e.g. [(2, 4)] for the night time 2 AM - 5 AM.
+    The hours of a window must be consecutive items in <hours>.
+
+    Returns a (cells x windows) array.
+    """
+    position = {hour: i for i, hour in enumerate(hours)}
+
+    # Cumulative sums over the hours (with a leading column of zeros)
+    cumulative = np.zeros((values.shape[0], values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(values, axis=1, out=cumulative[:, 1:])
+
+    starts = np.array([position[first] for first, last in windows])
+    ends = np.array([position[last] + 1 for first, last in windows])
+    return (cumulative[:, ends] - cumulative[:, starts]) / (ends - starts)
+
+
+def metricsFromSums(n, sx, sy, sxx, syy, sxy, sse, sae):
+    """
+    Validation metrics from the sums over cells. All inputs are arrays that broadcast together,
+    so the metrics of several hours/windows and bootstrap resamples are calculated at once.
+    """
+    cov = sxy - sx * sy / n
+    var_x = sxx - sx ** 2 / n
+    var_y = syy - sy ** 2 / n
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = cov / np.sqrt(var_x * var_y)
+    rmse = np.sqrt(sse / n)
+    mae = sae / n
+    # Coefficient of variation of the RMSE as in the original validation (RMSE relative to the sum of the
+    # normalized reference population, i.e. the RMSE itself when the population sums to 1)
+    cv = rmse / sy
+    return {'r': r, 'rmse': rmse, 'mae': mae, 'cv': cv}
+
+
+def validationMetrics(pop, values):
+    """ Pearson r, RMSE, MAE and CV(RMSE) of each column of (cells x k) <values> against <pop> (cells) """
+    n = len(pop)
+    y = pop[:, None]
+    return metricsFromSums(n, values.sum(axis=0), y.sum(), (values ** 2).sum(axis=0), (y ** 2).sum(),
+                           (values * y).sum(axis=0), ((y - values) ** 2).sum(axis=0), np.abs(y - values).sum(axis=0))
+
+
+def bootstrapMetrics(pop, values, n_boot=1000, batch_size=None, seed=None):
+    """
+    Bootstrap distribution of the validation metrics for each column of (cells x k) <values>.
+
+    Resamples are processed in batches; in each batch the resamples are a (batch x cells) matrix
+    of resampling counts, and the sums for all resamples and columns are matrix products.
+    Returns a dictionary of (n_boot x k) arrays.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(pop)
+    y = pop[:, None]
+
+    # Per cell terms of the sums (cells x k)
+    x_terms = np.stack([values, values ** 2, values * y, (y - values) ** 2, np.abs(y - values)])
+    y_terms = np.stack([pop, pop ** 2], axis=1)
+
+    # Keep the count matrix of a batch at around 10 million items
+    if batch_size is None:
+        batch_size = max(1, min(n_boot, 10000000 // n))
+
+    results = {key: [] for key in ['r', 'rmse', 'mae', 'cv']}
+    for start in range(0, n_boot, batch_size):
+        b = min(batch_size, n_boot - start)
+
+        # Resampling counts of each cell in each resample
+        idx = rng.integers(0, n, size=(b, n)) + np.arange(b)[:, None] * n
+        counts = np.bincount(idx.ravel(), minlength=b * n).reshape(b, n).astype(np.float64)
+
+        sx, sxx, sxy, sse, sae = [counts @ term for term in x_terms]
+        sy, syy = (counts @ y_terms).T
+        metrics = metricsFromSums(n, sx, sy[:, None], sxx, syy[:, None], sxy, sse, sae)
+        for key in results:
+            results[key].append(metrics[key])
+
+    return {key: np.concatenate(results[key], axis=0) for key in results}
+
+
+def validateScenario(pop, values, hours, windows=[], n_boot=1000, alpha=0.05, seed=None):
+    """
+    Validation metrics with bootstrap confidence intervals for every hour and every hour window.
+    Returns a tidy DataFrame with columns: period, metric, value, ci_low, ci_high.
+    """
+    labels = ['H%s' % hour for hour in hours]
+    columns = values
+    if len(windows) > 0:
+        labels += ['H%s-H%s' % window for window in windows]
+        columns = np.hstack([values, windowMeans(values, hours, windows)])
+
+    estimates = validationMetrics(pop, columns)
+
+    records = []
+    if n_boot > 0:
+        boot = bootstrapMetrics(pop, columns, n_boot=n_boot, seed=seed)
+    for metric, value in estimates.items():
+        if n_boot > 0:
+            low, high = np.nanpercentile(boot[metric], [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+        else:
+            low = high = np.full(len(labels), np.nan)
+        for i, label in enumerate(labels):
+            records.append({'period': label, 'metric': metric, 'value': value[i], 'ci_low': low[i], 'ci_high': high[i]})
+
+    return pd.DataFrame(records)
+
+
+def validateScenarios(scenarios, register, hours, windows=[], id_col='YKR_ID', pop_col='he_vakiy',
+                      value_template='ZROP H%s', n_boot=1000, seed=None):
+    """
+    Validate several scenarios (e.g. day types x network indicators). <scenarios> is a dictionary
+    {scenario name: file path template of the hourly results}.
+    """
+    results = []
+    for name, fp_template in scenarios.items():
+        ids, values = loadHourlyResults(fp_template, hours, id_col=id_col, value_template=value_template)
+        ids, pop, values = joinRegister(ids, values, register, id_col=id_col, pop_col=pop_col)
+        result = validateScenario(pop, values, hours, windows=windows, n_boot=n_boot, seed=seed)
+        result.insert(0, 'scenario', name)
+        results.append(result)
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 15:02:11 2026
+
+Aim of this script:
+===================
+Arithmetic handling of the YKR grid (250 m x 250 m statistical grid in EPSG:3067).
+
+The YKR grid is a regular lattice, and the YKR_IDs of the cells run row by row (from north to
+south and from west to east within a row). The position of a cell in the lattice (row, col) can
+therefore be calculated from its YKR_ID and vice versa, without any spatial operations:
+
+    YKR_ID = first_id + row * ncols + col
+
+The parameters of the lattice (origin, number of columns and the id of the first cell) are
+calibrated once from a sample of grid cells, e.g. from the target zone grid or the register grid,
+and can be saved as json.
+
+In the same way points are assigned to grid cells, the bounds and polygons of the cells are
+generated on demand (so the grid does not need to be read from a file), and polygons are split at
+the grid lines (only the polygons that cross cell borders are intersected).
+
+"""
+import json
+
+import numpy as np
+
+# Cell size of the YKR grid in meters
+CELL_SIZE = 250
+
+
+def calibrateLattice(ids, x, y, cell_size=CELL_SIZE):
+    """
+    Calibrate the lattice parameters from a sample of grid cells. <ids> are the YKR_IDs and <x>, <y>
+    any coordinates inside the cells (e.g. centroids) in EPSG:3067.
+
+    Returns a dictionary with the origin (upper left corner) of the lattice <x0>, <y0>, the
+    <cell_size>, the number of columns <ncols>, the id of the cell at row 0, col 0 <first_id> and the
+    number of rows down to the southernmost cell of the sample <nrows>.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Origin at the upper left corner of the sample
+    x0 = np.floor(x.min() / cell_size) * cell_size
+    y0 = np.ceil(y.max() / cell_size) * cell_size
+    rows = np.floor((y0 - y) / cell_size).astype(np.int64)
+    cols = np.floor((x - x0) / cell_size).astype(np.int64)
+
+    # Number of columns from cells on different rows: id difference = row difference * ncols + col difference
+    other = np.argmax(rows != rows[0])
+    if rows[other] == rows[0]:
+        raise ValueError("Can not calibrate the YKR lattice from cells on a single row.")
+    ncols = int(round(((ids[other] - ids[0]) - (cols[other] - cols[0])) / (rows[other] - rows[0])))
+    first_id = int(ids[0] - rows[0] * ncols - cols[0])
+
+    lattice = {'x0': float(x0), 'y0': float(y0), 'cell_size': cell_size, 'ncols': ncols, 'first_id': first_id,
+               'nrows': int(rows.max()) + 1}
+
+    # All cells of the sample have to follow the same numbering
+    if not np.array_equal(rowColToIds(rows, cols, lattice), ids):
+        raise ValueError("The ids of the grid cells do not follow a row by row numbering.")
+
+    return lattice
+
+
+def saveLattice(lattice, fp):
+    """ Save lattice parameters as json """
+    with open(fp, 'w') as f:
+        json.dump(lattice, f, indent=2)
+
+
+def readLattice(fp):
+    """ Read lattice parameters from json """
+    with open(fp) as f:
+        return json.load(f)
+
+
+def idsToRowCol(ids, lattice):
+    """ Row and column of each YKR_ID in the lattice """
+    rows, cols = np.divmod(np.asarray(ids, dtype=np.int64) - lattice['first_id'], lattice['ncols'])
+    return rows, cols
+
+
+def rowColToIds(rows, cols, lattice):
+    """ YKR_ID of each row and column in the lattice """
+    return lattice['first_id'] + np.asarray(rows, dtype=np.int64) * lattice['ncols'] + np.asarray(cols, dtype=np.int64)
+
+
+def pointsToRowCol(x, y, lattice):
+    """
+    Row and column of the cells that contain the points <x>, <y> (EPSG:3067). Points outside of the
+    lattice get rows and columns outside of it as well (negative or >= ncols).
+    """
+    size = lattice['cell_size']
+    rows = np.floor((lattice['y0'] - np.asarray(y, dtype=np.float64)) / size).astype(np.int64)
+    cols = np.floor((np.asarray(x, dtype=np.float64) - lattice['x0']) / size).astype(np.int64)
+    return rows, cols
+
+
+def pointsToIds(x, y, lattice):
+    """
+    YKR_ID of the cells that contain the points <x>, <y> (EPSG:3067), -1 for points north, west or east
+    of the lattice (their row and column would give the id of a cell on another row)
+    """
+    rows, cols = pointsToRowCol(x, y, lattice)
+    inside = (rows >= 0) & (cols >= 0) & (cols < lattice['ncols'])
+    return np.where(inside, rowColToIds(rows, cols, lattice), -1)
+
+
+def cellBounds(ids, lattice):
+    """ Bounds (minx, miny, maxx, maxy) of the grid cells <ids> as arrays """
+    rows, cols = idsToRowCol(ids, lattice)
+    size = lattice['cell_size']
+    minx = lattice['x0'] + cols * size
+    maxy = lattice['y0'] - rows * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def cellGeometries(ids, lattice):
+    """ Polygons of the grid cells <ids> (shapely >= 2.0) """
+    import shapely
+    return shapely.box(*cellBounds(ids, lattice))
+
+
+def gridGeoDataFrame(ids, lattice, id_col='YKR_ID', epsg=3067):
+    """ Grid cells <ids> as GeoDataFrame, generated instead of reading the grid from a file """
+    import geopandas as gpd
+    ids = np.asarray(ids, dtype=np.int64)
+    return gpd.GeoDataFrame({id_col: ids}, geometry=cellGeometries(ids, lattice), crs='epsg:%s' % epsg)
+
+
+def splitByGrid(geoms, lattice):
+    """
+    Split the polygons <geoms> (EPSG:3067) at the grid lines and assign each part to its grid cell.
+
+    Polygons that are within a single cell are assigned arithmetically from their bounds and are not
+    intersected; only polygons that cross cell borders are intersected with the cells of their bounds.
+
+    Returns the position of the source polygon in <geoms>, the YKR_ID and the geometry of each part.
+    """
+    import shapely
+
+    geoms = np.asarray(geoms)
+    bounds = shapely.bounds(geoms)
+    size = lattice['cell_size']
+
+    # Range of cells covered by the bounds of each polygon (bounds on a grid line do not reach the next cell)
+    row_min = np.floor((lattice['y0'] - bounds[:, 3]) / size).astype(np.int64)
+    col_min = np.floor((bounds[:, 0] - lattice['x0']) / size).astype(np.int64)
+    row_max = np.maximum(row_min, np.ceil((lattice['y0'] - bounds[:, 1]) / size).astype(np.int64) - 1)
+    col_max = np.maximum(col_min, np.ceil((bounds[:, 2] - lattice['x0']) / size).astype(np.int64) - 1)
+
+    # Polygons within a single cell
+    single = (row_min == row_max) & (col_min == col_max)
+    src_parts = [np.nonzero(single)[0]]
+    id_parts = [rowColToIds(row_min[single], col_min[single], lattice)]
+    geom_parts = [geoms[single]]
+
+    # Polygons that cross cell borders: one candidate per cell of the bounds
+    crossing = np.nonzero(~single)[0]
+    if len(crossing) > 0:
+        nrows = row_max[crossing] - row_min[crossing] + 1
+        ncols = col_max[crossing] - col_min[crossing] + 1
+        counts = nrows * ncols
+        src = np.repeat(crossing, counts)
+
+        # Position of each candidate within the cell range of its polygon
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.repeat(row_min[crossing], counts) + k // np.repeat(ncols, counts)
+        cols = np.repeat(col_min[crossing], counts) + k % np.repeat(ncols, counts)
+        ids = rowColToIds(rows, cols, lattice)
+
+        pieces = shapely.intersection(geoms[src], cellGeometries(ids, lattice))
+        keep = ~shapely.is_empty(pieces) & (shapely.area(pieces) > 0)
+        src_parts.append(src[keep])
+        id_parts.append(ids[keep])
+        geom_parts.append(pieces[keep])
+
+    return np.concatenate(src_parts), np.concatenate(id_parts), np.concatenate(geom_parts)
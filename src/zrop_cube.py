@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 10:41:05 2026
+
+Aim of this script:
+===================
+Raster output of the MFD interpolation results (ZROP) on the YKR grid.
+
+The target zones of the interpolation are cells of the regular YKR grid, so the results of all hours
+and scenarios (e.g. day types or network indicators) fit into one array of
+(cell row x cell col x time x scenario). Two formats are supported:
+
+- a cube store: a folder of .npy files that are read by memory mapping. Each scenario is stored in
+  chunks of <chunk_size> time steps, i.e. arrays of (rows x cols x chunk_size). New time steps and new
+  scenarios are appended without rewriting the existing chunks. Cells outside of the window of the
+  cube (e.g. a full run written to a cube created by a subset run) grow the window, in which case the
+  existing chunks are rewritten once with the larger window. A single hour or the 24-hour profile
+  of a single cell is sliced from the memory mapped chunks without reading the whole cube.
+- a multi-band GeoTIFF per scenario (one band per time step), e.g. for viewing the results in QGIS.
+
+Cells without a value are NaN.
+
+Structure:
+===================
+1) creating a cube store for a window of the YKR grid (and growing the window)
+2) writing (appending) time steps of a scenario, one or many at a time
+3) reading time steps, cell profiles and (cells x hours) arrays for validation
+4) writing a scenario as GeoTIFF
+
+Cube folder:
+    cube.json                       lattice, grid window, time steps, scenarios and chunk size
+    <scenario>/chunk_<i>.npy        values of time steps i*chunk_size ... (i+1)*chunk_size-1
+
+REQUIREMENTS:
+-------------
+rasterio (only for writing GeoTIFF)
+
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from ykr_grid import idsToRowCol, rowColToIds
+
+
+#------------------------------------------------------------
+'''1. CREATING A CUBE '''
+#------------------------------------------------------------
+
+def createCube(cube_dir, lattice, ids, chunk_size=24, dtype='float32'):
+    """
+    Create an empty cube store in <cube_dir> covering the bounding window (rows, cols) of the grid
+    cells <ids> in <lattice> (see ykr_grid.py).
+    """
+    rows, cols = idsToRowCol(ids, lattice)
+    meta = {'lattice': lattice,
+            'row0': int(rows.min()), 'col0': int(cols.min()),
+            'nrows': int(rows.max() - rows.min() + 1), 'ncols': int(cols.max() - cols.min() + 1),
+            'chunk_size': chunk_size, 'dtype': dtype,
+            'times': [], 'scenarios': []}
+
+    os.makedirs(cube_dir, exist_ok=True)
+    writeMeta(cube_dir, meta)
+    return meta
+
+
+def readMeta(cube_dir):
+    with open(os.path.join(cube_dir, 'cube.json')) as f:
+        return json.load(f)
+
+
+def writeMeta(cube_dir, meta):
+    fp = os.path.join(cube_dir, 'cube.json')
+    with open(fp + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(fp + '.tmp', fp)
+
+
+def cellPositions(meta, ids):
+    """ Row and col of the grid cells <ids> within the window of the cube """
+    rows, cols = idsToRowCol(ids, meta['lattice'])
+    rows = rows - meta['row0']
+    cols = cols - meta['col0']
+    outside = (rows < 0) | (rows >= meta['nrows']) | (cols < 0) | (cols >= meta['ncols'])
+    if outside.any():
+        raise ValueError("%s grid cells are outside of the window of the cube." % outside.sum())
+    return rows, cols
+
+
+def growWindow(cube_dir, meta, ids):
+    """
+    Grow the window of the cube to cover also the grid cells <ids>. The existing chunks are rewritten
+    with the larger window (the old values are kept, new cells are NaN). Returns the metadata.
+    """
+    rows, cols = idsToRowCol(ids, meta['lattice'])
+    row0, col0 = min(meta['row0'], int(rows.min())), min(meta['col0'], int(cols.min()))
+    row1 = max(meta['row0'] + meta['nrows'], int(rows.max()) + 1)
+    col1 = max(meta['col0'] + meta['ncols'], int(cols.max()) + 1)
+    if (row0, col0, row1 - row0, col1 - col0) == (meta['row0'], meta['col0'], meta['nrows'], meta['ncols']):
+        return meta
+
+    grown = dict(meta, row0=row0, col0=col0, nrows=row1 - row0, ncols=col1 - col0)
+    dr, dc = meta['row0'] - row0, meta['col0'] - col0
+    for scenario in meta['scenarios']:
+        scenario_dir = os.path.join(cube_dir, str(scenario))
+        if not os.path.isdir(scenario_dir):
+            continue
+        for fn in sorted(os.listdir(scenario_dir)):
+            if not (fn.startswith('chunk_') and fn.endswith('.npy')):
+                continue
+            fp = os.path.join(scenario_dir, fn)
+            old = np.load(fp, mmap_mode='r')
+            arr = np.lib.format.open_memmap(fp + '.tmp', mode='w+', dtype=meta['dtype'],
+                                            shape=(grown['nrows'], grown['ncols'], meta['chunk_size']))
+            arr[:] = np.nan
+            arr[dr:dr + meta['nrows'], dc:dc + meta['ncols']] = old
+            arr.flush()
+            del arr, old
+            os.replace(fp + '.tmp', fp)
+
+    writeMeta(cube_dir, grown)
+    return grown
+
+
+def chunkPath(cube_dir, scenario, chunk):
+    return os.path.join(cube_dir, str(scenario), 'chunk_%s.npy' % chunk)
+
+
+def openChunk(cube_dir, meta, scenario, chunk, mode='r'):
+    """ Memory map a chunk of a scenario, a missing chunk is created (filled with NaN) in write modes """
+    fp = chunkPath(cube_dir, scenario, chunk)
+    if not os.path.exists(fp):
+        if mode == 'r':
+            return None
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        arr = np.lib.format.open_memmap(fp, mode='w+', dtype=meta['dtype'],
+                                        shape=(meta['nrows'], meta['ncols'], meta['chunk_size']))
+        arr[:] = np.nan
+        return arr
+    return np.load(fp, mmap_mode=mode)
+
+
+#------------------------------------------------------------
+'''2. WRITING TIME STEPS '''
+#------------------------------------------------------------
+
+def writeTimeStep(cube_dir, scenario, time, ids, values):
+    """
+    Write the <values> of the grid cells <ids> for <time> (e.g. 'H7') of <scenario>.
+    A new time step or scenario is appended to the cube, an existing one is overwritten.
+    """
+    writeTimeSteps(cube_dir, scenario, [time], ids, np.asarray(values)[:, None])
+
+
+def writeTimeSteps(cube_dir, scenario, times, ids, values):
+    """
+    Write the (cells x times) <values> of the grid cells <ids> for all <times> of <scenario> at once
+    (each chunk is opened and the metadata is written only once).
+    """
+    meta = growWindow(cube_dir, readMeta(cube_dir), ids)
+    for time in times:
+        if time not in meta['times']:
+            meta['times'].append(time)
+    if scenario not in meta['scenarios']:
+        meta['scenarios'].append(scenario)
+
+    rows, cols = cellPositions(meta, ids)
+    values = np.asarray(values, dtype=meta['dtype'])
+    steps = np.array([meta['times'].index(time) for time in times])
+    chunks, offsets = np.divmod(steps, meta['chunk_size'])
+
+    for chunk in np.unique(chunks):
+        in_chunk = chunks == chunk
+        arr = openChunk(cube_dir, meta, scenario, int(chunk), mode='r+')
+        for offset, column in zip(offsets[in_chunk], np.nonzero(in_chunk)[0]):
+            arr[:, :, offset] = np.nan
+            arr[rows, cols, offset] = values[:, column]
+        arr.flush()
+        del arr
+
+    writeMeta(cube_dir, meta)
+
+
+def writeZROP(cube_dir, scenario, zrop, time_window, tz_id_col='YKR_ID'):
+    """
+    Write the ZROP DataFrame of one time window or a list of time windows (columns 'ZROP <time window>',
+    see mfd_interpolation.calculateZROP) to the cube
+    """
+    times = [time_window] if isinstance(time_window, str) else list(time_window)
+    writeTimeSteps(cube_dir, scenario, times, zrop[tz_id_col].values, zrop[['ZROP %s' % time for time in times]].values)
+
+
+#------------------------------------------------------------
+'''3. READING '''
+#------------------------------------------------------------
+
+def readTimeStep(cube_dir, scenario, time):
+    """ Values of <time> of <scenario> as (rows x cols) array of the window of the cube """
+    meta = readMeta(cube_dir)
+    chunk, offset = divmod(meta['times'].index(time), meta['chunk_size'])
+    arr = openChunk(cube_dir, meta, scenario, chunk)
+    if arr is None:
+        return np.full((meta['nrows'], meta['ncols']), np.nan, dtype=meta['dtype'])
+    return np.array(arr[:, :, offset])
+
+
+def readCellProfile(cube_dir, scenario, ykr_id):
+    """ Values of all time steps of <scenario> in the grid cell <ykr_id> as Series """
+    meta = readMeta(cube_dir)
+    rows, cols = cellPositions(meta, [ykr_id])
+    n = len(meta['times'])
+
+    profile = np.full(n, np.nan)
+    for chunk in range(0, (n - 1) // meta['chunk_size'] + 1):
+        arr = openChunk(cube_dir, meta, scenario, chunk)
+        if arr is None:
+            continue
+        start = chunk * meta['chunk_size']
+        stop = min(n, start + meta['chunk_size'])
+        profile[start:stop] = arr[rows[0], cols[0], :stop - start]
+    return pd.Series(profile, index=meta['times'], name=ykr_id)
+
+
+def loadCubeResults(cube_dir, scenario, times):
+    """
+    Values of <times> of <scenario> for all cells that have a value in any of them.
+    Returns the cell ids (sorted) and a (cells x times) array (0 for missing values) like
+    validation_engine.loadHourlyResults.
+    """
+    meta = readMeta(cube_dir)
+    stack = np.stack([readTimeStep(cube_dir, scenario, time) for time in times], axis=-1)
+
+    rows, cols = np.nonzero(~np.isnan(stack).all(axis=-1))
+    ids = rowColToIds(rows + meta['row0'], cols + meta['col0'], meta['lattice'])
+    order = np.argsort(ids)
+    values = stack[rows[order], cols[order]].astype(np.float64)
+    return ids[order], np.nan_to_num(values)
+
+
+#------------------------------------------------------------
+'''4. GEOTIFF '''
+#------------------------------------------------------------
+
+def writeGeoTiff(cube_dir, scenario, out_fp, times=None, epsg=3067):
+    """ Write <times> (by default all time steps) of <scenario> as multi-band GeoTIFF, one band per time step """
+    import rasterio
+    from rasterio.transform import from_origin
+
+    meta = readMeta(cube_dir)
+    if times is None:
+        times = meta['times']
+    lattice = meta['lattice']
+    size = lattice['cell_size']
+
+    # Upper left corner of the window of the cube
+    transform = from_origin(lattice['x0'] + meta['col0'] * size, lattice['y0'] - meta['row0'] * size, size, size)
+
+    with rasterio.open(out_fp, 'w', driver='GTiff', width=meta['ncols'], height=meta['nrows'], count=len(times),
+                       dtype=meta['dtype'], crs='EPSG:%s' % epsg, transform=transform, nodata=np.nan,
+                       compress='deflate', tiled=True) as dst:
+        for band, time in enumerate(times, start=1):
+            dst.write(readTimeStep(cube_dir, scenario, time), band)
+            dst.set_band_description(band, str(time))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 13:14:50 2026
+
+Aim of this script:
+===================
+Incremental update of the MFD interpolation results (ZROP) when only the mobile phone data (CDR)
+changes, e.g. corrected counts of some base stations during outage hours.
+
+ZROP of a target zone z is the sum of ROP = EHP * RMP over its subunits, and RMP is the count of the
+base station (site) s divided by the total count of the hour. So
+
+    ZROP[z, w, t] = sum over sites s ( count[s, t] * C[s, z, w, t] ) / total[t]
+
+where the contribution C[s, z, w, t] is the sum of EHP of the subunits of site s in zone z. EHP
+depends only on the DPS layer and the time use data, not on the CDR. The contributions of all
+(site, zone) pairs and the unscaled sums U[z, w, t] = sum over s (count[s, t] * C[s, z, w, t]) are
+stored. With new CDR data:
+
+1) the new counts are compared with the stored counts per SITEID and time step
+2) U is patched with (new count - old count) * C of the pairs of the changed sites only
+3) ZROP = U / total of the new data, i.e. a change of the total (the RMP normalization) only rescales
+   the results and nothing is recomputed
+
+The state is valid as long as the DPS layer, the time use data and the parameters of the run do not
+change (checked with a key of their hashes, see mfd_interpolation.main).
+
+State folder:
+    zrop_state.npz      site and zone ids, (site, zone) pairs and their contributions
+    zrop_counts.npz     counts, totals and unscaled sums (rewritten in each update)
+    zrop_state.json     key, time windows, weight columns and the number of updates
+
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from mfd_kernels import segmentSum, segmentNormalize
+
+
+def siteCounts(cdr, site_ids, time_windows, sz_id_col='SITEID'):
+    """
+    Counts of the time windows (e.g. 'H7m') of the sites <site_ids> (sites x time windows, 0 for missing
+    sites and values), the mask of the sites that are in <cdr> and the total counts of the time windows.
+    """
+    counts_cols = [tw + 'm' for tw in time_windows]
+    values = cdr[counts_cols].values.astype(np.float64)
+    totals = np.nansum(values, axis=0)
+
+    pos = pd.Index(cdr[sz_id_col]).get_indexer(site_ids)
+    present = pos >= 0
+    counts = np.zeros((len(site_ids), len(time_windows)))
+    counts[present] = np.nan_to_num(values[pos[present]])
+    return counts, present, totals
+
+
+def storableIds(ids):
+    """ Ids as a numeric or fixed width string array (ids of object dtype, e.g. strings, as strings) """
+    ids = np.asarray(ids)
+    return ids.astype(str) if ids.dtype == object else ids
+
+
+class IncrementalZROP(object):
+    """ Stored per-site contributions to ZROP, see the description of the script """
+
+    def __init__(self, site_ids, zone_ids, pair_site, pair_zone, contributions, time_windows, weight_cols, key=None):
+        self.site_ids = np.asarray(site_ids)
+        self.zone_ids = np.asarray(zone_ids)
+        self.pair_site = np.asarray(pair_site, dtype=np.int64)
+        self.pair_zone = np.asarray(pair_zone, dtype=np.int64)
+        self.contributions = contributions
+        self.time_windows = list(time_windows)
+        self.weight_cols = list(weight_cols)
+        self.key = key
+        self.updates = 0
+        self.counts = self.present = self.totals = self.unscaled = None
+
+    @classmethod
+    def fromLayers(cls, df, time_windows, weight_cols, sz_id_col, tz_id_col, sf_col, zones=None, key=None):
+        """
+        Contributions of the (site, zone) pairs from the subunits in <df> (the DPS layer joined with the
+        time use, see mfd_interpolation.joinTimeUse). With <zones> only the pairs of these zones are kept.
+        """
+        n = len(df)
+        hour_factor = np.nan_to_num(df[[tw + 't' for tw in time_windows]].values.astype(np.float64))
+        weights = np.nan_to_num(df[weight_cols].values.astype(np.float64))
+        sf = np.nan_to_num(df[sf_col].values.astype(np.float64))
+
+        # EHP as in mfd_interpolation.calculateZROPArray (subunits without a source zone are skipped)
+        aEHP = (weights * sf[:, None])[:, :, None] * hour_factor[:, None, :]
+        site_codes, site_ids = pd.factorize(df[sz_id_col])
+        valid = site_codes >= 0
+        EHP = np.zeros((n, aEHP[0].size))
+        EHP[valid] = segmentNormalize(aEHP.reshape(n, -1)[valid], site_codes[valid], len(site_ids))
+
+        # Sum of EHP by (site, zone) pair (subunits without a target zone are skipped)
+        zone_codes, zone_ids = pd.factorize(df[tz_id_col], sort=True)
+        valid &= zone_codes >= 0
+        pair_codes, pairs = pd.factorize(site_codes[valid] * len(zone_ids) + zone_codes[valid])
+        contributions = segmentSum(EHP[valid], pair_codes, len(pairs)).reshape(len(pairs), len(weight_cols), len(time_windows))
+        pair_site, pair_zone = np.divmod(np.asarray(pairs), len(zone_ids))
+
+        if zones is not None:
+            keep = np.isin(np.asarray(zone_ids)[pair_zone], zones)
+            pair_site, pair_zone, contributions = pair_site[keep], pair_zone[keep], contributions[keep]
+
+        return cls(np.asarray(site_ids), np.asarray(zone_ids), pair_site, pair_zone, contributions,
+                   time_windows, weight_cols, key=key)
+
+    def weighted(self, pairs, site_counts):
+        """ Sum of the contributions of <pairs> multiplied by the (sites x time windows) <site_counts>, by zone """
+        values = self.contributions[pairs] * site_counts[self.pair_site[pairs]][:, None, :]
+        return segmentSum(values.reshape(len(values), -1), self.pair_zone[pairs], len(self.zone_ids)).reshape(
+            len(self.zone_ids), len(self.weight_cols), len(self.time_windows))
+
+    def setCounts(self, cdr, sz_id_col='SITEID'):
+        """ Calculate the unscaled sums from all counts of <cdr> """
+        self.counts, self.present, self.totals = siteCounts(cdr, self.site_ids, self.time_windows, sz_id_col)
+        self.unscaled = self.weighted(np.arange(len(self.pair_site)), self.counts)
+
+    def update(self, cdr, sz_id_col='SITEID'):
+        """
+        Patch the unscaled sums with the changed counts of <cdr>. Returns the number of changed sites and
+        the number of target zones whose sums changed.
+        """
+        counts, present, totals = siteCounts(cdr, self.site_ids, self.time_windows, sz_id_col)
+        delta = counts - self.counts
+        dirty_sites = np.nonzero((delta != 0).any(axis=1) | (present != self.present))[0]
+
+        dirty_pairs = np.nonzero(np.isin(self.pair_site, dirty_sites))[0]
+        if len(dirty_pairs) > 0:
+            # Only the rows of the changed sites are non-zero in <delta>
+            self.unscaled += self.weighted(dirty_pairs, delta)
+
+        self.counts, self.present, self.totals = counts, present, totals
+        self.updates += 1
+        return len(dirty_sites), len(np.unique(self.pair_zone[dirty_pairs]))
+
+    def zrop(self):
+        """
+        Target zone ids (sorted) and the (target zones x weights x time windows) ZROP. As in the full run,
+        only the zones with subunits of sites in the CDR data are included.
+        """
+        in_cdr = np.zeros(len(self.zone_ids), dtype=bool)
+        in_cdr[self.pair_zone[self.present[self.pair_site]]] = True
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zrop = self.unscaled[in_cdr] / self.totals
+        return self.zone_ids[in_cdr], np.nan_to_num(zrop)
+
+    #------------------------------------------------------------
+    # Storing the state
+    #------------------------------------------------------------
+
+    def save(self, state_dir, counts_only=False):
+        """ Store the state, with <counts_only> only the parts that change in an update """
+        def replace(name, write):
+            fp = os.path.join(state_dir, name)
+            with open(fp + '.tmp', 'wb' if name.endswith('.npz') else 'w') as f:
+                write(f)
+            os.replace(fp + '.tmp', fp)
+
+        os.makedirs(state_dir, exist_ok=True)
+        if not counts_only:
+            # Ids as numbers or fixed width strings, so the state is loaded without pickle
+            replace('zrop_state.npz', lambda f: np.savez(f, site_ids=storableIds(self.site_ids),
+                                                         zone_ids=storableIds(self.zone_ids),
+                                                         pair_site=self.pair_site, pair_zone=self.pair_zone,
+                                                         contributions=self.contributions))
+        replace('zrop_counts.npz', lambda f: np.savez(f, counts=self.counts, present=self.present,
+                                                      totals=self.totals, unscaled=self.unscaled))
+
+        meta = {'key': self.key, 'time_windows': self.time_windows, 'weight_cols': self.weight_cols,
+                'updates': self.updates}
+        replace('zrop_state.json', lambda f: json.dump(meta, f, indent=2))
+
+    @classmethod
+    def load(cls, state_dir, key=None):
+        """ Stored state in <state_dir>, None if there is none or if it was stored with another <key> """
+        meta_fp = os.path.join(state_dir, 'zrop_state.json')
+        if not os.path.exists(meta_fp):
+            return None
+        with open(meta_fp) as f:
+            meta = json.load(f)
+        if key is not None and meta['key'] != key:
+            return None
+
+        arrays = np.load(os.path.join(state_dir, 'zrop_state.npz'))
+        state = cls(arrays['site_ids'], arrays['zone_ids'], arrays['pair_site'], arrays['pair_zone'],
+                    arrays['contributions'], meta['time_windows'], meta['weight_cols'], key=meta['key'])
+        counts = np.load(os.path.join(state_dir, 'zrop_counts.npz'))
+        state.counts, state.present = counts['counts'], counts['present']
+        state.totals, state.unscaled = counts['totals'], counts['unscaled']
+        state.updates = meta['updates']
+        return state
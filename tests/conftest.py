@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The scripts of the repository are flat modules in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# YKR lattice of the synthetic MFD inputs: 40 x 40 cells of 250 m
+LATTICE = {'x0': 0.0, 'y0': 10000.0, 'cell_size': 250.0, 'ncols': 40, 'first_id': 1, 'nrows': 40}
+
+
+@pytest.fixture
+def mfd_inputs(tmp_path, monkeypatch):
+    """ Time use, DPS (sites of spatially coherent cell blocks), mobile phone data and the lattice of an MFD run """
+    gpd = pytest.importorskip('geopandas')
+    shapely = pytest.importorskip('shapely')
+    import mfd_interpolation
+    from ykr_grid import cellBounds, saveLattice
+
+    rng = np.random.default_rng(0)
+    n = 3000
+    ykr = rng.integers(1, 1601, n)
+    rows, cols = (ykr - 1) // 40, (ykr - 1) % 40
+    site = (rows // 5) * 8 + cols // 5 + rng.integers(0, 2, n)
+
+    tu = pd.DataFrame({'Spatial_unit': ['building', 'land'], 'Activity_function_type': ['residential', 'other'],
+                       'Seasonal_factor': [1.0, 0.8], **{'H%st' % h: rng.random(2) for h in range(24)}})
+    k = rng.integers(0, 2, n)
+    minx, miny, maxx, maxy = cellBounds(ykr, LATTICE)
+    dps = gpd.GeoDataFrame({'SITEID': site, 'YKR_ID': ykr, 'SPUT': tu['Spatial_unit'].values[k],
+                            'AFT': tu['Activity_function_type'].values[k], 'SF': tu['Seasonal_factor'].values[k],
+                            'RFA': rng.random(n)}, geometry=shapely.points((minx + maxx) / 2, (miny + maxy) / 2), crs=3067)
+    cdr = pd.DataFrame({'SITEID': np.arange(site.max() + 1), **{'H%sm' % h: rng.random(site.max() + 1) * 100 for h in range(24)}})
+
+    paths = {'hat_fp': str(tmp_path / 'tu.csv'), 'dps_fp': str(tmp_path / 'dps.shp'), 'cdr_fp': str(tmp_path / 'cdr.csv'),
+             'tz_lattice_fp': str(tmp_path / 'lattice.json')}
+    tu.to_csv(paths['hat_fp'], index=False)
+    dps.to_file(paths['dps_fp'])
+    cdr.to_csv(paths['cdr_fp'], index=False)
+    saveLattice(LATTICE, paths['tz_lattice_fp'])
+
+    # Time use as csv (the Excel reader is not needed for the tests)
+    monkeypatch.setattr(mfd_interpolation.pd, 'read_excel', lambda fp, sheet_name=0: pd.read_csv(fp))
+    return paths, dps
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from background_writer import BackgroundWriter, WriteError
+
+
+def writeText(fp, text):
+    with open(fp, 'w') as f:
+        f.write(text)
+    return fp
+
+
+@pytest.mark.parametrize('mode', [None, 'thread', 'process'])
+def test_writes_and_callbacks(tmp_path, mode):
+    recorded = []
+    with BackgroundWriter(max_pending=2, mode=mode) as writer:
+        for i in range(5):
+            fp = str(tmp_path / ('%s.txt' % i))
+            writer.submit(writeText, fp, str(i), outputs=[fp], on_done=recorded.append)
+    assert sorted(recorded) == sorted(str(tmp_path / ('%s.txt' % i)) for i in range(5))
+
+
+@pytest.mark.parametrize('mode', ['thread', 'process'])
+def test_failed_callback_is_raised(tmp_path, mode):
+    def failingRecord(result):
+        raise OSError("disk full")
+
+    fp = str(tmp_path / 'a.txt')
+    with pytest.raises(WriteError, match='disk full'):
+        with BackgroundWriter(mode=mode) as writer:
+            writer.submit(writeText, fp, 'a', outputs=[fp], on_done=failingRecord)
+    assert os.path.exists(fp)
+
+
+def test_failed_write_is_raised_at_close(tmp_path):
+    fp = str(tmp_path / 'missing' / 'a.txt')
+    with pytest.raises(WriteError):
+        with BackgroundWriter(mode='thread') as writer:
+            writer.submit(writeText, fp, 'a', outputs=[fp])
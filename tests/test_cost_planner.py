@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cost_planner import BASE_MB, calibrate, planPipeline, recommend, recordBenchmark, readBenchmarks, stageWork
+from pipeline_dag import resolvePipeline
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    """ CDR aggregation stage on a small raw csv-file """
+    rng = np.random.default_rng(0)
+    n = 5000
+    fp = str(tmp_path / 'raw.csv')
+    pd.DataFrame({'SITEID': rng.integers(0, 50, n), 'DATE_TIME': '2018-03-05 10:00', 'WEEKDAY': 0,
+                  'HOUR': rng.integers(0, 24, n), 'X': 0.0, 'Y': 0.0, 'HSPA_CALLS': rng.random(n)}).to_csv(fp, index=False)
+    return [{'name': 'cdr', 'stage': 'cdr', 'params': {'fp': fp}, 'inputs': ['{fp}'],
+             'outputs': [str(tmp_path / 'hourly.csv')]}]
+
+
+def test_plan_uses_median_rates_of_recorded_benchmarks(pipeline, tmp_path):
+    state_dir = str(tmp_path / 'state')
+    stage = resolvePipeline(pipeline)['cdr']
+    features, time_work, memory_work = stageWork(stage)
+    assert 4500 < features['rows'] < 5500
+
+    os.makedirs(state_dir)
+    recordBenchmark(state_dir, stage, 2.0, BASE_MB + 100)
+    recordBenchmark(state_dir, stage, 4.0, BASE_MB + 300)
+    benchmarks = readBenchmarks(state_dir)
+    assert len(benchmarks) == 2
+
+    time_rate, memory_rate, n_runs = calibrate(benchmarks, 'cdr')
+    assert n_runs == 2
+    assert np.isclose(time_rate, 3.0 / time_work)
+    assert np.isclose(memory_rate, 200.0 / memory_work)
+
+    plan, workers = planPipeline(pipeline, state_dir=state_dir, memory_mb=16000)
+    row = plan.iloc[0]
+    assert row['seconds'] == 3.0
+    assert row['peak_mb'] == round(BASE_MB + 200)
+    assert row['calibration'] == '2 runs'
+    assert row['recommendation'] == ''
+
+    # Over the budget --> streaming aggregation with a chunk size
+    plan, workers = planPipeline(pipeline, state_dir=state_dir, memory_mb=BASE_MB + 100)
+    assert plan.iloc[0]['recommendation'].startswith('use cdr-stream with chunksize=')
+    assert workers == 1
+
+
+def test_median_is_not_moved_by_an_outlier():
+    runs = [{'stage': 'cdr', 'time_work': 100.0, 'memory_work': 10.0, 'seconds': s, 'peak_mb': BASE_MB + m}
+            for s, m in [(1.0, 10.0), (2.0, 20.0), (100.0, 1000.0)]]
+    time_rate, memory_rate, n_runs = calibrate(runs, 'cdr')
+    assert (time_rate, memory_rate, n_runs) == (0.02, 2.0, 3)
+    # Stages without benchmarks use the default rates
+    assert calibrate(runs, 'interpolation')[2] == 0
+
+
+def test_recommendations_over_budget():
+    assert recommend('interpolation', {}, 5000.0, 2300.0, 1.0) == "split into 3 runs (subsets or time steps/weights per run)"
+    chunk = recommend('cdr-stream', {'rows': 10 ** 9, 'indicators': 1}, 5000.0, 2300.0, 1.0)
+    assert chunk == "chunksize=%s" % int(2300.0 * 0.25 / (8.0 * 8 * 6 / 1e6))
+    assert recommend('dps', {}, 5000.0, 2300.0, 1.0) == "needs more memory than the budget"
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from creation_of_mfd_buildings import areaMatcher, estimateFloorAreas
+
+
+def joinedBuildings(seed=0, n=300):
+    """ NLS buildings joined with municipal floor areas (some UIDs matched several municipal buildings) """
+    rng = np.random.default_rng(seed)
+    uid = rng.integers(0, 220, n)
+    matched = rng.random(n) < 0.8
+    df = pd.DataFrame({'UID': uid,
+                       'FLAREA': np.where(matched & (rng.random(n) < 0.6), rng.uniform(50, 2000, n), np.nan),
+                       'FLCOUNT': np.where(matched & (rng.random(n) < 0.7), rng.integers(1, 8, n), np.nan),
+                       'AREA_x': rng.uniform(30, 800, n),
+                       'AREA_y': np.where(matched, rng.uniform(20, 900, n), np.nan),
+                       'AFT_nls_os': rng.choice(['residential', 'service', 'work', 'other'], n)})
+    multimatches = sorted(set(df.loc[df['UID'].duplicated(), 'UID']))
+    return df, multimatches
+
+
+def test_floor_areas_equal_row_by_row_rules():
+    df, multimatches = joinedBuildings()
+    expected = df.copy()
+    areaMatcher(df.copy(), expected, multimatches)
+
+    result = estimateFloorAreas(df, multimatches)
+    assert list(result.index) == list(expected.index)
+    assert np.allclose(result['FA'], expected['FA'], equal_nan=True)
+    assert np.array_equal(result['MM'], expected['MM'])
+    assert np.allclose(result['AREA_y'], expected['AREA_y'], equal_nan=True)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from dps_loader import readAttributes, readDbfHeader
+
+
+def writeLayer(tmp_path, n=200):
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 5000, n), rng.uniform(0, 5000, n)
+    layer = gpd.GeoDataFrame({'SITEID': rng.integers(0, 30, n), 'YKR_ID': rng.integers(1, 400, n),
+                              'SPUT': rng.choice(['land', 'building'], n), 'AFT': rng.choice(['work', 'other'], n),
+                              'SF': rng.choice([0.1, 0.9], n), 'RFA': rng.random(n)},
+                             geometry=shapely.box(x, y, x + 10, y + 10), crs=3067)
+    fp = str(tmp_path / 'dps.shp')
+    layer.to_file(fp)
+    return fp, gpd.read_file(fp)
+
+
+def test_attributes_equal_full_read(tmp_path):
+    fp, full = writeLayer(tmp_path)
+    df = readAttributes(fp)
+    pd.testing.assert_frame_equal(df, pd.DataFrame(full.drop(columns='geometry')), check_dtype=False)
+    assert readDbfHeader(fp.replace('.shp', '.dbf'))[0] == len(full)
+
+
+def test_filtered_attributes_with_lazy_geometry(tmp_path):
+    fp, full = writeLayer(tmp_path)
+    sites = [3, 7, 11]
+    df = readAttributes(fp, columns=['SITEID', 'RFA'], where={'SITEID': sites}, lazy_geometry=True)
+
+    expected = full.loc[full['SITEID'].isin(sites)]
+    assert list(df.index) == list(expected.index)
+    assert np.allclose(df['RFA'], expected['RFA'])
+    assert df.attrs['geometry'].attach(df).geometry.equals(expected.geometry)
+
+
+def test_filter_with_numpy_values(tmp_path):
+    fp, full = writeLayer(tmp_path)
+    zones = full['YKR_ID'].unique()[:20]
+    df = readAttributes(fp, columns=['YKR_ID', 'AFT'], where={'YKR_ID': zones, 'AFT': np.array(['work'])})
+    expected = full.loc[full['YKR_ID'].isin(zones) & (full['AFT'] == 'work')]
+    assert list(df.index) == list(expected.index)
+
+
+def test_filter_with_quotes_in_strings(tmp_path):
+    fp, full = writeLayer(tmp_path)
+    layer = full.copy()
+    layer.loc[::3, 'AFT'] = "children's day care"
+    layer.to_file(fp)
+
+    df = readAttributes(fp, columns=['AFT'], where={'AFT': ["children's day care", 'other']})
+    expected = layer.loc[layer['AFT'].isin(["children's day care", 'other'])]
+    assert list(df.index) == list(expected.index)
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from mfd_interpolation import calculateZROPArray, calculateEHP, calculateROP, calculateZROP
+
+TIME_WINDOWS = ['H0', 'H1', 'H2']
+
+
+def joinedLayers(seed=0, n=300):
+    """ Subunits joined with time use and RMP (as after joinLayers), with missing source and target zones """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'SITEID': rng.integers(0, 15, n).astype(float), 'YKR_ID': rng.integers(100, 160, n).astype(float),
+                       'RFA': rng.random(n), 'AW': rng.random(n), 'Seasonal_factor': rng.choice([0.1, 0.9, 1.0], n)})
+    for tw in TIME_WINDOWS:
+        df[tw + 't'] = rng.random(n)
+        df['RMP %sm' % tw] = rng.random(n) / 15
+    df.loc[rng.random(n) < 0.05, 'SITEID'] = np.nan
+    df.loc[rng.random(n) < 0.05, 'YKR_ID'] = np.nan
+    return df
+
+
+def baselineZROP(df, time_window):
+    """ ZROP of one time window with the per-hour functions (RFA weight) """
+    df = calculateEHP(df.copy(), time_window, 'SITEID', 'Seasonal_factor')
+    df = calculateROP(df, time_window)
+    return calculateZROP(df, time_window, 'YKR_ID').set_index('YKR_ID')['ZROP %s' % time_window]
+
+
+def test_vectorized_zrop_equals_per_hour_functions():
+    df = joinedLayers()
+    zone_ids, zrop = calculateZROPArray(df, TIME_WINDOWS, ['RFA', 'AW'], 'SITEID', 'YKR_ID', 'Seasonal_factor')
+
+    assert zrop.shape == (len(zone_ids), 2, len(TIME_WINDOWS))
+    for h, tw in enumerate(TIME_WINDOWS):
+        expected = baselineZROP(df, tw)
+        assert np.array_equal(zone_ids, expected.index.values)
+        assert np.allclose(zrop[:, 0, h], expected.values)
+
+    # Other weights give the same as the baseline with the weight as RFA
+    for h, tw in enumerate(TIME_WINDOWS):
+        assert np.allclose(zrop[:, 1, h], baselineZROP(df.assign(RFA=df['AW']), tw).values)
+
+
+def test_missing_target_zone_is_not_added_to_another_zone():
+    df = pd.DataFrame({'SITEID': [1, 1, 1], 'YKR_ID': [10, 20, np.nan], 'RFA': [1.0, 1.0, 2.0],
+                       'Seasonal_factor': 1.0, 'H0t': 1.0, 'RMP H0m': 1.0})
+    zone_ids, zrop = calculateZROPArray(df, ['H0'], ['RFA'], 'SITEID', 'YKR_ID', 'Seasonal_factor')
+    assert list(zone_ids) == [10, 20]
+    assert np.allclose(zrop[:, 0, 0], [0.25, 0.25])
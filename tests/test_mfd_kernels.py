@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import mfd_kernels
+from mfd_kernels import segmentSum, segmentNormalize
+
+
+@pytest.fixture(params=['numpy', 'numba'])
+def backend(request):
+    if request.param == 'numba':
+        pytest.importorskip('numba')
+    mfd_kernels.setBackend(request.param)
+    yield request.param
+    mfd_kernels.setBackend('auto')
+
+
+@pytest.mark.parametrize('sort', [True, False])
+def test_segment_sum_equals_groupby(backend, sort):
+    rng = np.random.default_rng(0)
+    keys = rng.integers(0, 50, 2000)
+    if sort:
+        keys = np.sort(keys)
+    values = rng.random((2000, 3))
+    codes, uniques = pd.factorize(keys)
+
+    expected = pd.DataFrame(values).groupby(codes).sum().values
+    assert np.allclose(segmentSum(values, codes, len(uniques)), expected)
+    assert np.allclose(segmentSum(values[:, 0], codes, len(uniques)), expected[:, 0])
+
+
+def test_segment_normalize_sums_to_one(backend):
+    codes = np.array([0, 0, 1, 2, 2, 2])
+    values = np.array([1.0, 3.0, 0.0, 1.0, 1.0, 2.0])
+    normalized = segmentNormalize(values, codes, 3)
+    assert np.allclose(normalized, [0.25, 0.75, 0.0, 0.25, 0.25, 0.5])
+
+
+def test_missing_keys_are_rejected(backend):
+    with pytest.raises(ValueError):
+        segmentSum(np.ones(3), np.array([0, -1, 1]), 2)
+
+
+@pytest.mark.parametrize('sort', [True, False])
+def test_numba_backend_equals_numpy_backend(sort):
+    pytest.importorskip('numba')
+    rng = np.random.default_rng(1)
+    codes = rng.integers(0, 40, 3000)
+    if sort:
+        codes = np.sort(codes)
+    values = rng.random((3000, 4))
+
+    results = {}
+    try:
+        for name in ['numpy', 'numba']:
+            mfd_kernels.setBackend(name)
+            results[name] = (segmentSum(values, codes, 40), segmentNormalize(values, codes, 40))
+    finally:
+        mfd_kernels.setBackend('auto')
+    for numpy_result, numba_result in zip(results['numpy'], results['numba']):
+        assert np.allclose(numba_result, numpy_result)
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from mobilephonedata_streaming import aggregateHourlyMedians, KEY_COLS
+from mobilephonedata_incremental import createState, appendDays
+
+
+def rawDays(days, seed=0, n_per_day=400):
+    """ Raw records of <days> with missing values and several records of some hours """
+    rng = np.random.default_rng(seed)
+    parts = []
+    for day in days:
+        n = n_per_day
+        parts.append(pd.DataFrame({'SITEID': rng.integers(0, 8, n), 'DATE_TIME': '%s 00:00' % day,
+                                   'WEEKDAY': pd.Timestamp(day).weekday(), 'HOUR': rng.integers(0, 6, n),
+                                   'X': 0.0, 'Y': 0.0, 'HSPA_CALLS': rng.integers(0, 50, n).astype(float)}))
+    raw = pd.concat(parts, ignore_index=True)
+    raw.loc[rng.random(len(raw)) < 0.15, 'HSPA_CALLS'] = np.nan
+    return raw
+
+
+def writeCsv(tmp_path, name, raw):
+    fp = str(tmp_path / name)
+    raw.to_csv(fp, index=False)
+    return fp
+
+
+def fullMedians(tmp_path, raw, method='exact'):
+    medians, sites = aggregateHourlyMedians(writeCsv(tmp_path, 'full.csv', raw), method=method)
+    return medians.sort_values(KEY_COLS).reset_index(drop=True)
+
+
+def assertSameMedians(incremental, full):
+    merged = full.merge(incremental, on=KEY_COLS, how='outer', suffixes=('_full', '_inc'))
+    assert len(merged) == len(full) == len(incremental)
+    assert np.allclose(merged['HSPA_CALLS_inc'], merged['HSPA_CALLS_full'], equal_nan=True)
+
+
+def test_buffer_updates_equal_full_recompute(tmp_path):
+    days = [d.date().isoformat() for d in pd.date_range('2018-03-05', periods=10)]
+    raw = rawDays(days)
+    state_dir = str(tmp_path / 'state')
+    createState(state_dir, mode='buffer')
+
+    appendDays(writeCsv(tmp_path, 'a.csv', raw.loc[raw['DATE_TIME'] < days[5]]), state_dir)
+    medians = appendDays(writeCsv(tmp_path, 'b.csv', raw.loc[raw['DATE_TIME'] >= days[5]]), state_dir)
+    assertSameMedians(medians, fullMedians(tmp_path, raw))
+
+    # A day delivered again replaces the earlier values of the day
+    redelivered = rawDays([days[2]], seed=1)
+    medians = appendDays(writeCsv(tmp_path, 'c.csv', redelivered), state_dir)
+    raw = pd.concat([raw.loc[~raw['DATE_TIME'].str.startswith(days[2])], redelivered], ignore_index=True)
+    assertSameMedians(medians, fullMedians(tmp_path, raw))
+
+    # One part file per day
+    assert sorted(os.listdir(os.path.join(state_dir, 'values'))) == ['DATE=%s' % day for day in days]
+
+
+def test_buffer_window_expires_day_files(tmp_path):
+    days = [d.date().isoformat() for d in pd.date_range('2018-03-05', periods=9)]
+    raw = rawDays(days, seed=2)
+    state_dir = str(tmp_path / 'state')
+    createState(state_dir, mode='buffer', window_days=4)
+
+    for i in range(0, 9, 3):
+        chunk = raw.loc[raw['DATE_TIME'].str.slice(0, 10).isin(days[i:i + 3])]
+        medians = appendDays(writeCsv(tmp_path, 'd%s.csv' % i, chunk), state_dir)
+
+    in_window = raw.loc[raw['DATE_TIME'].str.slice(0, 10).isin(days[-4:])]
+    assertSameMedians(medians, fullMedians(tmp_path, in_window))
+    assert sorted(os.listdir(os.path.join(state_dir, 'values'))) == ['DATE=%s' % day for day in days[-4:]]
+
+
+def test_histogram_updates_equal_streaming_sketch(tmp_path):
+    days = [d.date().isoformat() for d in pd.date_range('2018-03-05', periods=6)]
+    raw = rawDays(days, seed=3)
+    state_dir = str(tmp_path / 'state')
+    createState(state_dir, mode='histogram')
+
+    appendDays(writeCsv(tmp_path, 'a.csv', raw.loc[raw['DATE_TIME'] < days[3]]), state_dir)
+    medians = appendDays(writeCsv(tmp_path, 'b.csv', raw.loc[raw['DATE_TIME'] >= days[3]]), state_dir)
+
+    # Keys with only missing values have no sketch
+    assertSameMedians(medians.dropna(subset=['HSPA_CALLS']), fullMedians(tmp_path, raw, method='sketch'))
+
+
+def test_days_of_other_day_types_leave_state_unchanged(tmp_path):
+    days = [d.date().isoformat() for d in pd.date_range('2018-03-05', periods=7)]
+    raw = rawDays(days)
+    weekend = raw['WEEKDAY'] >= 5
+    state_dir = str(tmp_path / 'state')
+    createState(state_dir, mode='buffer', day_types={'mon_thu': [0, 1, 2, 3]})
+
+    medians = appendDays(writeCsv(tmp_path, 'weekdays.csv', raw.loc[~weekend]), state_dir)
+    unchanged = appendDays(writeCsv(tmp_path, 'weekend.csv', raw.loc[weekend]), state_dir)
+    pd.testing.assert_frame_equal(unchanged, medians)
+    assert sorted(os.listdir(os.path.join(state_dir, 'values'))) == ['DATE=%s' % day for day in days[:4]]
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from mobilephonedata_parquet import convertCsvToParquet, readMobilePhoneData
+
+
+def test_converting_again_replaces_earlier_partitions(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 500
+    raw = pd.DataFrame({'SITEID': rng.integers(0, 10, n),
+                        'DATE_TIME': rng.choice(['2018-03-05 10:00', '2018-03-06 11:00', '2018-03-09 12:00'], n),
+                        'HOUR': rng.integers(0, 24, n), 'X': 0.0, 'Y': 0.0, 'HSPA_CALLS': rng.random(n)})
+    raw['WEEKDAY'] = pd.to_datetime(raw['DATE_TIME']).dt.weekday
+    fp, out_dir = str(tmp_path / 'raw.csv'), str(tmp_path / 'parquet')
+    raw.to_csv(fp, index=False)
+
+    # Several chunks per partition, converted again with other chunks (other part file names)
+    convertCsvToParquet(fp, out_dir, chunksize=100)
+    convertCsvToParquet(fp, out_dir, chunksize=150)
+
+    data = readMobilePhoneData(out_dir)
+    assert len(data) == n
+    assert (readMobilePhoneData(out_dir, weekdays=[0], siteids=[3])['SITEID'] == 3).sum() == \
+        ((raw['WEEKDAY'] == 0) & (raw['SITEID'] == 3)).sum()
+
+
+def test_minutes_of_sub_hourly_data_are_kept(tmp_path):
+    rng = np.random.default_rng(1)
+    n = 400
+    raw = pd.DataFrame({'SITEID': rng.integers(0, 10, n), 'DATE_TIME': '2018-03-05 10:00', 'WEEKDAY': 0,
+                        'HOUR': rng.integers(0, 24, n), 'MINUTE': rng.choice([0, 15, 30, 45], n), 'X': 0.0, 'Y': 0.0,
+                        'HSPA_CALLS': rng.random(n)})
+    fp, out_dir = str(tmp_path / 'raw.csv'), str(tmp_path / 'parquet')
+    raw.to_csv(fp, index=False)
+    convertCsvToParquet(fp, out_dir, chunksize=150)
+
+    data = readMobilePhoneData(out_dir)
+    assert pd.api.types.is_integer_dtype(data['MINUTE'])
+    keys = ['SITEID', 'HOUR', 'MINUTE']
+    merged = raw.groupby(keys)['HSPA_CALLS'].sum().reset_index().merge(
+        data.groupby(keys)['HSPA_CALLS'].sum().reset_index(), on=keys, suffixes=('_csv', '_parquet'))
+    assert len(merged) == raw[keys].drop_duplicates().shape[0]
+    assert np.allclose(merged['HSPA_CALLS_csv'], merged['HSPA_CALLS_parquet'], rtol=1e-6)
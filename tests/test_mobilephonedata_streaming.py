@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from mobilephonedata_streaming import QuantileSketch, aggregateHourlyMedians, KEY_COLS
+
+
+def rawData(seed=0, n=6000):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'SITEID': rng.integers(0, 20, n), 'WEEKDAY': rng.integers(0, 7, n),
+                       'HOUR': rng.integers(0, 24, n), 'X': 0.0, 'Y': 0.0,
+                       'HSPA_CALLS': rng.lognormal(3, 1, n).round()})
+    df.loc[rng.random(n) < 0.1, 'HSPA_CALLS'] = 0.0
+    df.loc[rng.random(n) < 0.05, 'HSPA_CALLS'] = np.nan
+    df['X'] = df['SITEID'] * 100.0
+    return df
+
+
+def test_sketch_median_within_relative_accuracy_of_exact(tmp_path):
+    fp = str(tmp_path / 'raw.csv')
+    rawData().to_csv(fp, index=False)
+
+    exact, sites = aggregateHourlyMedians(fp, method='exact', chunksize=1000)
+    sketch, sites = aggregateHourlyMedians(fp, method='sketch', chunksize=1000, relative_accuracy=0.01)
+
+    # Groups with only missing values have no sketch (NaN median after pivoting in both methods)
+    exact = exact.dropna(subset=['HSPA_CALLS'])
+    merged = exact.merge(sketch, on=KEY_COLS, suffixes=('_exact', '_sketch'), how='outer')
+    assert len(merged) == len(exact) == len(sketch)
+    assert np.allclose(merged['HSPA_CALLS_sketch'], merged['HSPA_CALLS_exact'], rtol=0.01, atol=0)
+
+
+def test_merged_sketches_equal_one_sketch():
+    df = rawData(seed=1)
+    keys, values = df[['SITEID', 'HOUR']], df['HSPA_CALLS'].values
+
+    whole = QuantileSketch()
+    whole.update(keys, values)
+    first, second = QuantileSketch(), QuantileSketch()
+    first.update(keys.iloc[:2500], values[:2500])
+    second.update(keys.iloc[2500:], values[2500:])
+    first.merge(second)
+
+    assert first.quantile(0.5).equals(whole.quantile(0.5))
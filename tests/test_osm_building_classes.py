@@ -0,0 +1,31 @@
+import pandas as pd
+
+from osm_building_classes import readRules, compileRules, classifyBuildings, lookupActivityType
+
+
+def rulesWithAmenity():
+    rules = readRules()
+    extra = pd.DataFrame({'key': ['amenity'], 'value': ['school'], 'activity_type': ['work'], 'priority': [4]})
+    return compileRules(pd.concat([rules, extra], ignore_index=True))
+
+
+def test_vectorized_matches_single_building_lookup():
+    compiled = rulesWithAmenity()
+    df = pd.DataFrame({'building': ['house', 'yes', 'apartments', 'newtag', None, 'retail'],
+                       'amenity': [None, 'school', None, 'school', 'school', 'pub']})
+    activity_type, unmapped = classifyBuildings(df, compiled)
+
+    for i, row in df.iterrows():
+        tags = {key: value for key, value in row.items() if value is not None}
+        assert activity_type[i] == (lookupActivityType(tags, compiled) or "")
+
+
+def test_unmapped_building_values_reported_per_key():
+    compiled = rulesWithAmenity()
+    df = pd.DataFrame({'building': ['newtag', 'newtag', 'house'], 'amenity': ['school', None, 'pub']})
+    activity_type, unmapped = classifyBuildings(df, compiled)
+
+    # Classified by its amenity tag, the new building value is still reported
+    assert activity_type[0] == 'work'
+    assert unmapped['building'].to_dict() == {'newtag': 2}
+    assert unmapped['amenity'].to_dict() == {'pub': 1}
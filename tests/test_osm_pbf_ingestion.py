@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('osmium')
+gpd = pytest.importorskip('geopandas')
+shapely = pytest.importorskip('shapely')
+
+from osm_pbf_ingestion import readBuildingsFromPbf
+
+# Closed building ways: a house, an unclassified building and a warehouse outside the study area;
+# a multipolygon relation of apartments with a courtyard
+NODES = {1: (24.900, 60.200), 2: (24.901, 60.200), 3: (24.901, 60.201), 4: (24.900, 60.201),
+         5: (24.910, 60.200), 6: (24.913, 60.200), 7: (24.913, 60.203), 8: (24.910, 60.203),
+         9: (24.911, 60.201), 10: (24.912, 60.201), 11: (24.912, 60.202), 12: (24.911, 60.202),
+         13: (24.920, 60.200), 14: (24.921, 60.200), 15: (24.921, 60.201), 16: (24.920, 60.201),
+         17: (25.500, 60.200), 18: (25.501, 60.200), 19: (25.501, 60.201), 20: (25.500, 60.201)}
+
+OSM = """<?xml version='1.0' encoding='UTF-8'?>
+<osm version="0.6" generator="test">
+%(nodes)s
+  <way id="100" version="1"><nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="1"/>
+    <tag k="building" v="house"/><tag k="name" v="Talo"/></way>
+  <way id="101" version="1"><nd ref="5"/><nd ref="6"/><nd ref="7"/><nd ref="8"/><nd ref="5"/></way>
+  <way id="102" version="1"><nd ref="9"/><nd ref="10"/><nd ref="11"/><nd ref="12"/><nd ref="9"/></way>
+  <relation id="200" version="1"><member type="way" ref="101" role="outer"/><member type="way" ref="102" role="inner"/>
+    <tag k="type" v="multipolygon"/><tag k="building" v="apartments"/></relation>
+  <way id="103" version="1"><nd ref="13"/><nd ref="14"/><nd ref="15"/><nd ref="16"/><nd ref="13"/>
+    <tag k="building" v="yes"/></way>
+  <way id="104" version="1"><nd ref="17"/><nd ref="18"/><nd ref="19"/><nd ref="20"/><nd ref="17"/>
+    <tag k="building" v="warehouse"/></way>
+</osm>
+"""
+
+
+def polygon3067(shell, holes=()):
+    geom = shapely.Polygon([NODES[n] for n in shell], [[NODES[n] for n in hole] for hole in holes])
+    return gpd.GeoSeries([geom], crs='epsg:4326').to_crs(epsg=3067).iloc[0]
+
+
+@pytest.mark.parametrize('batch_size', [1, 50000])
+def test_buildings_from_extract(tmp_path, batch_size):
+    fp = tmp_path / 'extract.osm'
+    nodes = '\n'.join('  <node id="%s" version="1" lat="%s" lon="%s"/>' % (i, lat, lon) for i, (lon, lat) in NODES.items())
+    fp.write_text(OSM % {'nodes': nodes})
+    study_area = gpd.GeoDataFrame(geometry=[shapely.box(24.8, 60.1, 25.0, 60.3)], crs='epsg:4326').to_crs(epsg=3067)
+
+    buildings = readBuildingsFromPbf(str(fp), study_area, batch_size=batch_size)
+    buildings = buildings.sort_values('building').reset_index(drop=True)
+
+    # The unclassified building and the building outside the study area are dropped
+    assert buildings.crs == study_area.crs
+    assert list(buildings['building']) == ['apartments', 'house']
+    assert list(buildings['activity_type']) == ['residential', 'residential']
+    assert buildings['name'].isna()[0] and buildings['name'][1] == 'Talo'
+
+    expected = [polygon3067([5, 6, 7, 8, 5], [[9, 10, 11, 12, 9]]), polygon3067([1, 2, 3, 4, 1])]
+    for geom, expected_geom in zip(buildings.geometry, expected):
+        assert np.isclose(geom.area, expected_geom.area)
+        assert geom.symmetric_difference(expected_geom).area < 1e-6 * expected_geom.area
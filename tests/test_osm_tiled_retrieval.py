@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import osm_tiled_retrieval
+from osm_tiled_retrieval import fetchBuildingsTiled
+
+# Two tiles of 0.5 degrees (west and east of 25.0)
+TILE_SIZE = 0.5
+
+
+def way(osmid, west, south, size=0.01):
+    coords = [(west, south), (west + size, south), (west + size, south + size), (west, south + size), (west, south)]
+    return {'type': 'way', 'id': osmid, 'tags': {'building': 'yes'},
+            'geometry': [{'lon': lon, 'lat': lat} for lon, lat in coords]}
+
+
+class StandInOverpass(BaseHTTPRequestHandler):
+    """ Overpass stand-in: one building per tile plus a building on the tile border, ETag by tile """
+
+    def do_POST(self):
+        query = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))['data'][0]
+        south, west, north, east = map(float, re.search(r'way\["building"\]\(([^)]+)\)', query).group(1).split(','))
+        etag = '"%s-%s"' % (west, self.server.version)
+        self.server.requests.append({'west': west, 'if_none_match': self.headers.get('If-None-Match')})
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        elements = [way(int(west * 10), west + 0.1, south + 0.1), way(1, 24.995, 60.2)]
+        content = json.dumps({'elements': elements}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        if self.server.truncate > 0:
+            # Response cut off after the headers
+            self.server.truncate -= 1
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content[:10])
+            return
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def overpass():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInOverpass)
+    server.requests, server.version, server.truncate = [], 1, 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def polygon():
+    shapely_geometry = pytest.importorskip('shapely.geometry')
+    return shapely_geometry.box(24.6, 60.1, 25.4, 60.4)
+
+
+def fetch(polygon, cache_dir, server, **kwargs):
+    url = 'http://127.0.0.1:%s/api/interpreter' % server.server_address[1]
+    return fetchBuildingsTiled(polygon, str(cache_dir), tile_size=TILE_SIZE, max_workers=2, overpass_url=url, **kwargs)
+
+
+def readMeta(cache_dir):
+    metas = {}
+    for name in os.listdir(cache_dir):
+        if name.endswith('.meta.json'):
+            with open(os.path.join(cache_dir, name)) as f:
+                metas[name] = json.load(f)
+    return metas
+
+
+def test_tiles_are_cached_and_border_buildings_deduplicated(overpass, polygon, tmp_path):
+    buildings = fetch(polygon, tmp_path, overpass)
+    assert len(overpass.requests) == 2
+    assert sorted(buildings['osmid']) == [1, 245, 250]
+
+    metas = readMeta(tmp_path)
+    assert len(metas) == 2
+    for meta in metas.values():
+        assert 'way["building"]' in meta['query']
+        assert meta['timestamp'] > 0
+        assert meta['etag'].startswith('"')
+
+    # Fresh cache --> no requests
+    assert len(fetch(polygon, tmp_path, overpass)) == 3
+    assert len(overpass.requests) == 2
+
+
+def test_stale_tiles_are_revalidated_with_etag(overpass, polygon, tmp_path):
+    fetch(polygon, tmp_path, overpass)
+    timestamps = {name: meta['timestamp'] for name, meta in readMeta(tmp_path).items()}
+
+    buildings = fetch(polygon, tmp_path, overpass, max_age_days=0)
+    revalidations = overpass.requests[2:]
+    assert len(revalidations) == 2
+    assert all(request['if_none_match'] is not None for request in revalidations)
+    assert sorted(buildings['osmid']) == [1, 245, 250]
+    # 304 --> cached data kept, timestamp refreshed
+    for name, meta in readMeta(tmp_path).items():
+        assert meta['timestamp'] >= timestamps[name]
+
+
+def test_only_stale_tiles_are_refetched(overpass, polygon, tmp_path):
+    fetch(polygon, tmp_path, overpass)
+    name = sorted(readMeta(tmp_path))[0]
+    fp = os.path.join(str(tmp_path), name)
+    with open(fp) as f:
+        meta = json.load(f)
+    meta['timestamp'] -= 60 * 24 * 3600
+    with open(fp, 'w') as f:
+        json.dump(meta, f)
+
+    # Changed data on the server --> the stale tile gets a new ETag and data
+    overpass.version = 2
+    fetch(polygon, tmp_path, overpass)
+    assert len(overpass.requests) == 3
+    assert readMeta(tmp_path)[name]['etag'].endswith('-2"')
+
+
+def test_truncated_response_is_retried(overpass, polygon, tmp_path, monkeypatch):
+    monkeypatch.setattr(osm_tiled_retrieval.time, 'sleep', lambda seconds: None)
+    overpass.truncate = 1
+    buildings = fetch(polygon, tmp_path, overpass)
+    assert len(overpass.requests) == 3
+    assert sorted(buildings['osmid']) == [1, 245, 250]
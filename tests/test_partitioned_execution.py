@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from mfd_interpolation import calculateZROPArray, partitionedZROP
+from partitioned_execution import addZoneSums, partitionSites, treeReduce
+
+TIME_WINDOWS = ['H0', 'H1']
+WEIGHTS = ['RFA', 'AW']
+LATTICE = {'x0': 0, 'y0': 10000, 'cell_size': 250, 'ncols': 40, 'first_id': 1}
+
+
+@pytest.fixture
+def joined():
+    """ Output of joinLayers and joinRMP with missing source and target zones """
+    rng = np.random.default_rng(0)
+    n = 500
+    df = pd.DataFrame({'SITEID': rng.integers(0, 30, n).astype(float), 'YKR_ID': rng.integers(1, 1601, n).astype(float),
+                       'RFA': rng.random(n), 'AW': rng.random(n), 'Seasonal_factor': rng.choice([0.1, 0.9], n)})
+    for tw in TIME_WINDOWS:
+        df[tw + 't'] = rng.random(n)
+        df['RMP %sm' % tw] = rng.random(n)
+    df.loc[rng.random(n) < 0.05, 'SITEID'] = np.nan
+    df.loc[rng.random(n) < 0.05, 'YKR_ID'] = np.nan
+    return df
+
+
+@pytest.mark.parametrize('executor', ['inline', 'process'])
+@pytest.mark.parametrize('partition_by', ['site', 'tile'])
+def test_partitioned_zrop_equals_full_run(joined, executor, partition_by):
+    params = dict(time_windows=TIME_WINDOWS, weight_cols=WEIGHTS, sz_id_col='SITEID', tz_id_col='YKR_ID',
+                  sf_col='Seasonal_factor')
+    expected_ids, expected = calculateZROPArray(joined, **params)
+    zone_ids, zrop = partitionedZROP(joined, executor=executor, partition_by=partition_by, n_partitions=4,
+                                     max_workers=2, lattice=LATTICE, **params)
+    assert np.array_equal(zone_ids, expected_ids)
+    assert np.allclose(zrop, expected)
+
+
+def test_tree_reduction_equals_sequential_sum():
+    rng = np.random.default_rng(1)
+    parts = []
+    for i in range(7):
+        ids = np.unique(rng.integers(0, 50, 20))
+        parts.append((ids, rng.random((len(ids), 3))))
+
+    ids, values = treeReduce(addZoneSums, parts)
+    expected = pd.concat([pd.DataFrame(v, index=i) for i, v in parts]).groupby(level=0).sum()
+    assert np.array_equal(ids, expected.index.values)
+    assert np.allclose(values, expected.values)
+
+
+@pytest.mark.parametrize('by', ['site', 'tile'])
+def test_partitions_cover_all_sites_once(by):
+    rng = np.random.default_rng(2)
+    site_codes = rng.integers(-1, 40, 2000)
+    x, y = rng.uniform(0, 50000, 2000), rng.uniform(0, 50000, 2000)
+    # Subunits without a position are left out of the tile anchors
+    x[rng.random(2000) < 0.1] = np.nan
+    partitions = partitionSites(site_codes, 40, 4, by=by, x=x, y=y)
+
+    sites = np.concatenate(partitions)
+    assert sorted(sites[sites >= 0]) == list(range(40))
+    assert (sites == -1).sum() == 1 and -1 in partitions[0]
+    sizes = [np.isin(site_codes, part[part >= 0]).sum() for part in partitions]
+    assert len(partitions) == 4
+    assert max(sizes) < 2 * min(sizes)
+
+
+@pytest.mark.parametrize('by', ['site', 'tile'])
+def test_partitioned_preparation_equals_full_run(by):
+    gpd = pytest.importorskip('geopandas')
+    shapely = pytest.importorskip('shapely')
+    import disaggregated_physical_surface_layer_prep_for_mfd as dps_prep
+
+    rng = np.random.default_rng(3)
+    n = 300
+    x, y = rng.uniform(0, 20000, n), rng.uniform(0, 20000, n)
+    dpsl = gpd.GeoDataFrame({'SITEID': rng.integers(1, 30, n).astype(float),
+                             'AFT': np.where(rng.random(n) < 0.5, 'residential', None),
+                             'AFT_1': rng.choice([1, 2, 4, 5, 6], n).astype(object), 'AREA': 200.0,
+                             'FA': rng.uniform(100, 900, n)},
+                            geometry=shapely.box(x, y, x + 10, y + 10), crs=3067)
+    dpsl.loc[[5, 6], 'SITEID'] = np.nan
+
+    def ordered(df):
+        return df.assign(minx=df.geometry.bounds.minx).sort_values(['SITEID', 'minx']).reset_index(drop=True)
+
+    expected = ordered(dps_prep.prepareDisaggregatedPhysicalSurface(dpsl.copy()))
+    result = ordered(dps_prep.preparePartitioned(dpsl.copy(), executor='inline', partition_by=by, n_partitions=4))
+    assert len(result) == len(expected)
+    assert np.allclose(result['RFA'].fillna(-1), expected['RFA'].fillna(-1))
+    assert np.allclose(result['SSA'], expected['SSA'])
+    assert (result['AFT'].astype(str) == expected['AFT'].astype(str)).all()
+
+
+def test_tile_partitions_ignore_subunits_without_position():
+    # Sites 0 and 2 in the north tile, 1 and 3 in the south tile, each with one subunit without a position
+    site_codes = np.repeat(np.arange(4), 3)
+    y = np.tile([15000.0, 15000.0, np.nan], 4)
+    y[site_codes % 2 == 1] -= 10000
+    x = np.where(np.isnan(y), np.nan, 500.0)
+    partitions = partitionSites(site_codes, 4, 2, by='tile', x=x, y=y)
+    assert [list(part) for part in partitions] == [[0, 2], [1, 3]]
@@ -0,0 +1,27 @@
+import os
+import shutil
+
+import pipeline_dag
+
+
+def copySources(tmp_path, monkeypatch):
+    src_dir = str(tmp_path / 'src')
+    shutil.copytree(pipeline_dag.SRC_DIR, src_dir, ignore=shutil.ignore_patterns('__pycache__'))
+    monkeypatch.setattr(pipeline_dag, 'SRC_DIR', src_dir)
+    return src_dir
+
+
+def test_code_hash_changes_with_imported_helpers_and_rule_table(tmp_path, monkeypatch):
+    src_dir = copySources(tmp_path, monkeypatch)
+    before = {stage: pipeline_dag.codeHash(stage) for stage in ['osm', 'interpolation', 'cdr']}
+
+    # Helper imported within a function of mfd_interpolation
+    with open(os.path.join(src_dir, 'zrop_incremental.py'), 'a') as f:
+        f.write('\n# changed\n')
+    with open(os.path.join(src_dir, 'osm_building_rules.csv'), 'a') as f:
+        f.write('building,newtag,other,5\n')
+
+    after = {stage: pipeline_dag.codeHash(stage) for stage in ['osm', 'interpolation', 'cdr']}
+    assert after['interpolation'] != before['interpolation']
+    assert after['osm'] != before['osm']
+    assert after['cdr'] == before['cdr']
@@ -0,0 +1,34 @@
+import os
+
+from run_manifest import RunManifest, runKey, writeUnit
+
+
+def writeText(fp, text):
+    with open(fp, 'w') as f:
+        f.write(text)
+
+
+def test_resume_skips_complete_units_and_rewrites_partial_ones(tmp_path):
+    input_fp = str(tmp_path / 'input.csv')
+    writeText(input_fp, 'a,b\n1,2\n')
+    key = runKey([input_fp], {'start_h': 0})
+    manifest_fp = str(tmp_path / 'manifest.json')
+
+    manifest = RunManifest(manifest_fp, key)
+    outputs = {}
+    for unit in ['H0', 'H1']:
+        fp = str(tmp_path / ('%s.txt' % unit))
+        outputs[unit] = fp
+        manifest.record(unit, writeUnit(writeText, [fp], fp=fp, text=unit))
+
+    # A partly written output is not complete any more
+    writeText(outputs['H1'], 'H')
+    resumed = RunManifest(manifest_fp, key)
+    assert resumed.isComplete('H0', [outputs['H0']])
+    assert not resumed.isComplete('H1', [outputs['H1']])
+
+    # Other inputs or parameters start a new manifest
+    assert not RunManifest(manifest_fp, runKey([input_fp], {'start_h': 1})).isComplete('H0', [outputs['H0']])
+    writeText(input_fp, 'a,b\n1,3\n')
+    assert not RunManifest(manifest_fp, runKey([input_fp], {'start_h': 0})).isComplete('H0', [outputs['H0']])
+    assert os.path.exists(manifest_fp)
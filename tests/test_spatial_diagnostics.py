@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('scipy')
+
+from spatial_diagnostics import contiguityWeights, getisOrdGiStar, globalMoransI, localMoransI, rowStandardize
+from ykr_grid import idsToRowCol
+
+LATTICE = {'x0': 0, 'y0': 10000, 'cell_size': 250, 'ncols': 6, 'first_id': 1}
+
+
+@pytest.fixture
+def ids():
+    """ Cells of a 6 x 5 grid with a few cells missing (in random order) """
+    rng = np.random.default_rng(0)
+    ids = np.setdiff1d(np.arange(1, 31), [8, 15, 22])
+    return rng.permutation(ids)
+
+
+def bruteForceWeights(ids, kind):
+    rows, cols = idsToRowCol(ids, LATTICE)
+    dr = np.abs(rows[:, None] - rows[None, :])
+    dc = np.abs(cols[:, None] - cols[None, :])
+    if kind == 'rook':
+        return ((dr + dc) == 1).astype(float)
+    return ((np.maximum(dr, dc) == 1)).astype(float)
+
+
+@pytest.mark.parametrize('kind', ['rook', 'queen'])
+def test_contiguity_equals_brute_force(ids, kind):
+    W = contiguityWeights(ids, LATTICE, kind=kind).toarray()
+    assert np.array_equal(W, bruteForceWeights(ids, kind))
+
+
+def test_no_neighbours_across_column_edges():
+    # Cell 6 is the last cell of the first row and cell 7 the first cell of the second row
+    ids = np.array([6, 7, 12, 13])
+    W = contiguityWeights(ids, LATTICE, kind='queen').toarray()
+    assert W[0, 1] == 0 and W[1, 0] == 0
+    assert W[0, 2] == 1 and W[1, 3] == 1
+    assert W[0, 3] == 0 and W[2, 1] == 0
+
+
+def test_statistics_equal_dense_reference(ids):
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=(len(ids), 3))
+    W = contiguityWeights(ids, LATTICE, kind='queen')
+    Wr = rowStandardize(W)
+
+    D = bruteForceWeights(ids, 'queen')
+    Dr = D / D.sum(axis=1, keepdims=True)
+    n = len(ids)
+    z = values - values.mean(axis=0)
+
+    # Global Moran's I
+    I_ref = n / Dr.sum() * np.einsum('ik,ij,jk->k', z, Dr, z) / (z ** 2).sum(axis=0)
+    assert np.allclose(globalMoransI(Wr, values)['I'], I_ref)
+
+    # Local Moran's I
+    I, zI, lag = localMoransI(Wr, values)
+    assert np.allclose(lag, Dr @ z)
+    assert np.allclose(I, z / (z ** 2).mean(axis=0) * (Dr @ z))
+
+    # Gi* with each cell in its own neighbourhood
+    Ds = D + np.eye(n)
+    G_ref = np.empty_like(values)
+    for k in range(values.shape[1]):
+        x = values[:, k]
+        s = x.std()
+        for i in range(n):
+            wi, s1i = Ds[i].sum(), (Ds[i] ** 2).sum()
+            G_ref[i, k] = (Ds[i] @ x - x.mean() * wi) / (s * np.sqrt((n * s1i - wi ** 2) / (n - 1)))
+    assert np.allclose(getisOrdGiStar(W, values), G_ref)
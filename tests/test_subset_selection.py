@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+gpd = pytest.importorskip('geopandas')
+shapely = pytest.importorskip('shapely')
+
+import mfd_interpolation
+from subset_selection import resolveSubset, subsetZoneIds
+from ykr_grid import cellBounds
+
+from conftest import LATTICE
+BBOX = (1000, 3000, 4000, 6500)
+
+
+def test_subset_results_equal_full_run(mfd_inputs, tmp_path):
+    paths, dps = mfd_inputs
+    kwargs = dict(paths, out_dir=str(tmp_path), start_h=0, end_h=3, write_shapes=False, background_writes=None)
+
+    ids, zrop = mfd_interpolation.main(out_prefix='full', **kwargs)
+    subset_ids, subset_zrop = mfd_interpolation.main(out_prefix='subset', subset={'bbox': BBOX}, **kwargs)
+
+    expected_zones = np.intersect1d(subsetZoneIds(shapely.box(*BBOX), lattice=LATTICE), ids)
+    assert np.array_equal(subset_ids, expected_zones)
+    pos = np.searchsorted(ids, subset_ids)
+    assert np.allclose(subset_zrop, zrop[pos], rtol=1e-12, atol=0)
+
+
+def test_zone_ids_from_lattice_equal_target_zone_layer(tmp_path):
+    all_ids = np.arange(1, 1601)
+    grid = gpd.GeoDataFrame({'YKR_ID': all_ids}, geometry=shapely.box(*cellBounds(all_ids, LATTICE)), crs=3067)
+    tz_fp = str(tmp_path / 'grid.shp')
+    grid.to_file(tz_fp)
+
+    # Areas inside the grid and across its western, southern and eastern edges
+    for area in [shapely.box(*BBOX), shapely.box(-500, -2000, 1100, 900), shapely.box(9000, 400, 12000, 12000),
+                 shapely.Polygon([(2000, 2000), (6000, 2100), (3000, 7000)])]:
+        expected = np.sort(grid.loc[grid.intersects(area) & ~grid.touches(area), 'YKR_ID'].values)
+        assert np.array_equal(np.sort(subsetZoneIds(area, lattice=LATTICE)), expected)
+        assert np.array_equal(np.sort(subsetZoneIds(area, tz_fp=tz_fp)), expected)
+
+
+def test_resolve_subset_sites(mfd_inputs):
+    paths, dps = mfd_inputs
+    area, zone_ids, site_ids = resolveSubset({'bbox': BBOX}, paths['dps_fp'], lattice=LATTICE)
+    assert area.equals(shapely.box(*BBOX))
+    assert set(site_ids) == set(dps.loc[dps['YKR_ID'].isin(zone_ids), 'SITEID'])
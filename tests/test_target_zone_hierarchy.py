@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('scipy')
+
+from target_zone_hierarchy import ZoneHierarchy, gridParentMap, overlayParentMap
+from ykr_grid import cellBounds
+
+# 250 m grid of 10 columns and 9 rows
+LATTICE = {'x0': 380000.0, 'y0': 6700000.0, 'cell_size': 250, 'ncols': 10, 'first_id': 1}
+IDS = np.arange(1, 91)
+
+
+@pytest.fixture
+def zrop():
+    rng = np.random.default_rng(0)
+    # Some cells without results
+    ids = np.sort(rng.choice(IDS, 70, replace=False))
+    return ids, rng.random((len(ids), 3))
+
+
+def test_roll_up_to_1km_equals_groupby(zrop):
+    ids, values = zrop
+    hierarchy = ZoneHierarchy({'1km': gridParentMap(IDS, LATTICE, factor=4)})
+    result = hierarchy.rollUp(ids, values, columns=['H0', 'H1', 'H2'])['1km']
+
+    # 1 km cell of each 250 m cell from its center point
+    minx, miny, maxx, maxy = cellBounds(ids, LATTICE)
+    row = np.floor((LATTICE['y0'] - (miny + maxy) / 2) / 1000).astype(int)
+    col = np.floor(((minx + maxx) / 2 - LATTICE['x0']) / 1000).astype(int)
+    df = pd.DataFrame(values, columns=['H0', 'H1', 'H2'])
+    df['zone_id'] = 1 + row * 3 + col
+    expected = df.groupby('zone_id', as_index=False).sum()
+
+    result = result.loc[result['zone_id'].isin(expected['zone_id'])].reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_area_split_keeps_total(zrop):
+    gpd = pytest.importorskip('geopandas')
+    shapely = pytest.importorskip('shapely')
+    ids, values = zrop
+
+    cells = gpd.GeoDataFrame({'YKR_ID': IDS}, geometry=shapely.box(*cellBounds(IDS, LATTICE)), crs=3067)
+    # Two zones that split the grid along a diagonal line (not on the cell borders)
+    minx, miny, maxx, maxy = cells.total_bounds
+    west = shapely.Polygon([(minx, miny), (minx, maxy), (maxx, maxy)])
+    east = shapely.Polygon([(minx, miny), (maxx, miny), (maxx, maxy)])
+    zones = gpd.GeoDataFrame({'ID': ['west', 'east']}, geometry=[west, east], crs=3067)
+
+    parent_map = overlayParentMap(cells, zones)
+    assert np.allclose(parent_map.groupby('child_id')['weight'].sum(), 1.0)
+    assert (parent_map['weight'] < 1).any()
+
+    result = ZoneHierarchy({'zones': parent_map}).rollUp(ids, values)['zones']
+    assert np.allclose(result[[0, 1, 2]].sum().values, values.sum(axis=0))
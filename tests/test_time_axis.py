@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from time_axis import TimeAxis
+
+
+def hourlyFactors(n=5, seed=0):
+    return np.random.default_rng(seed).random((n, 24))
+
+
+def test_hourly_axis_keeps_hourly_factors_and_labels():
+    axis = TimeAxis.fromHours(0, 23)
+    hourly = hourlyFactors()
+    assert axis.labels('t') == ['H%st' % h for h in range(24)]
+    assert np.allclose(axis.fromHourly(hourly), hourly)
+
+
+def test_sub_hourly_factors_interpolated_between_hour_midpoints():
+    axis = TimeAxis(minutes=15)
+    hourly = hourlyFactors()
+    steps = axis.fromHourly(hourly)
+    assert steps.shape == (5, 96)
+    assert axis.labels()[:3] == ['H0M00', 'H0M15', 'H0M30']
+
+    # Reference: linear interpolation of the hour midpoints, periodic over midnight
+    midpoints = axis.starts + 7.5
+    for row, expected_row in zip(steps, hourly):
+        expected = np.interp(midpoints, np.arange(24) * 60 + 30.0, expected_row, period=24 * 60)
+        assert np.allclose(row, expected)
+
+
+def test_two_hour_steps_are_means_of_their_hours():
+    axis = TimeAxis(minutes=120)
+    hourly = hourlyFactors()
+    assert np.allclose(axis.fromHourly(hourly), hourly.reshape(5, 12, 2).mean(axis=2))
+
+
+def test_steps_of_times():
+    axis = TimeAxis.fromHours(6, 9, minutes=30)
+    assert list(axis.steps([5, 6, 6, 9, 10], [59, 0, 45, 30, 0])) == [-1, 0, 1, 7, -1]
+    with pytest.raises(ValueError):
+        TimeAxis(minutes=7)
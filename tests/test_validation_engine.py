@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from validation_engine import bootstrapMetrics, metricsFromSums, validationMetrics, windowMeans
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    pop = rng.random(60)
+    pop /= pop.sum()
+    values = pop[:, None] * rng.uniform(0.5, 1.5, (60, 6))
+    return pop, values
+
+
+def reference(pop, x):
+    stats = pytest.importorskip('scipy.stats')
+    rmse = np.sqrt(((pop - x) ** 2).mean())
+    return {'r': stats.pearsonr(x, pop)[0], 'rmse': rmse, 'mae': np.abs(pop - x).mean(), 'cv': rmse / pop.sum()}
+
+
+def test_metrics_equal_reference(data):
+    pop, values = data
+    metrics = validationMetrics(pop, values)
+    for j in range(values.shape[1]):
+        for key, value in reference(pop, values[:, j]).items():
+            assert np.isclose(metrics[key][j], value)
+
+
+def test_window_means(data):
+    pop, values = data
+    hours = [0, 1, 2, 3, 4, 5]
+    means = windowMeans(values, hours, [(2, 4), (0, 5), (3, 3)])
+    assert np.allclose(means, np.column_stack([values[:, 2:5].mean(axis=1), values.mean(axis=1), values[:, 3]]))
+
+
+def test_batched_bootstrap_equals_resample_loop(data):
+    pop, values = data
+    n, n_boot = len(pop), 25
+    boot = bootstrapMetrics(pop, values, n_boot=n_boot, batch_size=n_boot, seed=3)
+
+    rng = np.random.default_rng(3)
+    samples = rng.integers(0, n, size=(n_boot, n))
+    for i, sample in enumerate(samples):
+        metrics = validationMetrics(pop[sample], values[sample])
+        for key in metrics:
+            assert np.allclose(boot[key][i], metrics[key])
+
+    # The resamples do not depend on the batch size
+    batched = bootstrapMetrics(pop, values, n_boot=n_boot, batch_size=7, seed=3)
+    for key in boot:
+        assert np.allclose(batched[key], boot[key])
+
+
+def test_cv_is_rmse_relative_to_population_sum():
+    metrics = metricsFromSums(4, 1.0, 2.0, 1.0, 1.0, 0.5, 0.16, 0.8)
+    assert np.isclose(metrics['cv'], np.sqrt(0.04) / 2.0)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from ykr_grid import calibrateLattice, cellBounds, idsToRowCol, pointsToIds, splitByGrid
+
+# A 250 m grid of 8 columns with the upper left corner at (380000, 6700000), first cell 5001
+LATTICE = {'x0': 380000.0, 'y0': 6700000.0, 'cell_size': 250, 'ncols': 8, 'first_id': 5001}
+
+
+def test_calibrate_lattice_on_known_grid():
+    rng = np.random.default_rng(0)
+    # Sample of cells (not starting from the corner) with random points inside each cell
+    ids = rng.choice(np.arange(5001 + 8, 5001 + 48), 12, replace=False)
+    minx, miny, maxx, maxy = cellBounds(ids, LATTICE)
+    x = minx + rng.uniform(1, 249, len(ids))
+    y = miny + rng.uniform(1, 249, len(ids))
+
+    lattice = calibrateLattice(ids, x, y)
+    # The origin is the upper left corner of the sample, the cell ids are the same
+    assert lattice['ncols'] == 8
+    assert np.array_equal(pointsToIds(x, y, lattice), ids)
+    rows, cols = idsToRowCol(ids, lattice)
+    assert np.array_equal(lattice['x0'] + cols * 250, minx)
+    assert np.array_equal(lattice['y0'] - rows * 250, maxy)
+
+
+def test_calibrate_lattice_rejects_single_row():
+    with pytest.raises(ValueError):
+        calibrateLattice([5001, 5002], [380100.0, 380350.0], [6699900.0, 6699900.0])
+
+
+def test_points_outside_lattice_get_no_id():
+    x = np.array([380100.0, 382100.0, 379900.0, 380100.0, 381900.0])
+    y = np.array([6699900.0, 6699900.0, 6699600.0, 6700100.0, 6699400.0])
+    # inside, east of the last column, west of x0, north of y0, last column of row 2
+    assert list(pointsToIds(x, y, LATTICE)) == [5001, -1, -1, -1, 5024]
+
+
+def test_split_by_grid_keeps_area():
+    shapely = pytest.importorskip('shapely')
+    # Polygon across the corner of four cells, a polygon within one cell and one across a column line
+    geoms = np.array([shapely.Polygon([(380200, 6699700), (380310, 6699720), (380290, 6699820), (380190, 6699790)]),
+                      shapely.box(380010, 6699760, 380100, 6699900),
+                      shapely.box(380400, 6699510, 380600, 6699600)])
+    src, ids, parts = splitByGrid(geoms, LATTICE)
+
+    assert sorted(ids[src == 0]) == [5001, 5002, 5009, 5010]
+    assert list(ids[src == 1]) == [5001]
+    assert sorted(ids[src == 2]) == [5010, 5011]
+    for i, geom in enumerate(geoms):
+        assert np.isclose(shapely.area(parts[src == i]).sum(), geom.area)
+
+    # Each part is within its cell
+    cells = shapely.box(*cellBounds(ids, LATTICE))
+    assert shapely.covers(shapely.buffer(cells, 1e-6), parts).all()
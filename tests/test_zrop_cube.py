@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from ykr_grid import rowColToIds
+from zrop_cube import createCube, writeTimeSteps, readTimeStep, readCellProfile, loadCubeResults, readMeta, writeGeoTiff
+
+LATTICE = {'x0': 0.0, 'y0': 10000.0, 'cell_size': 250, 'ncols': 40, 'first_id': 1}
+
+
+def test_append_outside_window_grows_cube(tmp_path):
+    cube_dir = str(tmp_path / 'cube')
+    rng = np.random.default_rng(0)
+
+    # Cube created by a subset run
+    subset_ids = rowColToIds(*np.mgrid[5:8, 10:14].reshape(2, -1), LATTICE)
+    createCube(cube_dir, LATTICE, subset_ids, chunk_size=2)
+    subset_values = rng.random((len(subset_ids), 3))
+    writeTimeSteps(cube_dir, 'subset', ['H0', 'H1', 'H2'], subset_ids, subset_values)
+
+    # Full run of a larger area appended as another scenario
+    full_ids = rowColToIds(*np.mgrid[0:12, 2:20].reshape(2, -1), LATTICE)
+    full_values = rng.random((len(full_ids), 3))
+    writeTimeSteps(cube_dir, 'full', ['H0', 'H1', 'H2'], full_ids, full_values)
+
+    meta = readMeta(cube_dir)
+    assert (meta['row0'], meta['col0'], meta['nrows'], meta['ncols']) == (0, 2, 12, 18)
+
+    ids, values = loadCubeResults(cube_dir, 'full', ['H0', 'H1', 'H2'])
+    assert np.array_equal(ids, np.sort(full_ids))
+    assert np.allclose(values, full_values[np.argsort(full_ids)], atol=1e-6)
+
+    # The values of the subset scenario are kept in the grown window
+    ids, values = loadCubeResults(cube_dir, 'subset', ['H0', 'H1', 'H2'])
+    assert np.array_equal(ids, np.sort(subset_ids))
+    assert np.allclose(values, subset_values[np.argsort(subset_ids)], atol=1e-6)
+    assert np.allclose(readCellProfile(cube_dir, 'subset', subset_ids[0]).values, subset_values[0], atol=1e-6)
+    assert np.isnan(readTimeStep(cube_dir, 'subset', 'H2')).sum() == 12 * 18 - len(subset_ids)
+
+
+def test_geotiff_bands_equal_cube_time_steps(tmp_path):
+    rasterio = pytest.importorskip('rasterio')
+    cube_dir = str(tmp_path / 'cube')
+    ids = rowColToIds(*np.mgrid[3:6, 4:9].reshape(2, -1), LATTICE)
+    createCube(cube_dir, LATTICE, ids)
+    writeTimeSteps(cube_dir, 'a', ['H0', 'H1'], ids, np.arange(len(ids) * 2).reshape(-1, 2))
+
+    fp = str(tmp_path / 'a.tif')
+    writeGeoTiff(cube_dir, 'a', fp)
+    with rasterio.open(fp) as src:
+        assert src.count == 2
+        assert np.array_equal(src.read(2), readTimeStep(cube_dir, 'a', 'H1'), equal_nan=True)
@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from mfd_interpolation import calculateZROPArray, joinRMP
+from zrop_incremental import IncrementalZROP
+
+TIME_WINDOWS = ['H0', 'H1', 'H2']
+WEIGHTS = ['RFA', 'AW']
+
+
+def layers(seed=0, n=400, n_sites=20):
+    """ Subunits joined with time use (with missing source and target zones) and the CDR counts of the sites """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'SITEID': rng.integers(0, n_sites, n).astype(float), 'YKR_ID': rng.integers(100, 180, n).astype(float),
+                       'RFA': rng.random(n), 'AW': rng.random(n), 'Seasonal_factor': rng.choice([0.1, 0.9], n)})
+    for tw in TIME_WINDOWS:
+        df[tw + 't'] = rng.random(n)
+    df.loc[rng.random(n) < 0.05, 'SITEID'] = np.nan
+    df.loc[rng.random(n) < 0.05, 'YKR_ID'] = np.nan
+
+    cdr = pd.DataFrame({'SITEID': np.arange(n_sites, dtype=float)})
+    for tw in TIME_WINDOWS:
+        cdr[tw + 'm'] = rng.integers(0, 100, n_sites).astype(float)
+    return df, cdr
+
+
+def fullZROP(df, cdr):
+    joined = joinRMP(df, cdr, TIME_WINDOWS, 'SITEID', 'SITEID')
+    return calculateZROPArray(joined, TIME_WINDOWS, WEIGHTS, 'SITEID', 'YKR_ID', 'Seasonal_factor')
+
+
+def test_incremental_updates_equal_full_run(tmp_path):
+    df, cdr = layers()
+    state = IncrementalZROP.fromLayers(df, TIME_WINDOWS, WEIGHTS, 'SITEID', 'YKR_ID', 'Seasonal_factor', key='k')
+    state.setCounts(cdr)
+    zone_ids, zrop = state.zrop()
+    expected_ids, expected = fullZROP(df, cdr)
+    assert np.array_equal(zone_ids, expected_ids)
+    assert np.allclose(zrop, expected)
+
+    # Corrected counts of some sites, a missing value and a site dropped from the data
+    new_cdr = cdr.copy()
+    new_cdr.loc[[2, 5], 'H1m'] *= 1.5
+    new_cdr.loc[7, 'H0m'] = np.nan
+    new_cdr = new_cdr.drop(index=11)
+
+    state.save(str(tmp_path))
+    state = IncrementalZROP.load(str(tmp_path), key='k')
+    changed_sites, changed_zones = state.update(new_cdr)
+    assert changed_sites == 4
+
+    zone_ids, zrop = state.zrop()
+    expected_ids, expected = fullZROP(df, new_cdr)
+    assert np.array_equal(zone_ids, expected_ids)
+    assert np.allclose(zrop, expected)
+
+
+def test_state_of_other_key_is_not_loaded(tmp_path):
+    df, cdr = layers()
+    state = IncrementalZROP.fromLayers(df, TIME_WINDOWS, WEIGHTS, 'SITEID', 'YKR_ID', 'Seasonal_factor', key='k')
+    state.setCounts(cdr)
+    state.save(str(tmp_path))
+    assert IncrementalZROP.load(str(tmp_path), key='other') is None
+
+
+def test_state_with_string_site_ids_loads_without_pickle(tmp_path):
+    df, cdr = layers()
+    df['SITEID'] = df['SITEID'].map(lambda site: np.nan if np.isnan(site) else 'BS%03d' % site)
+    cdr['SITEID'] = cdr['SITEID'].map(lambda site: 'BS%03d' % site)
+    state = IncrementalZROP.fromLayers(df, TIME_WINDOWS, WEIGHTS, 'SITEID', 'YKR_ID', 'Seasonal_factor', key='k')
+    state.setCounts(cdr)
+    state.save(str(tmp_path))
+
+    with np.load(str(tmp_path / 'zrop_state.npz')) as arrays:
+        assert arrays['site_ids'].dtype.kind == 'U'
+    loaded = IncrementalZROP.load(str(tmp_path), key='k')
+    assert np.allclose(loaded.zrop()[1], state.zrop()[1])
+
+    new_cdr = cdr.copy()
+    new_cdr.loc[3, 'H2m'] *= 2
+    loaded.update(new_cdr)
+    assert np.allclose(loaded.zrop()[1], fullZROP(df, new_cdr)[1])
+
+
+def test_updates_of_main_reuse_input_hashes(mfd_inputs, tmp_path):
+    import mfd_interpolation
+    paths, dps = mfd_inputs
+    incremental_dir = str(tmp_path / 'incremental')
+    kwargs = dict(paths, out_dir=str(tmp_path), start_h=0, end_h=3, write_shapes=False, background_writes=None)
+    mfd_interpolation.main(incremental_dir=incremental_dir, **kwargs)
+    assert os.path.exists(os.path.join(incremental_dir, 'file_hashes.json'))
+
+    cdr = pd.read_csv(paths['cdr_fp'])
+    cdr.loc[[2, 9], 'H1m'] *= 1.5
+    cdr_fp = str(tmp_path / 'cdr2.csv')
+    cdr.to_csv(cdr_fp, index=False)
+    kwargs['cdr_fp'] = cdr_fp
+
+    ids, zrop = mfd_interpolation.main(incremental_dir=incremental_dir, **kwargs)
+    state = IncrementalZROP.load(incremental_dir)
+    assert state.updates == 1
+    expected_ids, expected = mfd_interpolation.main(**kwargs)
+    assert np.array_equal(ids, expected_ids)
+    assert np.allclose(zrop, expected)